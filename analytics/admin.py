@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import KPIAgentDaily
+from .models import KPIAgentDaily, KPITenantMonthly, KPITenantWeekly, KPIAgentMonthly
 
 
 @admin.register(KPIAgentDaily)
@@ -7,3 +7,22 @@ class KPIAgentDailyAdmin(admin.ModelAdmin):
     list_display = ['id', 'agent', 'kpi_date', 'leads_captured', 'leads_converted', 'conversion_rate', 'revenue_amount', 'bonus_amount', 'net_profit']
     list_filter = ['tenant', 'kpi_date']
     search_fields = ['agent__agent_code']
+
+
+@admin.register(KPITenantMonthly)
+class KPITenantMonthlyAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tenant', 'month', 'leads_captured', 'leads_converted', 'revenue_amount', 'bonus_amount', 'net_profit']
+    list_filter = ['tenant', 'month']
+
+
+@admin.register(KPITenantWeekly)
+class KPITenantWeeklyAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tenant', 'week_start', 'leads_captured', 'leads_converted', 'revenue_amount', 'bonus_amount', 'net_profit']
+    list_filter = ['tenant', 'week_start']
+
+
+@admin.register(KPIAgentMonthly)
+class KPIAgentMonthlyAdmin(admin.ModelAdmin):
+    list_display = ['id', 'agent', 'month', 'leads_captured', 'leads_converted', 'revenue_amount', 'bonus_amount', 'net_profit']
+    list_filter = ['tenant', 'month']
+    search_fields = ['agent__agent_code']
@@ -0,0 +1,76 @@
+"""
+Per-tenant response cache for the analytics endpoints.
+
+Every cached entry key embeds the tenant's current cache version; writes
+that affect a tenant's numbers bump that version (see analytics.signals)
+so old entries are simply never read again and expire on their own.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+
+def _version_key(tenant_id):
+    return f'analytics:version:{tenant_id}'
+
+
+def get_tenant_cache_version(tenant_id):
+    key = _version_key(tenant_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_tenant_cache(tenant_id):
+    """
+    Drop every cached analytics response of the tenant once the current
+    transaction commits; bumping earlier would let a concurrent request
+    cache pre-commit numbers under the new version.
+    """
+    if tenant_id:
+        transaction.on_commit(lambda: cache.set(_version_key(tenant_id), time.time_ns(), None))
+
+
+def cached_response(team_scoped=False, timeout=None):
+    """
+    Cache a function view's Response data per tenant.
+
+    The key covers the endpoint, tenant (and its cache version), the
+    requesting user for team-scoped endpoints, URL kwargs, query params and
+    today's date, so "this month"/"last 7 days" windows roll over at midnight.
+    Place it below @api_view/@permission_classes so request.user is set.
+    Requests without a tenant are not cached.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            tenant_id = request.user.tenant_id
+            if not tenant_id:
+                return view(request, *args, **kwargs)
+
+            params = sorted(request.query_params.lists())
+            digest = hashlib.sha256(repr((params, sorted(kwargs.items()))).encode()).hexdigest()[:16]
+            scope = f'user{request.user.id}' if team_scoped else 'tenant'
+            key = ':'.join([
+                'analytics', str(tenant_id), str(get_tenant_cache_version(tenant_id)),
+                view.__name__, scope, digest, timezone.now().date().isoformat(),
+            ])
+
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, timeout or settings.ANALYTICS_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
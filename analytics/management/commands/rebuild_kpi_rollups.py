@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the monthly/weekly KPI rollup tables from KPIAgentDaily.\n'
+        'Run after KPIAgentDaily rows are written directly (seed/populate, manual fixes).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant', type=int,
+            help='Only rebuild rollups of this tenant id',
+        )
+
+    def handle(self, *args, **options):
+        from analytics.services import rebuild_kpi_rollups
+
+        written = rebuild_kpi_rollups(tenant_id=options['tenant'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} KPI rollup rows'))
@@ -0,0 +1,54 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posightful.management import parse_date
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild KPIAgentDaily for a date range from leads, sales and the bonus ledger,\n'
+        'in date chunks (one transaction each), then the rollups of the range.\n'
+        'Safe to re-run after an interruption (default: the last 7 days).'
+    )
+    # Reported as '<summary> N KPI daily rows from ... to ...'
+    summary = 'Rebuilt'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant', type=int,
+            help='Only rebuild this tenant id',
+        )
+        parser.add_argument(
+            '--since', type=str,
+            help='First day to rebuild (YYYY-MM-DD, default: 6 days before --until)',
+        )
+        parser.add_argument(
+            '--until', type=str,
+            help='Last day to rebuild (YYYY-MM-DD, default: today)',
+        )
+        parser.add_argument(
+            '--chunk-days', type=int, default=31,
+            help='Days recomputed per transaction (default: 31)',
+        )
+
+    def handle(self, *args, **options):
+        from django.utils import timezone
+        from analytics.services import rebuild_kpis
+
+        until = parse_date(options['until']) if options['until'] else timezone.now().date()
+        since = parse_date(options['since']) if options['since'] else until - datetime.timedelta(days=6)
+        if since > until:
+            raise CommandError('--since must not be after --until')
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be at least 1')
+
+        def report(start, end, rows):
+            self.stdout.write(f'  {start} .. {end}: {rows} rows')
+
+        written = rebuild_kpis(
+            since, until, tenant_id=options['tenant'],
+            chunk_days=options['chunk_days'], progress=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.summary} {written} KPI daily rows from {since} to {until}'))
@@ -0,0 +1,9 @@
+from .rebuild_kpis import Command as RebuildKPIsCommand
+
+
+class Command(RebuildKPIsCommand):
+    help = (
+        'Nightly drift correction for the incrementally maintained KPIs: rebuild_kpis\n'
+        'over the last 7 days unless --since/--until are given.'
+    )
+    summary = 'Reconciled'
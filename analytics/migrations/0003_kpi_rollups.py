@@ -0,0 +1,106 @@
+# Generated by Django 5.0.14 on 2026-10-18 00:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncMonth, TruncWeek
+
+
+def backfill_rollups(apps, schema_editor):
+    KPIAgentDaily = apps.get_model('analytics', 'KPIAgentDaily')
+    totals = {
+        'leads_captured': Sum('leads_captured'),
+        'leads_converted': Sum('leads_converted'),
+        'revenue_amount': Sum('revenue_amount'),
+        'bonus_amount': Sum('bonus_amount'),
+        'net_profit': Sum('net_profit'),
+        'conversion_rate_sum': Sum('conversion_rate'),
+        'conversion_rate_days': Count('conversion_rate'),
+    }
+    plans = [
+        ('KPITenantMonthly', TruncMonth('kpi_date'), 'month', ['tenant_id']),
+        ('KPITenantWeekly', TruncWeek('kpi_date'), 'week_start', ['tenant_id']),
+        ('KPIAgentMonthly', TruncMonth('kpi_date'), 'month', ['tenant_id', 'agent_id']),
+    ]
+    for model_name, period, period_field, keys in plans:
+        model = apps.get_model('analytics', model_name)
+        rows = KPIAgentDaily.objects.annotate(period=period).values(*keys, 'period').annotate(**totals)
+        model.objects.bulk_create([
+            model(**{key: row[key] for key in keys}, **{period_field: row['period']},
+                  **{field: row[field] or 0 for field in totals})
+            for row in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_initial'),
+        ('tenancy', '0004_seed_subscription_plans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KPIAgentMonthly',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('leads_captured', models.IntegerField(default=0)),
+                ('leads_converted', models.IntegerField(default=0)),
+                ('revenue_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('bonus_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('net_profit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('conversion_rate_sum', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('conversion_rate_days', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_kpis', to='tenancy.agent')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agent_monthly_kpis', to='tenancy.tenant')),
+            ],
+            options={
+                'db_table': 'kpi_agent_monthly',
+                'indexes': [models.Index(fields=['tenant', 'month'], name='kpi_agent_m_tenant__f820b1_idx')],
+                'unique_together': {('tenant', 'agent', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KPITenantMonthly',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('leads_captured', models.IntegerField(default=0)),
+                ('leads_converted', models.IntegerField(default=0)),
+                ('revenue_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('bonus_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('net_profit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('conversion_rate_sum', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('conversion_rate_days', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_kpis', to='tenancy.tenant')),
+            ],
+            options={
+                'db_table': 'kpi_tenant_monthly',
+                'unique_together': {('tenant', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KPITenantWeekly',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('leads_captured', models.IntegerField(default=0)),
+                ('leads_converted', models.IntegerField(default=0)),
+                ('revenue_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('bonus_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('net_profit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('conversion_rate_sum', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('conversion_rate_days', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('week_start', models.DateField(help_text='Monday of the week')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_kpis', to='tenancy.tenant')),
+            ],
+            options={
+                'db_table': 'kpi_tenant_weekly',
+                'unique_together': {('tenant', 'week_start')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
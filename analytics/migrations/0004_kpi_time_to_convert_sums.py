@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-18 00:58
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_kpi_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kpiagentdaily',
+            name='time_to_convert_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='kpiagentdaily',
+            name='time_to_convert_total',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import datetime
+
 from django.db import models
 
 
@@ -13,6 +15,10 @@ class KPIAgentDaily(models.Model):
     bonus_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
     net_profit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
     avg_time_to_convert = models.DurationField(blank=True, null=True)
+    # Running sum/count of lead-to-sale durations behind avg_time_to_convert,
+    # so the average stays current with increments instead of rescans
+    time_to_convert_total = models.DurationField(default=datetime.timedelta(0))
+    time_to_convert_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
 
     class Meta:
@@ -25,3 +31,70 @@ class KPIAgentDaily(models.Model):
 
     def __str__(self):
         return f"Agent {self.agent_id} – {self.kpi_date} – {self.leads_captured} leads"
+
+
+class KPIRollupBase(models.Model):
+    """
+    Additive KPIAgentDaily totals over a longer period, kept in step by
+    analytics.services.apply_kpi_deltas and rebuilt by rebuild_kpi_rollups.
+    """
+    id = models.BigAutoField(primary_key=True)
+    leads_captured = models.IntegerField(default=0)
+    leads_converted = models.IntegerField(default=0)
+    revenue_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    bonus_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    net_profit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    # Sum and count of the non-null daily conversion rates, so the average
+    # daily rate can be derived without rescanning KPIAgentDaily
+    conversion_rate_sum = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    conversion_rate_days = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def avg_conversion_rate(self):
+        if not self.conversion_rate_days:
+            return None
+        return self.conversion_rate_sum / self.conversion_rate_days
+
+
+class KPITenantMonthly(KPIRollupBase):
+    tenant = models.ForeignKey('tenancy.Tenant', on_delete=models.CASCADE, related_name='monthly_kpis')
+    month = models.DateField(help_text='First day of the month')
+
+    class Meta:
+        db_table = 'kpi_tenant_monthly'
+        unique_together = [['tenant', 'month']]
+
+    def __str__(self):
+        return f"Tenant {self.tenant_id} – {self.month:%Y-%m}"
+
+
+class KPITenantWeekly(KPIRollupBase):
+    tenant = models.ForeignKey('tenancy.Tenant', on_delete=models.CASCADE, related_name='weekly_kpis')
+    week_start = models.DateField(help_text='Monday of the week')
+
+    class Meta:
+        db_table = 'kpi_tenant_weekly'
+        unique_together = [['tenant', 'week_start']]
+
+    def __str__(self):
+        return f"Tenant {self.tenant_id} – week of {self.week_start}"
+
+
+class KPIAgentMonthly(KPIRollupBase):
+    tenant = models.ForeignKey('tenancy.Tenant', on_delete=models.CASCADE, related_name='agent_monthly_kpis')
+    agent = models.ForeignKey('tenancy.Agent', on_delete=models.CASCADE, related_name='monthly_kpis')
+    month = models.DateField(help_text='First day of the month')
+
+    class Meta:
+        db_table = 'kpi_agent_monthly'
+        unique_together = [['tenant', 'agent', 'month']]
+        indexes = [
+            models.Index(fields=['tenant', 'month']),
+        ]
+
+    def __str__(self):
+        return f"Agent {self.agent_id} – {self.month:%Y-%m}"
@@ -0,0 +1,381 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum, Count
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+
+from .cache import invalidate_tenant_cache
+from .models import KPIAgentDaily, KPITenantMonthly, KPITenantWeekly, KPIAgentMonthly
+
+ROLLUP_FIELDS = [
+    'leads_captured', 'leads_converted', 'revenue_amount', 'bonus_amount',
+    'net_profit', 'conversion_rate_sum', 'conversion_rate_days',
+]
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+
+# Postgres advisory lock (KPI_LOCK_ID, tenant_id): apply_kpi_deltas holds it
+# shared, recomputations from source rows hold it exclusively, so a
+# recomputation never misses an increment in flight nor is overwritten by one
+KPI_LOCK_ID = 7_301_022
+
+
+def _lock_tenant_kpis(tenant_ids, shared=False):
+    """Take the tenants' KPI locks (in id order) until the transaction ends."""
+    function = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+    with connection.cursor() as cursor:
+        for tenant_id in sorted(tenant_ids):
+            cursor.execute(f'SELECT {function}(%s, %s)', [KPI_LOCK_ID, tenant_id])
+
+
+def new_kpi_deltas():
+    """Accumulator for apply_kpi_deltas: deltas[(tenant_id, agent_id, kpi_date)][field] += value."""
+    return defaultdict(lambda: defaultdict(int))
+
+
+def add_lead_deltas(deltas, lead, sign=1):
+    """Count a captured lead (sign=-1 to uncount it) on its agent's creation day."""
+    if lead.agent_id and lead.created_at:
+        deltas[(lead.tenant_id, lead.agent_id, lead.created_at.date())]['leads_captured'] += sign
+
+
+def add_sale_deltas(deltas, sale, bonus_amount, sign=1):
+    """
+    Count a completed sale (sign=-1 when it stops being completed) on its
+    agent's sale day: conversion, revenue, bonus, net profit and, when the
+    sale has a lead, its lead-to-sale duration. The sale's lead should be
+    loaded (select_related) when many sales are counted.
+    """
+    kpi = deltas[(sale.tenant_id, sale.agent_id, sale.sold_at.date())]
+    kpi['leads_converted'] += sign
+    kpi['revenue_amount'] += sign * sale.amount
+    kpi['bonus_amount'] += sign * bonus_amount
+    kpi['net_profit'] += sign * (sale.amount - bonus_amount)
+    if sale.lead_id and sale.lead.created_at:
+        duration = sale.sold_at - sale.lead.created_at
+        kpi['time_to_convert_total'] = kpi.get('time_to_convert_total', datetime.timedelta(0)) + sign * duration
+        kpi['time_to_convert_count'] += sign
+
+
+def kpi_conversion_rate(leads_converted, leads_captured):
+    """
+    Daily conversion rate in percent, as the seed/populate commands compute it.
+    Rounds half up like Postgres ROUND(), which computes the same value in
+    the daily upsert.
+    """
+    return (Decimal(leads_converted * 100) / max(leads_captured, 1)).quantize(
+        Decimal('0.01'), rounding=ROUND_HALF_UP,
+    )
+
+
+def apply_kpi_deltas(deltas):
+    """
+    Apply aggregated KPIAgentDaily increments and the matching rollup increments.
+
+    `deltas` maps (tenant_id, agent_id, kpi_date) to {field: increment}.
+    Every row is written with one INSERT ... ON CONFLICT DO UPDATE that adds
+    the increments to whatever is stored when the statement runs, so
+    concurrent writers for the same agent and day neither lose updates nor
+    collide on the unique key. Daily rows have their derived conversion_rate
+    and avg_time_to_convert refreshed in the same statement. The daily
+    deltas, including the change in the day's conversion rate, are then
+    summed per tenant month, tenant week and agent month and applied the
+    same way. Rows are written in key order so that two transactions
+    touching the same rows cannot deadlock.
+    """
+    tenant_months = new_kpi_deltas()
+    tenant_weeks = new_kpi_deltas()
+    agent_months = new_kpi_deltas()
+
+    with transaction.atomic():
+        _lock_tenant_kpis({key[0] for key in deltas}, shared=True)
+        for (tenant_id, agent_id, kpi_date), values in sorted(deltas.items()):
+            values = dict(values)
+            values.update(_apply_daily({
+                'tenant_id': tenant_id, 'agent_id': agent_id, 'kpi_date': kpi_date,
+            }, values))
+            for field, value in values.items():
+                if field not in ROLLUP_FIELDS:
+                    continue
+                tenant_months[(tenant_id, month_start(kpi_date))][field] += value
+                tenant_weeks[(tenant_id, week_start(kpi_date))][field] += value
+                agent_months[(tenant_id, agent_id, month_start(kpi_date))][field] += value
+
+        for (tenant_id, month), values in sorted(tenant_months.items()):
+            _upsert_increment(KPITenantMonthly, {'tenant_id': tenant_id, 'month': month}, values)
+        for (tenant_id, week), values in sorted(tenant_weeks.items()):
+            _upsert_increment(KPITenantWeekly, {'tenant_id': tenant_id, 'week_start': week}, values)
+        for (tenant_id, agent_id, month), values in sorted(agent_months.items()):
+            _upsert_increment(KPIAgentMonthly, {
+                'tenant_id': tenant_id, 'agent_id': agent_id, 'month': month,
+            }, values)
+
+    for tenant_id in {key[0] for key in deltas}:
+        invalidate_tenant_cache(tenant_id)
+
+
+def _new_daily(column):
+    return f'(kpi_agent_daily.{column} + EXCLUDED.{column})'
+
+
+# Derived KPIAgentDaily columns, recomputed from the incremented counters
+# (SET expressions see the row as it was before the update)
+DAILY_DERIVED_SQL = {
+    'conversion_rate': (
+        f"ROUND({_new_daily('leads_converted')} * 100.0"
+        f" / GREATEST({_new_daily('leads_captured')}, 1), 2)"
+    ),
+    'avg_time_to_convert': (
+        f"CASE WHEN {_new_daily('time_to_convert_count')} > 0"
+        f" THEN {_new_daily('time_to_convert_total')} / {_new_daily('time_to_convert_count')} END"
+    ),
+}
+
+
+def _apply_daily(lookup, values):
+    """
+    Upsert one KPIAgentDaily increment and refresh its derived columns.
+    Returns the rollup deltas of the day's conversion rate.
+    """
+    converted = values.get('leads_converted', 0)
+    captured = values.get('leads_captured', 0)
+    total = values.get('time_to_convert_total', datetime.timedelta(0))
+    count = values.get('time_to_convert_count', 0)
+    inserted, row = _upsert_increment(
+        KPIAgentDaily, lookup, values,
+        initial={
+            'conversion_rate': kpi_conversion_rate(converted, captured),
+            'avg_time_to_convert': total / count if count > 0 else None,
+        },
+        derived=DAILY_DERIVED_SQL,
+        returning=('leads_converted', 'leads_captured', 'conversion_rate'),
+    )
+
+    # conversion_rate is a function of the counters, so the rate before
+    # this statement follows from the returned counters minus the increment
+    if inserted:
+        old_rate = None
+    else:
+        old_rate = kpi_conversion_rate(row['leads_converted'] - converted, row['leads_captured'] - captured)
+    return {
+        'conversion_rate_sum': row['conversion_rate'] - (old_rate or 0),
+        'conversion_rate_days': 0 if old_rate is not None else 1,
+    }
+
+
+def _upsert_increment(model, lookup, values, initial=None, derived=None, returning=()):
+    """
+    Add `values` to the row of `model` identified by the unique `lookup`,
+    inserting it (with `values` and `initial`) if missing, in a single
+    INSERT ... ON CONFLICT DO UPDATE. `derived` maps further fields to SQL
+    expressions assigned on update; auto_now fields are refreshed.
+
+    Returns (inserted, {field: value}) for the `returning` fields as stored
+    after the statement.
+    """
+    quote = connection.ops.quote_name
+    meta = model._meta
+    table = quote(meta.db_table)
+    fields = [field for field in meta.concrete_fields if not field.primary_key]
+    obj = model(**lookup, **values, **(initial or {}))
+    params = [field.get_db_prep_save(field.pre_save(obj, add=True), connection) for field in fields]
+
+    def column(name):
+        return quote(meta.get_field(name).column)
+
+    assignments = [f'{column(name)} = {table}.{column(name)} + EXCLUDED.{column(name)}' for name in values]
+    assignments += [
+        f'{quote(field.column)} = EXCLUDED.{quote(field.column)}'
+        for field in fields if getattr(field, 'auto_now', False)
+    ]
+    assignments += [f'{column(name)} = {expr}' for name, expr in (derived or {}).items()]
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quote(field.column) for field in fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(fields))}) '
+        f'ON CONFLICT ({", ".join(column(name) for name in lookup)}) '
+        f'DO UPDATE SET {", ".join(assignments)} '
+        # xmax is 0 only on a freshly inserted row version
+        f'RETURNING (xmax = 0){"".join(", " + column(name) for name in returning)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        inserted, *stored = cursor.fetchone()
+    return inserted, dict(zip(returning, stored))
+
+
+def rebuild_kpi_rollups(tenant_id=None, date_from=None, date_to=None):
+    """
+    Recompute the monthly/weekly rollup tables from KPIAgentDaily.
+
+    Needed after KPIAgentDaily is written outside apply_kpi_deltas
+    (rebuild_kpis, seed commands, manual fixes). With date_from and date_to
+    only the months and weeks overlapping that range are recomputed. Runs
+    under the tenants' exclusive KPI lock, so concurrent increments wait
+    instead of being lost. Returns the number of rollup rows written.
+    """
+    from tenancy.models import Tenant
+
+    daily = KPIAgentDaily.objects.all()
+    if tenant_id:
+        daily = daily.filter(tenant_id=tenant_id)
+
+    totals = {
+        'leads_captured': Sum('leads_captured'),
+        'leads_converted': Sum('leads_converted'),
+        'revenue_amount': Sum('revenue_amount'),
+        'bonus_amount': Sum('bonus_amount'),
+        'net_profit': Sum('net_profit'),
+        'conversion_rate_sum': Sum('conversion_rate'),
+        'conversion_rate_days': Count('conversion_rate'),
+    }
+    # (model, truncation, period field, period start, days that reach the next period, keys)
+    plans = [
+        (KPITenantMonthly, TruncMonth('kpi_date'), 'month', month_start, 31, ['tenant_id']),
+        (KPITenantWeekly, TruncWeek('kpi_date'), 'week_start', week_start, 7, ['tenant_id']),
+        (KPIAgentMonthly, TruncMonth('kpi_date'), 'month', month_start, 31, ['tenant_id', 'agent_id']),
+    ]
+
+    written = 0
+    with transaction.atomic():
+        tenant_ids = [tenant_id] if tenant_id else list(Tenant.objects.values_list('id', flat=True))
+        _lock_tenant_kpis(tenant_ids)
+
+        for model, period, period_field, period_start, period_days, keys in plans:
+            existing = model.objects.all()
+            rows = daily
+            if tenant_id:
+                existing = existing.filter(tenant_id=tenant_id)
+            if date_from is not None:
+                first = period_start(date_from)
+                after = period_start(period_start(date_to) + datetime.timedelta(days=period_days))
+                existing = existing.filter(**{f'{period_field}__gte': first, f'{period_field}__lt': after})
+                rows = rows.filter(kpi_date__gte=first, kpi_date__lt=after)
+            existing.delete()
+
+            rows = rows.annotate(period=period).values(*keys, 'period').annotate(**totals)
+            objs = [
+                model(**{key: row[key] for key in keys}, **{period_field: row['period']},
+                      **{field: row[field] or 0 for field in totals})
+                for row in rows
+            ]
+            model.objects.bulk_create(objs, batch_size=1000)
+            written += len(objs)
+
+        for tid in tenant_ids:
+            invalidate_tenant_cache(tid)
+    return written
+
+
+KPI_SOURCE_FIELDS = [
+    'leads_captured', 'leads_converted', 'revenue_amount', 'bonus_amount', 'net_profit',
+    'conversion_rate', 'avg_time_to_convert', 'time_to_convert_total', 'time_to_convert_count',
+]
+
+
+def rebuild_kpis(date_from, date_to, tenant_id=None, chunk_days=31, progress=None):
+    """
+    Recompute KPIAgentDaily for [date_from, date_to] from the source tables.
+
+    leads_captured comes from Lead.created_at; conversions, revenue and
+    time-to-convert from completed sales on their sold_at day; bonuses from
+    their BonusLedger entries. The range is processed in chunks of
+    chunk_days, each in its own transaction: two grouped queries, one
+    INSERT ... ON CONFLICT DO UPDATE on (tenant, agent, kpi_date) and a
+    delete of the chunk's rows that no longer have any activity, so memory
+    stays bounded by the chunk and an interrupted run can be repeated.
+    Each chunk holds the exclusive KPI lock of the tenants it recomputes.
+    The rollup months and weeks overlapping the range are recomputed at the
+    end.
+
+    progress, if given, is called as progress(chunk_start, chunk_end, rows).
+    Returns the number of daily rows written.
+    """
+    written = 0
+    start = date_from
+    while start <= date_to:
+        end = min(start + datetime.timedelta(days=chunk_days - 1), date_to)
+        with transaction.atomic():
+            count = _rebuild_kpi_chunk(start, end, tenant_id)
+        written += count
+        if progress:
+            progress(start, end, count)
+        start = end + datetime.timedelta(days=1)
+
+    rebuild_kpi_rollups(tenant_id=tenant_id, date_from=date_from, date_to=date_to)
+    return written
+
+
+def _rebuild_kpi_chunk(date_from, date_to, tenant_id):
+    from conversions.models import Sale
+    from leads.models import Lead
+    from tenancy.models import Tenant
+
+    _lock_tenant_kpis([tenant_id] if tenant_id else Tenant.objects.values_list('id', flat=True))
+
+    leads = Lead.objects.filter(
+        agent__isnull=False, created_at__date__gte=date_from, created_at__date__lte=date_to,
+    )
+    sales = Sale.objects.filter(
+        status='completed', sold_at__date__gte=date_from, sold_at__date__lte=date_to,
+    )
+    daily = KPIAgentDaily.objects.filter(kpi_date__gte=date_from, kpi_date__lte=date_to)
+    if tenant_id:
+        leads = leads.filter(tenant_id=tenant_id)
+        sales = sales.filter(tenant_id=tenant_id)
+        daily = daily.filter(tenant_id=tenant_id)
+
+    rows = defaultdict(lambda: {
+        'leads_captured': 0, 'leads_converted': 0,
+        'revenue_amount': Decimal('0'), 'bonus_amount': Decimal('0'),
+        'time_to_convert_total': datetime.timedelta(0), 'time_to_convert_count': 0,
+    })
+    lead_counts = leads.annotate(day=TruncDate('created_at')).values(
+        'tenant_id', 'agent_id', 'day',
+    ).annotate(n=Count('id')).order_by()
+    for row in lead_counts:
+        rows[(row['tenant_id'], row['agent_id'], row['day'])]['leads_captured'] = row['n']
+
+    with_lead = Q(lead__created_at__isnull=False)
+    sale_totals = sales.annotate(day=TruncDate('sold_at')).values(
+        'tenant_id', 'agent_id', 'day',
+    ).annotate(
+        n=Count('id'),
+        revenue=Sum('amount'),
+        bonus=Sum('bonus_ledger__bonus_amount'),
+        convert_total=Sum(F('sold_at') - F('lead__created_at'), filter=with_lead),
+        convert_count=Count('id', filter=with_lead),
+    ).order_by()
+    for row in sale_totals:
+        kpi = rows[(row['tenant_id'], row['agent_id'], row['day'])]
+        kpi['leads_converted'] = row['n']
+        kpi['revenue_amount'] = row['revenue'] or Decimal('0')
+        kpi['bonus_amount'] = row['bonus'] or Decimal('0')
+        kpi['time_to_convert_total'] = row['convert_total'] or datetime.timedelta(0)
+        kpi['time_to_convert_count'] = row['convert_count']
+
+    objs = []
+    for (row_tenant_id, agent_id, day), kpi in rows.items():
+        count = kpi['time_to_convert_count']
+        objs.append(KPIAgentDaily(
+            tenant_id=row_tenant_id, agent_id=agent_id, kpi_date=day, **kpi,
+            net_profit=kpi['revenue_amount'] - kpi['bonus_amount'],
+            conversion_rate=kpi_conversion_rate(kpi['leads_converted'], kpi['leads_captured']),
+            avg_time_to_convert=kpi['time_to_convert_total'] / count if count else None,
+        ))
+
+    KPIAgentDaily.objects.bulk_create(
+        objs, batch_size=1000, update_conflicts=True,
+        unique_fields=['tenant', 'agent', 'kpi_date'], update_fields=KPI_SOURCE_FIELDS,
+    )
+    # Days that lost all their activity (deleted leads, cancelled sales)
+    daily.exclude(pk__in=[obj.pk for obj in objs]).delete()
+    return len(objs)
@@ -0,0 +1,43 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from conversions.models import Sale
+from leads.models import Lead
+from tenancy.models import Agent
+from .cache import invalidate_tenant_cache
+from .models import KPIAgentDaily
+
+
+@receiver(post_save, sender=KPIAgentDaily)
+@receiver(post_delete, sender=KPIAgentDaily)
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def invalidate_analytics_cache(sender, instance, **kwargs):
+    """Cached dashboard numbers of the tenant are stale after these writes."""
+    invalidate_tenant_cache(instance.tenant_id)
+
+
+@receiver(post_save, sender=Lead)
+def count_captured_lead(sender, instance, created, raw=False, **kwargs):
+    """Count a new lead in its agent's KPIAgentDaily.leads_captured."""
+    if created and not raw:
+        _apply_lead_deltas(instance, sign=1)
+
+
+@receiver(post_delete, sender=Lead)
+def uncount_deleted_lead(sender, instance, origin=None, **kwargs):
+    """Take a deleted lead back out; cascades from tenant/agent removal are skipped."""
+    if origin is not None and getattr(origin, 'model', type(origin)) is not Lead:
+        return
+    _apply_lead_deltas(instance, sign=-1)
+
+
+def _apply_lead_deltas(lead, sign):
+    from .services import add_lead_deltas, apply_kpi_deltas, new_kpi_deltas
+
+    deltas = new_kpi_deltas()
+    add_lead_deltas(deltas, lead, sign=sign)
+    if deltas:
+        apply_kpi_deltas(deltas)
@@ -1,3 +1,503 @@
-from django.test import TestCase
+import datetime
+import threading
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from posightful.testing import TenantFixtureMixin
+from tenancy.models import Agent, Customer, Product
+from leads.models import Lead
+from conversions.models import Sale
+from bonuses.models import BonusLedger
+from analytics.models import KPIAgentDaily, KPITenantMonthly, KPITenantWeekly, KPIAgentMonthly
+from analytics.services import (
+    apply_kpi_deltas, new_kpi_deltas, rebuild_kpi_rollups, rebuild_kpis, kpi_conversion_rate,
+)
+from bonuses.services import drain_bonus_outbox
+
+
+class KPITestMixin(TenantFixtureMixin):
+
+    def _setup_tenant(self):
+        super()._setup_tenant()
+        self.user = self._create_user("manager")
+        self.agents = [self._create_agent(), self._create_agent()]
+        # A Monday and the following Wednesday, Sunday and next Monday (same month)
+        self.monday = datetime.date(2025, 3, 3)
+
+    def _daily(self, agent, day, **values):
+        KPIAgentDaily.objects.update_or_create(
+            tenant=self.tenant, agent=agent, kpi_date=day, defaults=values,
+        )
+
+
+class ApplyKPIDeltasTest(KPITestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+
+    def test_deltas_update_daily_and_rollups(self):
+        a, b = self.agents
+        deltas = new_kpi_deltas()
+        deltas[(self.tenant.id, a.id, self.monday)]['revenue_amount'] += Decimal('100')
+        deltas[(self.tenant.id, a.id, self.monday + datetime.timedelta(days=7))]['revenue_amount'] += Decimal('50')
+        deltas[(self.tenant.id, b.id, self.monday + datetime.timedelta(days=2))]['leads_converted'] += 2
+        apply_kpi_deltas(deltas)
+
+        month = KPITenantMonthly.objects.get(tenant=self.tenant, month=datetime.date(2025, 3, 1))
+        self.assertEqual(month.revenue_amount, Decimal('150'))
+        self.assertEqual(month.leads_converted, 2)
+        weeks = dict(KPITenantWeekly.objects.values_list('week_start', 'revenue_amount'))
+        self.assertEqual(weeks, {
+            self.monday: Decimal('100'),
+            self.monday + datetime.timedelta(days=7): Decimal('50'),
+        })
+        self.assertEqual(KPIAgentMonthly.objects.get(agent=a).revenue_amount, Decimal('150'))
+        self.assertEqual(KPIAgentMonthly.objects.get(agent=b).leads_converted, 2)
+
+    def test_second_apply_increments_existing_rows(self):
+        a = self.agents[0]
+        for _ in range(2):
+            deltas = new_kpi_deltas()
+            deltas[(self.tenant.id, a.id, self.monday)]['bonus_amount'] += Decimal('10')
+            apply_kpi_deltas(deltas)
+
+        self.assertEqual(KPIAgentDaily.objects.get().bonus_amount, Decimal('20'))
+        self.assertEqual(KPITenantMonthly.objects.get().bonus_amount, Decimal('20'))
+        self.assertEqual(KPITenantWeekly.objects.get().bonus_amount, Decimal('20'))
+        self.assertEqual(KPIAgentMonthly.objects.get().bonus_amount, Decimal('20'))
+
+
+class RebuildKPIRollupsTest(KPITestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        a, b = self.agents
+        self._daily(a, self.monday, leads_captured=4, revenue_amount=Decimal('100'), conversion_rate=Decimal('25'))
+        self._daily(b, self.monday, leads_captured=2, revenue_amount=Decimal('300'), conversion_rate=Decimal('50'))
+        self._daily(a, datetime.date(2025, 4, 1), leads_captured=1, revenue_amount=Decimal('10'))
+
+    def test_rebuild_aggregates_daily_rows(self):
+        written = rebuild_kpi_rollups()
+
+        self.assertEqual(written, 2 + 2 + 3)
+        march = KPITenantMonthly.objects.get(month=datetime.date(2025, 3, 1))
+        self.assertEqual(march.leads_captured, 6)
+        self.assertEqual(march.revenue_amount, Decimal('400'))
+        self.assertEqual(march.avg_conversion_rate, Decimal('37.5'))
+        self.assertIsNone(KPITenantMonthly.objects.get(month=datetime.date(2025, 4, 1)).avg_conversion_rate)
+
+    def test_rebuild_replaces_stale_rows(self):
+        rebuild_kpi_rollups()
+        KPIAgentDaily.objects.filter(kpi_date=datetime.date(2025, 4, 1)).delete()
+        rebuild_kpi_rollups(tenant_id=self.tenant.id)
+
+        self.assertFalse(KPITenantMonthly.objects.filter(month=datetime.date(2025, 4, 1)).exists())
+        self.assertEqual(KPIAgentMonthly.objects.count(), 2)
+
+
+    def test_range_only_recomputes_overlapping_periods(self):
+        rebuild_kpi_rollups()
+        KPITenantMonthly.objects.update(leads_captured=99)
+        KPIAgentDaily.objects.filter(kpi_date=datetime.date(2025, 4, 1)).update(leads_captured=5)
+
+        rebuild_kpi_rollups(date_from=datetime.date(2025, 4, 1), date_to=datetime.date(2025, 4, 1))
+
+        months = dict(KPITenantMonthly.objects.values_list("month", "leads_captured"))
+        self.assertEqual(months, {datetime.date(2025, 3, 1): 99, datetime.date(2025, 4, 1): 5})
+        self.assertEqual(KPITenantWeekly.objects.get(week_start=datetime.date(2025, 3, 31)).leads_captured, 5)
+
+
+class IncrementalKPITest(KPITestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        self.customer = Customer.objects.create(tenant=self.tenant, full_name="Customer")
+        self.product = Product.objects.create(tenant=self.tenant, code="POS-TERM", name="POS Terminal")
+
+    def _lead(self, agent=None):
+        return Lead.objects.create(tenant=self.tenant, agent=agent or self.agents[0], customer=self.customer)
+
+    def _sale(self, lead, amount="1000", hours=3):
+        sale = Sale.objects.create(
+            tenant=self.tenant, agent=lead.agent, lead=lead, customer=self.customer, product=self.product,
+            amount=Decimal(amount), status="completed",
+            sold_at=lead.created_at + datetime.timedelta(hours=hours),
+        )
+        drain_bonus_outbox()
+        return sale
+
+    def _snapshot(self):
+        fields = [
+            "agent_id", "kpi_date", "leads_captured", "leads_converted", "conversion_rate",
+            "revenue_amount", "bonus_amount", "net_profit", "avg_time_to_convert",
+            "time_to_convert_total", "time_to_convert_count",
+        ]
+        return sorted(KPIAgentDaily.objects.values_list(*fields))
+
+    def _rollup_snapshot(self):
+        return sorted(KPITenantMonthly.objects.values_list(
+            "month", "leads_captured", "leads_converted", "net_profit",
+            "conversion_rate_sum", "conversion_rate_days",
+        ))
+
+    def test_leads_and_sales_maintain_derived_kpis(self):
+        leads = [self._lead() for _ in range(4)]
+        self._sale(leads[0], "1000", hours=2)
+        self._sale(leads[1], "500", hours=4)
+
+        rows = list(KPIAgentDaily.objects.filter(agent=self.agents[0]))
+        self.assertEqual(sum(row.leads_captured for row in rows), 4)
+        self.assertEqual(sum(row.leads_converted for row in rows), 2)
+        self.assertEqual(sum(row.revenue_amount for row in rows), Decimal("1500"))
+        self.assertEqual(sum((row.time_to_convert_total for row in rows), datetime.timedelta(0)),
+                         datetime.timedelta(hours=6))
+        for row in rows:
+            self.assertEqual(row.net_profit, row.revenue_amount - row.bonus_amount)
+            self.assertEqual(row.conversion_rate, kpi_conversion_rate(row.leads_converted, row.leads_captured))
+            if row.time_to_convert_count:
+                self.assertEqual(row.avg_time_to_convert, row.time_to_convert_total / row.time_to_convert_count)
+
+    def test_incremental_state_matches_reconcile_and_rebuild(self):
+        for agent in self.agents:
+            leads = [self._lead(agent) for _ in range(3)]
+            self._sale(leads[0], "1200")
+        incremental, rollups = self._snapshot(), self._rollup_snapshot()
+
+        today = timezone.now().date()
+        rebuild_kpis(today - datetime.timedelta(days=2), today + datetime.timedelta(days=2), chunk_days=2)
+
+        self.assertEqual(self._snapshot(), incremental)
+        self.assertEqual(self._rollup_snapshot(), rollups)
+
+    def test_cancelling_and_recompleting_a_sale(self):
+        sale = self._sale(self._lead(), "800")
+        completed = self._snapshot()
+
+        sale = Sale.objects.get(pk=sale.pk)
+        sale.status = "cancelled"
+        sale.save()
+        drain_bonus_outbox()
+        self.assertEqual(sum(row[3] for row in self._snapshot()), 0)
+        self.assertEqual(sum(row[5] for row in self._snapshot()), 0)
+
+        sale.status = "completed"
+        sale.save()
+        drain_bonus_outbox()
+        self.assertEqual(self._snapshot(), completed)
+
+    def test_reconcile_command_repairs_drift(self):
+        self._sale(self._lead(), "900")
+        expected = self._snapshot()
+        KPIAgentDaily.objects.update(leads_captured=99, revenue_amount=0)
+
+        out = StringIO()
+        call_command("reconcile_kpis", "--tenant", str(self.tenant.id), stdout=out)
+
+        self.assertIn("Reconciled", out.getvalue())
+        self.assertEqual(self._snapshot(), expected)
+
+    def test_commands_reject_invalid_dates(self):
+        for command in ("reconcile_kpis", "rebuild_kpis", "award_bonuses"):
+            with self.assertRaisesMessage(CommandError, 'Invalid date "2025-13-01"'):
+                call_command(command, "--since", "2025-13-01")
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class ConcurrentKPIUpsertTest(KPITestMixin, TransactionTestCase):
+    """
+    Parallel completed sales for one agent and day must all be counted
+    (each commit drains the bonus outbox inline, so drains overlap too).
+    """
+
+    WORKERS = 8
+
+    def setUp(self):
+        self._setup_tenant()
+        self.customer = Customer.objects.create(tenant=self.tenant, full_name="Customer")
+        self.product = Product.objects.create(tenant=self.tenant, code="POS-TERM", name="POS Terminal")
+
+    def _run_parallel(self, work):
+        barrier = threading.Barrier(self.WORKERS)
+        errors = []
+
+        def run(i):
+            try:
+                barrier.wait()
+                work(i)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_parallel_sales_are_all_counted(self):
+        agent = self.agents[0]
+        sold_at = timezone.now()
+
+        def sell(i):
+            lead = Lead.objects.create(tenant=self.tenant, agent=agent, customer=self.customer)
+            Sale.objects.create(
+                tenant=self.tenant, agent=agent, lead=lead, customer=self.customer, product=self.product,
+                amount=Decimal(100 * (i + 1)), status="completed", sold_at=sold_at,
+            )
+
+        self._run_parallel(sell)
+        # Drains that found the outbox locked left their rows to the next one
+        drain_bonus_outbox()
+
+        revenue = Decimal(100 * self.WORKERS * (self.WORKERS + 1) // 2)
+        bonus = sum(BonusLedger.objects.values_list("bonus_amount", flat=True))
+        self.assertEqual(BonusLedger.objects.count(), self.WORKERS)
+        day = KPIAgentDaily.objects.get(agent=agent, kpi_date=sold_at.date())
+        self.assertEqual(day.leads_captured, self.WORKERS)
+        self.assertEqual(day.leads_converted, self.WORKERS)
+        self.assertEqual(day.revenue_amount, revenue)
+        self.assertEqual(day.bonus_amount, bonus)
+        self.assertEqual(day.net_profit, revenue - bonus)
+        self.assertEqual(day.conversion_rate, Decimal("100"))
+        self.assertEqual(day.time_to_convert_count, self.WORKERS)
+        for model in (KPITenantMonthly, KPITenantWeekly, KPIAgentMonthly):
+            rollup = model.objects.get()
+            self.assertEqual(rollup.leads_converted, self.WORKERS)
+            self.assertEqual(rollup.revenue_amount, revenue)
+            self.assertEqual(rollup.conversion_rate_sum, Decimal("100"))
+            self.assertEqual(rollup.conversion_rate_days, 1)
+
+
+class RebuildKPIsTest(KPITestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+
+    def test_rebuild_upserts_and_removes_stale_days(self):
+        a = self.agents[0]
+        # No leads or sales exist: both rows are stale, the one outside the range stays
+        self._daily(a, self.monday, leads_captured=5)
+        self._daily(a, datetime.date(2025, 5, 1), leads_captured=7)
+
+        out = StringIO()
+        call_command(
+            "rebuild_kpis", "--since", "2025-03-01", "--until", "2025-04-30",
+            "--chunk-days", "20", stdout=out,
+        )
+
+        self.assertIn("2025-03-01 .. 2025-03-20: 0 rows", out.getvalue())
+        self.assertEqual(list(KPIAgentDaily.objects.values_list("leads_captured", flat=True)), [7])
+
+    def test_rebuild_overwrites_existing_rows_in_place(self):
+        lead = Lead.objects.create(
+            tenant=self.tenant, agent=self.agents[0],
+            customer=Customer.objects.create(tenant=self.tenant, full_name="Customer"),
+        )
+        row = KPIAgentDaily.objects.get()
+        KPIAgentDaily.objects.update(leads_captured=40, conversion_rate=None)
+
+        day = lead.created_at.date()
+        self.assertEqual(rebuild_kpis(day, day), 1)
+
+        rebuilt = KPIAgentDaily.objects.get()
+        self.assertEqual(rebuilt.pk, row.pk)
+        self.assertEqual(rebuilt.leads_captured, 1)
+        self.assertEqual(rebuilt.conversion_rate, Decimal("0.00"))
+        self.assertEqual(KPITenantMonthly.objects.get().leads_captured, 1)
+
+
+class RollupViewsTest(KPITestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        today = timezone.now().date()
+        a, b = self.agents
+        self._daily(a, today, leads_captured=4, leads_converted=1, revenue_amount=Decimal('1000'),
+                    bonus_amount=Decimal('100'), conversion_rate=Decimal('25'))
+        self._daily(b, today, leads_captured=2, leads_converted=1, revenue_amount=Decimal('500'),
+                    bonus_amount=Decimal('50'), conversion_rate=Decimal('50'))
+        rebuild_kpi_rollups()
+
+    def test_revenue_trend_reads_monthly_rollup(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/analytics/revenue-trend/")
+        self.assertEqual(response.data["datasets"][0]["data"], [1500.0])
+
+    def test_conversion_rate_trend_averages_daily_rates(self):
+        response = self.client.get("/api/analytics/conversion-rate-trend/")
+        self.assertEqual(response.data["datasets"][0]["data"], [37.5])
+
+    def test_monthly_bonuses_counts_agents(self):
+        response = self.client.get("/api/bonuses/monthly/")
+        self.assertEqual(response.data[0]["totalBonus"], 150.0)
+        self.assertEqual(response.data[0]["agentCount"], 2)
+
+    def test_manager_dashboard_uses_month_totals(self):
+        response = self.client.get("/api/analytics/manager-dashboard/")
+        self.assertEqual(response.data["totalRevenue"]["value"], "$1,500")
+        self.assertEqual(response.data["conversionRate"]["value"], "37.5%")
+
+    def test_performance_chart_tenant_wide(self):
+        response = self.client.get("/api/analytics/performance-chart/")
+        self.assertEqual(response.data["datasets"][0]["data"][-1], 6)
+
+
+    def test_kpi_endpoint_is_read_only(self):
+        row = KPIAgentDaily.objects.get(agent=self.agents[0])
+        response = self.client.get("/api/analytics/kpi/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.client.patch(f"/api/analytics/kpi/{row.id}/", {"revenue_amount": "9000"}).status_code, 405,
+        )
+        self.assertEqual(self.client.delete(f"/api/analytics/kpi/{row.id}/").status_code, 405)
+        self.assertEqual(KPIAgentMonthly.objects.get(agent=self.agents[0]).revenue_amount, Decimal("1000"))
+
+
+class AnalyticsCacheTest(KPITestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.today = timezone.now().date()
+        self._daily(self.agents[0], self.today, leads_captured=3, leads_converted=1)
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.client.get("/api/analytics/conversion-chart/")
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/analytics/conversion-chart/")
+        self.assertEqual(first.data, second.data)
+
+    def test_kpi_write_invalidates_tenant_cache(self):
+        self.client.get("/api/analytics/conversion-chart/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self._daily(self.agents[0], self.today, leads_captured=7)
+
+        response = self.client.get("/api/analytics/conversion-chart/")
+        self.assertEqual(response.data["datasets"][0]["data"], [7])
+
+    def test_invalidation_waits_for_commit(self):
+        first = self.client.get("/api/analytics/conversion-chart/")
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self._daily(self.agents[0], self.today, leads_captured=7)
+
+        self.assertTrue(callbacks)
+        response = self.client.get("/api/analytics/conversion-chart/")
+        self.assertEqual(response.data, first.data)
+
+    def test_agent_change_invalidates_personnel_chart(self):
+        before = self.client.get("/api/analytics/personnel-chart/").data["datasets"][0]["data"][-1]
+        self.agents[1].status = "terminated"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agents[1].save()
+
+        after = self.client.get("/api/analytics/personnel-chart/").data["datasets"][0]["data"][-1]
+        self.assertEqual(after, before - 1)
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get("/api/analytics/dashboard/")
+        response = self.client.get("/api/analytics/dashboard/", {"agent": self.agents[1].id})
+        self.assertEqual(response.data["per_agent"], [])
+
+    def test_team_scoped_endpoint_is_cached_per_user(self):
+        self.client.get("/api/analytics/top-agents/")
+        self.client.force_authenticate(user=self.agents[0].user)
+        # Scope resolution (roles, own agent, team) and the KPI query:
+        # nothing reused from the manager's entry
+        with self.assertNumQueries(4):
+            self.client.get("/api/analytics/top-agents/")
+
+
+class SupervisorPerformanceTest(KPITestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.today = timezone.now().date()
+        sup_a, sup_b = self.agents
+        for parent, revenue in [(sup_a, '100'), (sup_a, '200'), (sup_b, '1000')]:
+            sub = self._create_agent(parent=parent)
+            self._daily(sub, self.today, leads_captured=2, leads_converted=1, revenue_amount=Decimal(revenue))
+            self._daily(sub, self.today.replace(day=1) - datetime.timedelta(days=1),
+                        leads_captured=5, revenue_amount=Decimal('7'))
+
+    def test_single_query_payload_sorted_by_revenue(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/analytics/supervisor-performance/")
+        self.assertEqual(response.data, [
+            {"name": "Agent 2", "code": "AG002", "agents": 1, "leads": 2, "conversions": 1, "revenue": 1000.0},
+            {"name": "Agent 1", "code": "AG001", "agents": 2, "leads": 4, "conversions": 2, "revenue": 300.0},
+        ])
+
+    def test_date_range(self):
+        last_month_end = self.today.replace(day=1) - datetime.timedelta(days=1)
+        response = self.client.get("/api/analytics/supervisor-performance/", {
+            "date_from": last_month_end.replace(day=1).isoformat(),
+            "date_to": last_month_end.isoformat(),
+        })
+        self.assertEqual([row["revenue"] for row in response.data], [14.0, 7.0])
+        self.assertEqual(response.data[0]["leads"], 10)
+
+    def test_invalid_date_is_rejected(self):
+        response = self.client.get("/api/analytics/supervisor-performance/", {"date_from": "03/2025"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_limit_offset_pagination(self):
+        response = self.client.get("/api/analytics/supervisor-performance/", {"limit": 1, "offset": 1})
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual([row["code"] for row in response.data["results"]], ["AG001"])
+
+
+class PersonnelChartTest(KPITestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        sup, agent = self.agents
+        agent.parent = sup
+        agent.save()
+        two_months_ago = timezone.now() - datetime.timedelta(days=62)
+        Agent.objects.filter(pk=sup.pk).update(created_at=two_months_ago)
+
+    def test_cumulative_headcount_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/analytics/personnel-chart/", {"months": 12})
+        agents, supervisors = (d["data"] for d in response.data["datasets"])
+
+        self.assertEqual(len(response.data["labels"]), 12)
+        self.assertEqual(response.data["labels"][-1], timezone.localdate().strftime("%b"))
+        self.assertEqual(agents[-1], 1)
+        self.assertEqual(agents[-2], 0)
+        self.assertEqual(supervisors[-1], 1)
+        self.assertEqual(sum(supervisors[:-3]), 0)
+
+    def test_default_is_seven_months(self):
+        response = self.client.get("/api/analytics/personnel-chart/")
+        self.assertEqual(len(response.data["labels"]), 7)
+
+    def test_agents_without_created_at_are_skipped(self):
+        Agent.objects.filter(pk=self.agents[1].pk).update(created_at=None)
+        response = self.client.get("/api/analytics/personnel-chart/")
+
+        self.assertEqual(response.status_code, 200)
+        agents, supervisors = (d["data"] for d in response.data["datasets"])
+        self.assertEqual(agents[-1], 0)
+        self.assertEqual(supervisors[-1], 1)
@@ -1,42 +1,42 @@
 from rest_framework import viewsets, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Sum, Avg, Count, F
+from django.db.models import Sum, Avg, Count, F, Q, Exists, OuterRef
 from django.db.models.functions import TruncMonth, TruncDate, TruncWeek
 from django.utils import timezone
-from datetime import timedelta
-from .models import KPIAgentDaily
+from datetime import date, timedelta
+from .cache import cached_response
+from .models import KPIAgentDaily, KPITenantMonthly, KPITenantWeekly
 from .serializers import KPIAgentDailySerializer
 
 
-class TenantScopedViewSet(viewsets.ModelViewSet):
+class KPIAgentDailyViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    KPIAgentDaily is maintained from leads, sales and the bonus ledger (and
+    the rollups from it), so it is read-only here; rebuild_kpis repairs it.
+    """
+    serializer_class = KPIAgentDailySerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = ['agent', 'kpi_date']
+    search_fields = ['agent__agent_code']
+    ordering_fields = ['kpi_date', 'leads_captured', 'revenue_amount']
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = KPIAgentDaily.objects.select_related('tenant', 'agent').all()
         user = self.request.user
         if user.tenant_id:
-            return qs.filter(tenant=user.tenant)
+            qs = qs.filter(tenant=user.tenant)
         return qs
 
-    def perform_create(self, serializer):
-        if self.request.user.tenant_id:
-            serializer.save(tenant=self.request.user.tenant)
-        else:
-            serializer.save()
 
-
-class KPIAgentDailyViewSet(TenantScopedViewSet):
-    serializer_class = KPIAgentDailySerializer
-    filterset_fields = ['agent', 'kpi_date']
-    search_fields = ['agent__agent_code']
-    ordering_fields = ['kpi_date', 'leads_captured', 'revenue_amount']
-
-    def get_queryset(self):
-        return KPIAgentDaily.objects.select_related('tenant', 'agent').all()
+class SupervisorPerformancePagination(LimitOffsetPagination):
+    """Opt-in: without ?limit the full list is returned unpaginated."""
+    default_limit = None
+    max_limit = 500
 
 
 def _tenant_kpi_qs(request):
@@ -46,20 +46,39 @@ def _tenant_kpi_qs(request):
     return qs
 
 
+def _tenant_rollup_qs(request, model):
+    """Tenant-scoped queryset over one of the KPI rollup tables."""
+    qs = model.objects.all()
+    if request.user.tenant_id:
+        qs = qs.filter(tenant=request.user.tenant)
+    return qs
+
+
+def _avg_rate(rate_sum, rate_days):
+    """Average daily conversion rate from rollup sums (matches Avg('conversion_rate'))."""
+    return float(rate_sum) / rate_days if rate_days else 0
+
+
+def _team_agent_ids(request):
+    """IDs of the supervisor's team agents, or None if the user has no team."""
+    from tenancy.scope import get_user_scope
+    if not request.user.tenant_id:
+        return None
+    return list(get_user_scope(request.user).team_agent_ids) or None
+
+
 def _team_scoped_kpi_qs(request):
     """Return KPI queryset scoped to supervisor's team agents if applicable."""
-    from tenancy.models import Agent
     qs = _tenant_kpi_qs(request)
-    supervisor = Agent.objects.filter(user=request.user).first()
-    if supervisor:
-        team_ids = list(Agent.objects.filter(parent=supervisor).values_list('id', flat=True))
-        if team_ids:
-            qs = qs.filter(agent_id__in=team_ids)
+    team_ids = _team_agent_ids(request)
+    if team_ids is not None:
+        qs = qs.filter(agent_id__in=team_ids)
     return qs
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def dashboard_summary(request):
     user = request.user
     qs = _tenant_kpi_qs(request)
@@ -154,6 +173,7 @@ def agent_dashboard(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response(team_scoped=True)
 def supervisor_dashboard(request):
     """Team-level aggregates for a supervisor."""
     user = request.user
@@ -165,7 +185,9 @@ def supervisor_dashboard(request):
     supervisor = Agent.objects.filter(user=user).first()
 
     if supervisor:
-        team_agents = Agent.objects.filter(parent=supervisor, status='active')
+        team_agents = Agent.objects.filter(
+            ancestor_links__ancestor=supervisor, ancestor_links__depth__gte=1, status='active',
+        )
     else:
         team_agents = Agent.objects.filter(tenant=tenant, status='active')
 
@@ -209,7 +231,9 @@ def supervisor_dashboard(request):
     else:
         rev_trend = 'No data last month'
 
-    inactive = Agent.objects.filter(parent=supervisor, status='inactive').count() if supervisor else 0
+    inactive = Agent.objects.filter(
+        ancestor_links__ancestor=supervisor, ancestor_links__depth__gte=1, status='inactive',
+    ).count() if supervisor else 0
 
     return Response({
         'activeAgents': {'value': f'{active_agents}/{active_agents + inactive}', 'trend': f'{inactive} inactive'},
@@ -222,6 +246,7 @@ def supervisor_dashboard(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def manager_dashboard(request):
     """Org-wide KPIs."""
     user = request.user
@@ -238,17 +263,18 @@ def manager_dashboard(request):
 
     now = timezone.now().date()
     month_start = now.replace(day=1)
-    kpi_qs = _tenant_kpi_qs(request).filter(kpi_date__gte=month_start, kpi_date__lte=now)
+    monthly_qs = _tenant_rollup_qs(request, KPITenantMonthly)
 
-    totals = kpi_qs.aggregate(
+    totals = monthly_qs.filter(month=month_start).aggregate(
         total_revenue=Sum('revenue_amount'),
         total_bonus=Sum('bonus_amount'),
-        avg_rate=Avg('conversion_rate'),
+        rate_sum=Sum('conversion_rate_sum'),
+        rate_days=Sum('conversion_rate_days'),
     )
 
     total_revenue = float(totals['total_revenue'] or 0)
     total_bonus = float(totals['total_bonus'] or 0)
-    conv_rate = round(float(totals['avg_rate'] or 0), 1)
+    conv_rate = round(_avg_rate(totals['rate_sum'], totals['rate_days']), 1)
     bonus_pct = round((total_bonus / total_revenue * 100), 0) if total_revenue > 0 else 0
 
     # Quarter comparison
@@ -256,9 +282,9 @@ def manager_dashboard(request):
     prev_quarter_end = quarter_start - timedelta(days=1)
     prev_quarter_start = prev_quarter_end.replace(month=max(prev_quarter_end.month - 2, 1), day=1)
 
-    prev_kpi = _tenant_kpi_qs(request).filter(
-        kpi_date__gte=prev_quarter_start, kpi_date__lte=prev_quarter_end
-    ).aggregate(total_revenue=Sum('revenue_amount'), avg_rate=Avg('conversion_rate'))
+    prev_kpi = monthly_qs.filter(
+        month__gte=prev_quarter_start, month__lte=prev_quarter_end
+    ).aggregate(total_revenue=Sum('revenue_amount'))
 
     prev_revenue = float(prev_kpi['total_revenue'] or 0)
     if prev_revenue > 0:
@@ -277,6 +303,7 @@ def manager_dashboard(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def conversion_chart(request):
     """Daily leads vs conversions for last 7 days."""
     now = timezone.now().date()
@@ -307,15 +334,14 @@ def conversion_chart(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def revenue_trend(request):
     """Monthly revenue vs target for last 7 months."""
     now = timezone.now().date()
     seven_months_ago = (now.replace(day=1) - timedelta(days=180)).replace(day=1)
 
-    qs = _tenant_kpi_qs(request).filter(
-        kpi_date__gte=seven_months_ago
-    ).annotate(
-        month=TruncMonth('kpi_date')
+    qs = _tenant_rollup_qs(request, KPITenantMonthly).filter(
+        month__gte=seven_months_ago
     ).values('month').annotate(
         revenue=Sum('revenue_amount'),
     ).order_by('month')
@@ -340,39 +366,51 @@ def revenue_trend(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def personnel_chart(request):
-    """Monthly agent/supervisor count growth over last 7 months."""
+    """
+    Monthly agent/supervisor headcount over the last ?months calendar months
+    (default 7, max 60). Each bucket counts non-terminated agents created up
+    to the end of that month; supervisors are agents with subordinates.
+    """
     from tenancy.models import Agent
 
     tenant = request.user.tenant
     if not tenant:
         return Response({'labels': [], 'datasets': []})
 
-    now = timezone.now().date()
-    labels = []
-    agents_data = []
-    supervisors_data = []
-
-    for i in range(6, -1, -1):
-        d = (now.replace(day=1) - timedelta(days=30 * i))
-        month_end = d.replace(day=28)
-        labels.append(d.strftime('%b'))
-
-        total = Agent.objects.filter(
-            tenant=tenant,
-            created_at__lte=month_end,
-        ).exclude(status='terminated').count()
-        sups = Agent.objects.filter(
-            tenant=tenant,
-            created_at__lte=month_end,
-            subordinates__isnull=False,
-        ).exclude(status='terminated').distinct().count()
-
-        agents_data.append(total - sups)
-        supervisors_data.append(sups)
+    try:
+        months = min(max(int(request.query_params.get('months', 7)), 1), 60)
+    except ValueError:
+        return Response({'error': 'months must be an integer'}, status=400)
+
+    current = timezone.localdate().replace(day=1)
+    buckets = []
+    for _ in range(months):
+        buckets.append(current)
+        current = (current - timedelta(days=1)).replace(day=1)
+    buckets.reverse()
+
+    # One grouped query: headcount per creation month and supervisor flag
+    rows = Agent.objects.filter(tenant=tenant, created_at__isnull=False).exclude(status='terminated').annotate(
+        month=TruncMonth('created_at'),
+        is_supervisor=Exists(Agent.objects.filter(parent=OuterRef('pk'))),
+    ).values('month', 'is_supervisor').annotate(n=Count('id')).order_by('month')
+
+    agents_data = [0] * months
+    supervisors_data = [0] * months
+    for row in rows:
+        month = row['month'].date()
+        series = supervisors_data if row['is_supervisor'] else agents_data
+        # Cumulative: an agent counts in every bucket from its creation month on
+        first = next((i for i, bucket in enumerate(buckets) if bucket >= month), None)
+        if first is None:
+            continue
+        for i in range(first, months):
+            series[i] += row['n']
 
     return Response({
-        'labels': labels,
+        'labels': [bucket.strftime('%b') for bucket in buckets],
         'datasets': [
             {'name': 'Agents', 'data': agents_data, 'color': '#3b82f6'},
             {'name': 'Supervisors', 'data': supervisors_data, 'color': '#8b5cf6'},
@@ -382,24 +420,24 @@ def personnel_chart(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def conversion_rate_trend(request):
     """Monthly conversion rate for last 12 months."""
     now = timezone.now().date()
     twelve_months_ago = (now.replace(day=1) - timedelta(days=365)).replace(day=1)
 
-    qs = _tenant_kpi_qs(request).filter(
-        kpi_date__gte=twelve_months_ago
-    ).annotate(
-        month=TruncMonth('kpi_date')
+    qs = _tenant_rollup_qs(request, KPITenantMonthly).filter(
+        month__gte=twelve_months_ago
     ).values('month').annotate(
-        avg_rate=Avg('conversion_rate'),
+        rate_sum=Sum('conversion_rate_sum'),
+        rate_days=Sum('conversion_rate_days'),
     ).order_by('month')
 
     labels = []
     data = []
     for row in qs:
         labels.append(row['month'].strftime('%b'))
-        data.append(round(float(row['avg_rate'] or 0), 1))
+        data.append(round(_avg_rate(row['rate_sum'], row['rate_days']), 1))
 
     return Response({
         'labels': labels,
@@ -411,48 +449,67 @@ def conversion_rate_trend(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
 def supervisor_performance(request):
-    """Per-supervisor aggregates."""
+    """
+    Per-supervisor aggregates over the KPIs of everyone below them
+    (any depth, via the AgentHierarchy closure table).
+
+    Optional ?date_from / ?date_to (YYYY-MM-DD, default: this month) and
+    ?limit / ?offset pagination. One grouped query regardless of how many
+    supervisors the tenant has.
+    """
     from tenancy.models import Agent
 
     tenant = request.user.tenant
     if not tenant:
         return Response([])
 
-    now = timezone.now().date()
-    month_start = now.replace(day=1)
+    date_from = request.query_params.get('date_from')
+    date_to = request.query_params.get('date_to')
+    try:
+        date_from = date.fromisoformat(date_from) if date_from else timezone.now().date().replace(day=1)
+        date_to = date.fromisoformat(date_to) if date_to else None
+    except ValueError:
+        return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
+
+    below = Q(descendant_links__depth__gte=1)
+    kpi_filter = below & Q(descendant_links__descendant__daily_kpis__kpi_date__gte=date_from)
+    if date_to:
+        kpi_filter &= Q(descendant_links__descendant__daily_kpis__kpi_date__lte=date_to)
+
+    kpis = 'descendant_links__descendant__daily_kpis__'
+    supervisors = Agent.objects.filter(tenant=tenant).annotate(
+        team_size=Count('descendant_links', filter=below, distinct=True),
+        team_leads=Sum(kpis + 'leads_captured', filter=kpi_filter),
+        team_conversions=Sum(kpis + 'leads_converted', filter=kpi_filter),
+        team_revenue=Sum(kpis + 'revenue_amount', filter=kpi_filter),
+    ).filter(team_size__gt=0).select_related('user').order_by(
+        F('team_revenue').desc(nulls_last=True), 'id',
+    )
 
-    supervisors = Agent.objects.filter(
-        tenant=tenant,
-        subordinates__isnull=False,
-    ).distinct().select_related('user')
+    paginator = SupervisorPerformancePagination()
+    page = paginator.paginate_queryset(supervisors, request)
 
-    result = []
-    for sup in supervisors:
-        sub_ids = list(sup.subordinates.values_list('id', flat=True))
-        kpi = KPIAgentDaily.objects.filter(
-            agent_id__in=sub_ids,
-            kpi_date__gte=month_start,
-        ).aggregate(
-            leads=Sum('leads_captured'),
-            conversions=Sum('leads_converted'),
-            revenue=Sum('revenue_amount'),
-        )
-        result.append({
+    result = [
+        {
             'name': sup.user.full_name if sup.user else 'Unknown',
             'code': sup.agent_code or '',
-            'agents': len(sub_ids),
-            'leads': kpi['leads'] or 0,
-            'conversions': kpi['conversions'] or 0,
-            'revenue': float(kpi['revenue'] or 0),
-        })
-
-    result.sort(key=lambda x: x['revenue'], reverse=True)
+            'agents': sup.team_size,
+            'leads': sup.team_leads or 0,
+            'conversions': sup.team_conversions or 0,
+            'revenue': float(sup.team_revenue or 0),
+        }
+        for sup in (page if page is not None else supervisors)
+    ]
+    if page is not None:
+        return paginator.get_paginated_response(result)
     return Response(result)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response(team_scoped=True)
 def top_agents(request):
     """Top N agents by revenue this month (scoped to supervisor's team if applicable)."""
     now = timezone.now().date()
@@ -483,22 +540,30 @@ def top_agents(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response(team_scoped=True)
 def performance_chart(request):
     """Weekly leads vs conversions for last 4 weeks (scoped to supervisor's team if applicable)."""
-    now = timezone.now().date()
-    four_weeks_ago = now - timedelta(weeks=4)
-
-    qs = _team_scoped_kpi_qs(request).filter(
-        kpi_date__gte=four_weeks_ago,
-    )
+    from .services import week_start
 
+    now = timezone.now().date()
+    first_week = week_start(now - timedelta(weeks=4))
     agent_id = request.query_params.get('agent_id')
-    if agent_id:
-        qs = qs.filter(agent_id=agent_id)
+    team_ids = _team_agent_ids(request)
+
+    if agent_id or team_ids is not None:
+        qs = _tenant_kpi_qs(request).filter(kpi_date__gte=first_week)
+        if team_ids is not None:
+            qs = qs.filter(agent_id__in=team_ids)
+        if agent_id:
+            qs = qs.filter(agent_id=agent_id)
+        qs = qs.annotate(week=TruncWeek('kpi_date'))
+    else:
+        # Tenant-wide: read the weekly rollup instead of scanning daily rows
+        qs = _tenant_rollup_qs(request, KPITenantWeekly).filter(
+            week_start__gte=first_week,
+        ).annotate(week=F('week_start'))
 
-    qs = qs.annotate(
-        week=TruncWeek('kpi_date')
-    ).values('week').annotate(
+    qs = qs.values('week').annotate(
         leads=Sum('leads_captured'),
         conversions=Sum('leads_converted'),
     ).order_by('week')
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CommissionPolicy, BonusRule, BonusLedger
+from .models import CommissionPolicy, BonusRule, BonusLedger, BonusOutbox
 
 
 @admin.register(CommissionPolicy)
@@ -22,3 +22,11 @@ class BonusLedgerAdmin(admin.ModelAdmin):
     list_filter = ['tenant', 'rule']
     search_fields = ['agent__agent_code', 'agent__user__full_name']
     raw_id_fields = ['sale', 'agent', 'rule']
+
+
+@admin.register(BonusOutbox)
+class BonusOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'sale', 'event', 'attempts', 'available_at', 'created_at']
+    list_filter = ['event', 'tenant']
+    raw_id_fields = ['sale']
+    readonly_fields = ['last_error']
@@ -1,29 +1,138 @@
+import time
+from bisect import bisect_right
+from datetime import timedelta
 from decimal import Decimal
 from django.utils import timezone
 from .models import BonusRule
 
+# Compiled rule sets are invalidated by BonusRule signals; the TTL only bounds
+# staleness in other worker processes and after queryset.update() calls.
+RULE_CACHE_TTL = 300
+
+_rule_sets = {}
+
+
+class CompiledRule:
+    """A BonusRule with its match values parsed once for repeated evaluation."""
+
+    __slots__ = (
+        'rule', 'dimension', 'operator',
+        'ts_from', 'ts_to', 'num_from', 'num_to',
+        'interval_from', 'interval_to', 'text_values',
+        'amount_type', 'amount_value', 'cap_amount',
+        'effective_from', 'effective_to',
+    )
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.dimension = rule.rule_dimension
+        self.operator = rule.operator
+        self.ts_from = rule.ts_from
+        self.ts_to = rule.ts_to
+        self.num_from = _to_decimal(rule.num_from)
+        self.num_to = _to_decimal(rule.num_to)
+        self.interval_from = rule.interval_from
+        self.interval_to = rule.interval_to
+        self.text_values = frozenset(
+            v.strip() for v in (rule.text_values or rule.text_value or '').split(',') if v.strip()
+        )
+        self.amount_type = rule.amount_type
+        self.amount_value = _to_decimal(rule.amount_value)
+        self.cap_amount = _to_decimal(rule.cap_amount)
+        self.effective_from = rule.effective_from
+        self.effective_to = rule.effective_to
+
+    def is_effective(self, when):
+        if self.effective_from and self.effective_from > when:
+            return False
+        if self.effective_to and self.effective_to < when:
+            return False
+        return True
+
+    def matches(self, sale):
+        return _rule_matches(self, sale)
+
+
+class CompiledRuleSet:
+    """
+    All active rules of a tenant, sorted by id. The rules in effect at a given
+    moment are memoised per window between effective_from/effective_to
+    boundaries, so repeated lookups for "now" only cost a bisect.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.loaded_at = time.monotonic()
+        boundaries = set()
+        for compiled in self.rules:
+            if compiled.effective_from:
+                boundaries.add(compiled.effective_from)
+            if compiled.effective_to:
+                boundaries.add(compiled.effective_to + timedelta(microseconds=1))
+        self._boundaries = sorted(boundaries)
+        self._windows = {}
+
+    def effective_at(self, when):
+        idx = bisect_right(self._boundaries, when)
+        rules = self._windows.get(idx)
+        if rules is None:
+            rules = tuple(r for r in self.rules if r.is_effective(when))
+            self._windows[idx] = rules
+        return rules
+
+    def is_stale(self):
+        return time.monotonic() - self.loaded_at > RULE_CACHE_TTL
+
+
+def get_rule_set(tenant_id):
+    """Return the cached CompiledRuleSet for a tenant, compiling it on a miss."""
+    rule_set = _rule_sets.get(tenant_id)
+    if rule_set is None or rule_set.is_stale():
+        rules = BonusRule.objects.filter(tenant_id=tenant_id, is_active=True).order_by('id')
+        rule_set = CompiledRuleSet(CompiledRule(rule) for rule in rules)
+        _rule_sets[tenant_id] = rule_set
+    return rule_set
+
+
+def invalidate_rule_cache(tenant_id=None):
+    """Drop the compiled rules of one tenant, or of all tenants."""
+    if tenant_id is None:
+        _rule_sets.clear()
+    else:
+        _rule_sets.pop(tenant_id, None)
+
 
 def evaluate_bonus(sale):
     """
     Evaluate bonus rules against a completed sale.
     Returns (matched_rule, bonus_amount, calculation_detail).
     """
+    rules = get_rule_set(sale.tenant_id).effective_at(timezone.now())
+    return _evaluate(rules, sale)
+
+
+def evaluate_bonuses(sales, at_sale_time=False):
+    """
+    Evaluate many sales against their tenants' compiled rules in one pass.
+    Yields (sale, matched_rule, bonus_amount, calculation_detail) per sale.
+
+    Rules are taken as in effect now, like evaluate_bonus, or as in effect
+    at each sale's sold_at when at_sale_time is set. Sales should come with
+    product and lead loaded (select_related) to avoid per-sale queries.
+    """
     now = timezone.now()
-    rules = BonusRule.objects.filter(
-        tenant=sale.tenant,
-        is_active=True,
-    ).order_by('id')
-
-    for rule in rules:
-        if rule.effective_from and rule.effective_from > now:
-            continue
-        if rule.effective_to and rule.effective_to < now:
-            continue
-
-        if _rule_matches(rule, sale):
-            amount = _calculate_amount(rule, sale)
-            detail = _build_detail(rule, sale, amount)
-            return rule, amount, detail
+    for sale in sales:
+        when = sale.sold_at if at_sale_time and sale.sold_at else now
+        rules = get_rule_set(sale.tenant_id).effective_at(when)
+        yield (sale, *_evaluate(rules, sale))
+
+
+def _evaluate(rules, sale):
+    for compiled in rules:
+        if compiled.matches(sale):
+            amount = _calculate_amount(compiled, sale)
+            detail = _build_detail(compiled, sale, amount)
+            return compiled.rule, amount, detail
 
     # Default fallback: 10% of sale amount
     amount = (sale.amount * Decimal('0.10')).quantize(Decimal('0.01'))
@@ -31,9 +140,15 @@ def evaluate_bonus(sale):
     return None, amount, detail
 
 
+def _to_decimal(value):
+    if value is None or isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
 def _rule_matches(rule, sale):
     """Check if a rule's dimension + operator matches the sale."""
-    dim = rule.rule_dimension
+    dim = rule.dimension
     op = rule.operator
 
     if dim == 'SELL_AMOUNT':
@@ -57,7 +172,7 @@ def _rule_matches(rule, sale):
 
 def _compare_numeric(op, value, rule):
     """Compare a numeric value against rule's num_from/num_to."""
-    value = Decimal(str(value))
+    value = _to_decimal(value)
     num_from = rule.num_from
     num_to = rule.num_to
 
@@ -80,13 +195,11 @@ def _compare_numeric(op, value, rule):
 
 
 def _compare_text(op, value, rule):
-    """Compare a text value against rule's text_value/text_values."""
+    """Compare a text value against rule's pre-parsed text_values set."""
     if op in ('IN', 'EQ'):
-        values = [v.strip() for v in (rule.text_values or rule.text_value or '').split(',') if v.strip()]
-        return value in values
+        return value in rule.text_values
     if op in ('NOT_IN', 'NEQ'):
-        values = [v.strip() for v in (rule.text_values or rule.text_value or '').split(',') if v.strip()]
-        return value not in values
+        return value not in rule.text_values
     return False
 
 
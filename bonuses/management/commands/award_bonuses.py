@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from posightful.management import parse_date
+
+
+class Command(BaseCommand):
+    help = (
+        'Award bonuses for completed sales that have no BonusLedger entry.\n'
+        'Use after bulk-loading sales, which bypasses the per-sale post_save signal.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant', type=int,
+            help='Only process sales of this tenant id',
+        )
+        parser.add_argument(
+            '--since', type=str,
+            help='Only sales sold on or after this date (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--until', type=str,
+            help='Only sales sold on or before this date (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Sales evaluated and written per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        from conversions.models import Sale
+        from bonuses.services import award_bonuses
+
+        sales = Sale.objects.all()
+        if options['tenant']:
+            sales = sales.filter(tenant_id=options['tenant'])
+        if options['since']:
+            sales = sales.filter(sold_at__date__gte=parse_date(options['since']))
+        if options['until']:
+            sales = sales.filter(sold_at__date__lte=parse_date(options['until']))
+
+        count, total = award_bonuses(sales, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Awarded {count} bonuses totalling {total}'))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from posightful.management import parse_date
+
+
+class Command(BaseCommand):
+    help = (
+        'Materialize BonusLedger rows for historical completed sales that have none,\n'
+        'so audits read recorded bonuses instead of re-evaluating them per request.\n'
+        'Rules are evaluated as in effect at each sale time. Safe to interrupt and re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant', type=int,
+            help='Only process sales of this tenant id',
+        )
+        parser.add_argument(
+            '--since', type=str,
+            help='Only sales sold on or after this date (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Sales evaluated and written per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--update-kpis', action='store_true',
+            help='Also add the sales to the KPI tables (only if they were never counted)',
+        )
+
+    def handle(self, *args, **options):
+        from conversions.models import Sale
+        from bonuses.services import award_bonuses
+
+        sales = Sale.objects.filter(status='completed', bonus_ledger__isnull=True)
+        if options['tenant']:
+            sales = sales.filter(tenant_id=options['tenant'])
+        if options['since']:
+            sales = sales.filter(sold_at__date__gte=parse_date(options['since']))
+
+        pending = sales.count()
+        self.stdout.write(f'{pending} completed sales without a ledger entry')
+        if not pending:
+            return
+
+        def report(done, last_pk):
+            self.stdout.write(f'  {done}/{pending} ({done * 100 // pending}%) up to Sale #{last_pk}')
+
+        count, total = award_bonuses(
+            sales, batch_size=options['batch_size'], at_sale_time=True,
+            update_kpis=options['update_kpis'], progress=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {count} ledger entries totalling {total}'))
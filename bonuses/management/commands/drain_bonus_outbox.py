@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Award bonuses and update KPIs for the sales queued in the bonus outbox.\n'
+        'Runs once until the outbox is empty, or keeps polling with --loop.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Outbox rows applied per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--loop', type=float, metavar='SECONDS',
+            help='Keep draining, sleeping this many seconds whenever the outbox is empty',
+        )
+
+    def handle(self, *args, **options):
+        from bonuses.services import drain_bonus_outbox
+
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['loop'] is None:
+            applied, failed = drain_bonus_outbox(batch_size=options['batch_size'])
+            self._report(applied, failed)
+            return
+
+        try:
+            while True:
+                applied, failed = drain_bonus_outbox(batch_size=options['batch_size'])
+                if applied or failed:
+                    self._report(applied, failed)
+                else:
+                    time.sleep(options['loop'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
+
+    def _report(self, applied, failed):
+        message = f'Applied {applied} bonus outbox events'
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{message}, {failed} failed and rescheduled'))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
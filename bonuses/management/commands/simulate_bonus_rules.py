@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posightful.management import parse_date
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate what a tenant\'s bonus rules, with proposed changes, would have paid\n'
+        'for the completed sales of a period, compared with the BonusLedger.\n'
+        'Nothing is saved.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant', type=int, required=True,
+            help='Tenant id to simulate',
+        )
+        parser.add_argument(
+            '--since', type=str, required=True,
+            help='First sale day (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--until', type=str, required=True,
+            help='Last sale day (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--rules', type=str,
+            help='JSON file with a list of rule changes (BonusRule fields; "id" to change an existing rule)',
+        )
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='Agents listed, by largest change (default: 20)',
+        )
+
+    def handle(self, *args, **options):
+        from rest_framework.exceptions import ValidationError
+        from bonuses.simulation import simulate_bonuses
+
+        since = parse_date(options['since'])
+        until = parse_date(options['until'])
+        if since > until:
+            raise CommandError('--since must not be after --until')
+        changes = self._load_rules(options['rules']) if options['rules'] else []
+
+        try:
+            result = simulate_bonuses(options['tenant'], since, until, changes=changes)
+        except ValidationError as e:
+            raise CommandError(f'Invalid rule changes: {e.detail}')
+
+        self.stdout.write(
+            f"{result['sales']} completed sales from {since} to {until} "
+            f"({result['unrecorded_sales']} without a ledger entry)"
+        )
+        for row in result['rules']:
+            rule = row['rule']
+            name = (rule.name or 'New rule') if rule else 'Default (10%)'
+            self.stdout.write(f"  rule {rule.id if rule else '-'} {name}: {row['sales']} sales, {row['proposed']}")
+        for row in result['agents'][:options['top']]:
+            self.stdout.write(
+                f"  agent {row['agent_id']}: {row['current']} -> {row['proposed']} ({row['delta']:+})"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Current {result['current_total']}, proposed {result['proposed_total']}, "
+            f"delta {result['delta']:+}"
+        ))
+
+    def _load_rules(self, path):
+        try:
+            with open(path) as f:
+                changes = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read rule changes from {path}: {e}')
+        if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+            raise CommandError('The rules file must contain a JSON list of objects')
+        return changes
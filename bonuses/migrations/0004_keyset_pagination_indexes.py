@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 00:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonuses', '0003_bonusledger'),
+        ('conversions', '0002_initial'),
+        ('tenancy', '0005_agent_hierarchy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bonusledger',
+            index=models.Index(fields=['tenant', 'created_at', 'id'], name='bonus_ledge_tenant__743077_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 01:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bonuses', '0004_keyset_pagination_indexes'),
+        ('conversions', '0003_keyset_pagination_indexes'),
+        ('tenancy', '0005_agent_hierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BonusOutbox',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('event', models.CharField(choices=[('completed', 'Completed'), ('award', 'Award if missing'), ('reversed', 'Reversed')], max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bonus_outbox', to='conversions.sale')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bonus_outbox', to='tenancy.tenant')),
+            ],
+            options={
+                'db_table': 'bonus_outbox',
+                'indexes': [models.Index(fields=['available_at', 'id'], name='bonus_outbo_availab_e85636_idx')],
+            },
+        ),
+    ]
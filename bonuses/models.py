@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class CommissionPolicy(models.Model):
@@ -94,6 +95,51 @@ class BonusLedger(models.Model):
 
     class Meta:
         db_table = 'bonus_ledger'
+        indexes = [
+            # Keyset pagination: tenant filter + ORDER BY created_at DESC, id DESC
+            models.Index(fields=['tenant', 'created_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Bonus {self.bonus_amount} for Sale #{self.sale_id}"
+
+
+class BonusOutbox(models.Model):
+    """
+    Pending bonus work for a sale, written by the Sale post_save signal in
+    the sale's own transaction and drained in batches by
+    bonuses.services.drain_bonus_outbox. Rows are deleted once applied;
+    failed rows are retried with backoff until MAX_ATTEMPTS.
+    """
+    COMPLETED = 'completed'
+    AWARD = 'award'
+    REVERSED = 'reversed'
+
+    EVENT_CHOICES = [
+        # Became completed: award (or re-count the recorded bonus) and add to KPIs
+        (COMPLETED, 'Completed'),
+        # Saved as completed from an unknown previous status: award if not yet awarded
+        (AWARD, 'Award if missing'),
+        # Left completed status: take it back out of the KPIs
+        (REVERSED, 'Reversed'),
+    ]
+
+    MAX_ATTEMPTS = 5
+
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey('tenancy.Tenant', on_delete=models.CASCADE, related_name='bonus_outbox')
+    sale = models.ForeignKey('conversions.Sale', on_delete=models.CASCADE, related_name='bonus_outbox')
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'bonus_outbox'
+        indexes = [
+            models.Index(fields=['available_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.event} for Sale #{self.sale_id}"
@@ -44,3 +44,15 @@ class BonusLedgerSerializer(serializers.ModelSerializer):
             'bonus_amount', 'calculation_detail', 'created_at',
         ]
         read_only_fields = fields
+
+
+class BonusSimulationSerializer(serializers.Serializer):
+    """Input of the what-if simulation: a sale period and the rule changes to try."""
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    rules = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+
+    def validate(self, attrs):
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError('date_from must not be after date_to.')
+        return attrs
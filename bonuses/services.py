@@ -0,0 +1,273 @@
+import datetime
+import logging
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q, QuerySet
+from django.utils import timezone
+
+from conversions.models import Sale
+from .engine import evaluate_bonuses
+from .models import BonusLedger, BonusOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def award_bonuses(sales, batch_size=500, at_sale_time=False, update_kpis=True, progress=None):
+    """
+    Evaluate and record bonuses for many completed sales at once.
+
+    This is the path for bulk-loaded sales (Sale.objects.bulk_create does not
+    fire queue_bonus_on_sale). Sales are walked in primary-key batches; each
+    batch is evaluated against the compiled rules, its ledger rows are
+    written with one bulk_create and its KPI increments are summed per
+    (tenant, agent, day) before being applied, all in one transaction.
+    Sales that are not completed or already have a ledger entry are skipped,
+    so an interrupted run resumes where it stopped, and so are sales with
+    BonusOutbox rows, whose events drain_bonus_outbox applies.
+
+    at_sale_time evaluates the rules in effect when each sale was made.
+    With update_kpis=False only the ledger is written (for historical sales
+    whose KPIs are already counted). Each batch is written under the outbox
+    lock after re-checking the ledger and outbox, so sales a concurrent
+    drain or run recorded (or queued) first are skipped and not counted.
+    progress, if given, is called as progress(awarded_so_far, last_sale_pk)
+    after each batch.
+
+    Returns (awarded_count, total_bonus).
+    """
+    from analytics.services import add_sale_deltas, apply_kpi_deltas, new_kpi_deltas
+
+    if not isinstance(sales, QuerySet):
+        sales = Sale.objects.filter(pk__in=[sale.pk for sale in sales])
+    queued = BonusOutbox.objects.filter(sale=OuterRef('pk'))
+    sales = sales.filter(
+        ~Exists(queued), status='completed', bonus_ledger__isnull=True,
+    ).select_related('product', 'lead').order_by('pk')
+
+    awarded = 0
+    total = Decimal('0')
+    last_pk = 0
+    while True:
+        batch = list(sales.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        evaluated = list(evaluate_bonuses(batch, at_sale_time=at_sale_time))
+        with transaction.atomic():
+            _lock_outbox()
+            recorded = set(
+                Sale.objects.filter(pk__in=[sale.pk for sale in batch])
+                .filter(Q(bonus_ledger__isnull=False) | Exists(queued))
+                .values_list('pk', flat=True)
+            )
+            entries = []
+            deltas = new_kpi_deltas()
+            for sale, rule, amount, detail in evaluated:
+                if sale.pk in recorded:
+                    continue
+                entries.append(BonusLedger(
+                    tenant_id=sale.tenant_id,
+                    sale=sale,
+                    agent_id=sale.agent_id,
+                    rule=rule,
+                    bonus_amount=amount,
+                    calculation_detail=detail,
+                ))
+                add_sale_deltas(deltas, sale, amount)
+                total += amount
+            BonusLedger.objects.bulk_create(entries)
+            if update_kpis:
+                apply_kpi_deltas(deltas)
+        awarded += len(entries)
+        logger.info("Awarded %s bonuses up to Sale #%s", awarded, last_pk)
+        if progress:
+            progress(awarded, last_pk)
+
+    return awarded, total
+
+
+def sale_bonuses(sales, chunk_size=500):
+    """
+    Yield (sale, rule, bonus_amount, calculation_detail) for each sale, in order.
+
+    Recorded bonuses come from the sale's BonusLedger entry; sales without one
+    are evaluated by the bonus engine against the rules in effect when they
+    were sold, so reports agree with what award_bonuses would record. Sales
+    are buffered chunk_size at a time so each chunk's unrecorded sales go
+    through one evaluate_bonuses call. Sales should come with
+    'bonus_ledger__rule', 'product' and 'lead' loaded (select_related);
+    evaluation itself runs on the cached compiled rules and issues no queries.
+    """
+    chunk = []
+    for sale in sales:
+        chunk.append(sale)
+        if len(chunk) >= chunk_size:
+            yield from _chunk_bonuses(chunk)
+            chunk = []
+    if chunk:
+        yield from _chunk_bonuses(chunk)
+
+
+def _chunk_bonuses(chunk):
+    evaluated = evaluate_bonuses(
+        [sale for sale in chunk if getattr(sale, 'bonus_ledger', None) is None], at_sale_time=True,
+    )
+    for sale in chunk:
+        ledger = getattr(sale, 'bonus_ledger', None)
+        if ledger is not None:
+            yield sale, ledger.rule, ledger.bonus_amount, ledger.calculation_detail
+        else:
+            yield next(evaluated)
+
+
+# Key of the Postgres advisory lock held while ledger rows are written (a
+# drained batch or an award_bonuses batch), so that no sale is recorded or
+# counted by two workers at once
+OUTBOX_LOCK_ID = 7_301_024
+OUTBOX_RETRY_BACKOFF = 30  # seconds before the first retry, doubled on each attempt
+
+
+def _lock_outbox():
+    """Wait for the outbox lock; it is released when the transaction ends."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [OUTBOX_LOCK_ID])
+
+
+def _try_lock_outbox():
+    """Take the outbox lock if it is free; False when another worker holds it."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [OUTBOX_LOCK_ID])
+        return cursor.fetchone()[0]
+
+
+def drain_bonus_outbox(batch_size=500, max_batches=None):
+    """
+    Apply pending BonusOutbox rows in id order, batch_size per transaction.
+
+    Each batch evaluates the bonuses of its newly completed sales against
+    the compiled rules in effect when each sale was made (a row retried
+    later must not pick up rules created since), writes their ledger rows
+    with one bulk_create, sums the KPI increments of all its events per
+    (tenant, agent, day) and deletes the applied rows, in one transaction.
+    Only one worker drains at a time: if another holds the outbox lock this
+    returns at once and leaves the rows to it (or to the periodic drain).
+    If a batch fails its rows are reloaded and retried one by one; a row
+    that fails again is rescheduled with backoff until
+    BonusOutbox.MAX_ATTEMPTS, and later events of the same sale are not
+    applied while an earlier one is held back.
+
+    Returns (applied, failed) row counts.
+    """
+    applied = failed = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            if not _try_lock_outbox():
+                logger.info("Bonus outbox is locked by another worker; leaving its rows to it")
+                break
+            now = timezone.now()
+            held_back = BonusOutbox.objects.filter(
+                Q(available_at__gt=now) | Q(attempts__gte=BonusOutbox.MAX_ATTEMPTS),
+                sale_id=OuterRef('sale_id'), id__lt=OuterRef('id'),
+            )
+            rows = _load_rows(BonusOutbox.objects.filter(
+                ~Exists(held_back), attempts__lt=BonusOutbox.MAX_ATTEMPTS, available_at__lte=now,
+            ), batch_size)
+            if not rows:
+                break
+            done, errors = _drain_rows(rows)
+        applied += done
+        failed += errors
+        batches += 1
+        logger.info("Bonus outbox: applied %s, failed %s", applied, failed)
+        if len(rows) < batch_size:
+            break
+    return applied, failed
+
+
+def _load_rows(queryset, limit=None):
+    rows = queryset.select_related('sale__product', 'sale__lead', 'sale__bonus_ledger').order_by('id')
+    return list(rows[:limit])
+
+
+def _drain_rows(rows):
+    try:
+        with transaction.atomic():
+            _apply_outbox_rows(rows)
+        return len(rows), 0
+    except Exception:
+        logger.exception("Bonus outbox batch failed; retrying its rows one by one")
+
+    # The failed attempt left unsaved ledger entries cached on the sales
+    rows = _load_rows(BonusOutbox.objects.filter(pk__in=[row.pk for row in rows]))
+    applied = 0
+    recorded = {}
+    retry_at = {}  # sale_id -> when its failed event is retried
+    for row in rows:
+        if row.sale_id in retry_at:
+            BonusOutbox.objects.filter(pk=row.pk).update(available_at=retry_at[row.sale_id])
+            continue
+        try:
+            with transaction.atomic():
+                recorded = _apply_outbox_rows([row], recorded)
+            applied += 1
+        except Exception as e:
+            retry_at[row.sale_id] = _reschedule(row, e)
+    return applied, len(retry_at)
+
+
+def _apply_outbox_rows(rows, recorded=None):
+    """
+    Apply outbox rows in one go. recorded maps sale_id to the bonus already
+    recorded by earlier rows (None: not awarded yet); the updated mapping is
+    returned, the given one is left as is.
+    """
+    from analytics.services import add_sale_deltas, apply_kpi_deltas, new_kpi_deltas
+
+    recorded = dict(recorded or {})
+    entries = []
+    deltas = new_kpi_deltas()
+    for row in rows:
+        sale = row.sale
+        if sale.pk not in recorded:
+            ledger = getattr(sale, 'bonus_ledger', None)
+            recorded[sale.pk] = ledger.bonus_amount if ledger else None
+        bonus = recorded[sale.pk]
+
+        if row.event == BonusOutbox.REVERSED:
+            add_sale_deltas(deltas, sale, bonus or 0, sign=-1)
+        elif bonus is None:
+            _, rule, amount, detail = next(evaluate_bonuses((sale,), at_sale_time=True))
+            entries.append(BonusLedger(
+                tenant_id=sale.tenant_id,
+                sale=sale,
+                agent_id=sale.agent_id,
+                rule=rule,
+                bonus_amount=amount,
+                calculation_detail=detail,
+            ))
+            recorded[sale.pk] = amount
+            add_sale_deltas(deltas, sale, amount)
+        elif row.event == BonusOutbox.COMPLETED:
+            add_sale_deltas(deltas, sale, bonus)
+
+    BonusLedger.objects.bulk_create(entries)
+    if deltas:
+        apply_kpi_deltas(deltas)
+    BonusOutbox.objects.filter(pk__in=[row.pk for row in rows]).delete()
+    return recorded
+
+
+def _reschedule(row, error):
+    """Count a failed attempt and return when the row becomes available again."""
+    attempts = row.attempts + 1
+    available_at = timezone.now() + datetime.timedelta(seconds=OUTBOX_RETRY_BACKOFF * 2 ** row.attempts)
+    BonusOutbox.objects.filter(pk=row.pk).update(
+        attempts=attempts, available_at=available_at, last_error=repr(error),
+    )
+    if attempts >= BonusOutbox.MAX_ATTEMPTS:
+        logger.error("Giving up on bonus outbox row #%s for Sale #%s: %r", row.pk, row.sale_id, error)
+    else:
+        logger.warning("Bonus outbox row #%s for Sale #%s failed: %r", row.pk, row.sale_id, error)
+    return available_at
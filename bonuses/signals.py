@@ -1,57 +1,43 @@
-import logging
-from django.db.models import F
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 from conversions.models import Sale
-from .models import BonusLedger
-from .engine import evaluate_bonus
-
-logger = logging.getLogger(__name__)
+from .models import BonusRule, BonusOutbox
+from .engine import invalidate_rule_cache
 
 
 @receiver(post_save, sender=Sale)
-def award_bonus_on_sale(sender, instance, created, **kwargs):
-    """Award bonus when a Sale is created or updated with status 'completed'."""
-    if instance.status != 'completed':
+def queue_bonus_on_sale(sender, instance, created, raw=False, **kwargs):
+    """
+    Record the sale's bonus work in the outbox, in the sale's own transaction.
+
+    A sale saved as completed gets its bonus awarded and counted in the
+    KPIs; a sale loaded as completed and saved with another status
+    (cancelled, refunded, ...) is taken back out of the KPIs; completing it
+    again counts it again with its recorded bonus. The work itself is done
+    by drain_bonus_outbox, which is kicked once the transaction commits
+    (and periodically by celery beat).
+    """
+    from .tasks import schedule_outbox_drain
+
+    if raw:
         return
-    if BonusLedger.objects.filter(sale=instance).exists():
+    loaded_status = getattr(instance, '_loaded_status', None)
+    if instance.status == 'completed':
+        if loaded_status == 'completed':
+            return
+        known = created or hasattr(instance, '_loaded_status')
+        event = BonusOutbox.COMPLETED if known else BonusOutbox.AWARD
+    elif loaded_status == 'completed':
+        event = BonusOutbox.REVERSED
+    else:
         return
+    BonusOutbox.objects.create(tenant_id=instance.tenant_id, sale=instance, event=event)
+    schedule_outbox_drain()
 
-    try:
-        rule, amount, detail = evaluate_bonus(instance)
-        BonusLedger.objects.create(
-            tenant=instance.tenant,
-            sale=instance,
-            agent=instance.agent,
-            rule=rule,
-            bonus_amount=amount,
-            calculation_detail=detail,
-        )
-        _update_agent_daily_kpi(instance, amount)
-        logger.info("Bonus %s awarded for Sale #%s (rule: %s)", amount, instance.id, rule)
-    except Exception:
-        logger.exception("Failed to award bonus for Sale #%s", instance.id)
-
-
-def _update_agent_daily_kpi(sale, bonus_amount):
-    """Increment KPIAgentDaily counters for the sale's agent on the sale date."""
-    from analytics.models import KPIAgentDaily
 
-    kpi_date = sale.sold_at.date()
-    obj, created = KPIAgentDaily.objects.get_or_create(
-        tenant=sale.tenant,
-        agent=sale.agent,
-        kpi_date=kpi_date,
-        defaults={
-            'bonus_amount': bonus_amount,
-            'revenue_amount': sale.amount,
-            'leads_converted': 1,
-        },
-    )
-    if not created:
-        KPIAgentDaily.objects.filter(pk=obj.pk).update(
-            bonus_amount=F('bonus_amount') + bonus_amount,
-            revenue_amount=F('revenue_amount') + sale.amount,
-            leads_converted=F('leads_converted') + 1,
-        )
+@receiver(post_save, sender=BonusRule)
+@receiver(post_delete, sender=BonusRule)
+def invalidate_compiled_rules(sender, instance, **kwargs):
+    """Recompile the tenant's bonus rules on the next evaluation."""
+    invalidate_rule_cache(instance.tenant_id)
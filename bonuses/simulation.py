@@ -0,0 +1,344 @@
+"""
+What-if bonus simulation: what would a changed rule set have paid for a
+past period, compared with what was recorded in the BonusLedger?
+
+The period's completed sales are loaded once into integer columns (amounts
+in cents, timestamps and durations in microseconds, product codes as small
+ints). Each candidate rule is then applied as one pass over the sales that
+no earlier rule matched, so evaluation costs a comparison per sale per
+rule instead of an evaluate_bonus call per sale. Matching and amounts
+follow bonuses.engine exactly (first matching rule by id, rules in effect
+at each sale's sold_at, 10% default, percentages rounded half-even to
+cents and fixed amounts rounded as the ledger stores them).
+"""
+import datetime
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+from functools import partial
+from operator import eq, ne, lt, le, gt, ge
+
+from django.db.models import BigIntegerField, F, Func
+from django.db.models.functions import Cast
+from rest_framework.exceptions import ValidationError
+
+from .engine import CompiledRule
+from .models import BonusRule
+
+LOAD_CHUNK_SIZE = 20000
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# value <op> bound, written as partial(op', bound)(value)
+_BOUND_TESTS = {'EQ': eq, 'NEQ': ne, 'GT': lt, 'GTE': le, 'LT': gt, 'LTE': ge}
+
+
+class SaleColumns:
+    """
+    Completed sales of a period as parallel columns, ordered by sale id.
+    lead_created_at and recorded hold None where the sale has no lead or
+    no BonusLedger entry.
+    """
+    __slots__ = (
+        'sale_ids', 'agent_ids', 'amounts', 'sold_at', 'lead_created_at',
+        'products', 'product_codes', 'recorded', '_lead_deltas',
+    )
+
+    def __init__(self):
+        self.sale_ids = array('q')
+        self.agent_ids = array('q')
+        self.amounts = array('q')
+        self.sold_at = array('q')
+        self.lead_created_at = []
+        self.products = array('l')
+        self.product_codes = {}
+        self.recorded = []
+        self._lead_deltas = None
+
+    def __len__(self):
+        return len(self.sale_ids)
+
+    @property
+    def lead_deltas(self):
+        """Lead-to-sale durations in microseconds (None without a lead)."""
+        if self._lead_deltas is None:
+            self._lead_deltas = [
+                None if created is None else sold - created
+                for sold, created in zip(self.sold_at, self.lead_created_at)
+            ]
+        return self._lead_deltas
+
+
+def _cents(expression):
+    return Cast(expression * 100, BigIntegerField())
+
+
+def _epoch_us(expression):
+    return Func(
+        expression, template='(EXTRACT(EPOCH FROM %(expressions)s) * 1000000)::bigint',
+        output_field=BigIntegerField(),
+    )
+
+
+def to_epoch_us(value):
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def load_sale_columns(tenant_id, date_from, date_to):
+    """Load the tenant's completed sales sold in [date_from, date_to]."""
+    from conversions.models import Sale
+
+    rows = Sale.objects.filter(
+        tenant_id=tenant_id, status='completed',
+        sold_at__date__gte=date_from, sold_at__date__lte=date_to,
+    ).order_by('id').values_list(
+        'id', 'agent_id', _cents(F('amount')), _epoch_us(F('sold_at')),
+        _epoch_us(F('lead__created_at')), 'product__code', _cents(F('bonus_ledger__bonus_amount')),
+    )
+
+    columns = SaleColumns()
+    codes = columns.product_codes
+    for sale_id, agent_id, amount, sold_at, lead_created_at, code, recorded in rows.iterator(LOAD_CHUNK_SIZE):
+        columns.sale_ids.append(sale_id)
+        columns.agent_ids.append(agent_id)
+        columns.amounts.append(amount)
+        columns.sold_at.append(sold_at)
+        columns.lead_created_at.append(lead_created_at)
+        columns.products.append(codes.setdefault(code, len(codes)))
+        columns.recorded.append(recorded)
+    return columns
+
+
+def candidate_rules(tenant_id, changes=()):
+    """
+    The tenant's rules with `changes` applied in memory, as compiled rules
+    in evaluation order. Each change is a dict of BonusRule fields: with an
+    'id' it overrides fields of that rule ('is_active': false drops it),
+    without one it adds a rule evaluated after the existing ones. Nothing
+    is saved. Raises ValidationError for unknown ids or invalid fields.
+    """
+    from .serializers import BonusRuleSerializer
+
+    rules = {rule.pk: rule for rule in BonusRule.objects.filter(tenant_id=tenant_id).order_by('id')}
+    added = []
+    errors = {}
+    for position, change in enumerate(changes):
+        rule_id = change.get('id')
+        rule = BonusRule(tenant_id=tenant_id) if rule_id is None else rules.get(rule_id)
+        if rule is None:
+            errors[position] = {'id': ['Unknown bonus rule.']}
+            continue
+        serializer = BonusRuleSerializer(rule, data=change, partial=True)
+        if not serializer.is_valid():
+            errors[position] = serializer.errors
+            continue
+        for field, value in serializer.validated_data.items():
+            setattr(rule, field, value)
+        if rule_id is None:
+            added.append(rule)
+    if errors:
+        raise ValidationError({'rules': errors})
+
+    return [CompiledRule(rule) for rule in [*rules.values(), *added] if rule.is_active]
+
+
+def _round_half_even(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def _exact_cents(value):
+    """Bound in cents: an int when whole (fast to compare), else the exact Decimal."""
+    cents = value * 100
+    return int(cents) if cents == int(cents) else cents
+
+
+def _to_cents(value):
+    """Cents of an amount, rounded half away from zero as the ledger's numeric(18, 2) stores it."""
+    return int(Decimal(value).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def _bound_test(op, low, high):
+    """A one-argument test for `value <op> low` (BETWEEN: low <= value <= high), or None."""
+    if low is None:
+        return None
+    if op == 'BETWEEN':
+        return None if high is None else (lambda value: low <= value <= high)
+    test = _BOUND_TESTS.get(op)
+    return partial(test, low) if test else None
+
+
+def _rule_test(rule, columns):
+    """
+    (column, test, needs_lead) for a rule, mirroring engine._rule_matches;
+    None when the rule can match no sale.
+    """
+    dim, op = rule.dimension, rule.operator
+
+    if dim == 'SELL_AMOUNT':
+        low = None if rule.num_from is None else _exact_cents(rule.num_from)
+        high = None if rule.num_to is None else _exact_cents(rule.num_to)
+        test = _bound_test(op, low, high)
+        return test and (columns.amounts, test, False)
+
+    if dim == 'POTENTIAL_PRODUCT':
+        ids = frozenset(
+            index for code, index in columns.product_codes.items() if code in rule.text_values
+        )
+        if op in ('IN', 'EQ'):
+            return columns.products, ids.__contains__, False
+        if op in ('NOT_IN', 'NEQ'):
+            return columns.products, (lambda value: value not in ids), False
+        return None
+
+    if dim == 'LEAD_TO_SELL_DELTA':
+        if op in ('EQ', 'NEQ'):
+            return None
+        low = None if rule.interval_from is None else rule.interval_from // _MICROSECOND
+        high = None if rule.interval_to is None else rule.interval_to // _MICROSECOND
+        test = _bound_test(op, low, high)
+        return test and (columns.lead_deltas, test, True)
+
+    if dim in ('SELL_TIME', 'LEAD_TIME'):
+        if op in ('EQ', 'NEQ'):
+            return None
+        low = None if rule.ts_from is None else to_epoch_us(rule.ts_from)
+        high = None if rule.ts_to is None else to_epoch_us(rule.ts_to)
+        test = _bound_test(op, low, high)
+        if dim == 'SELL_TIME':
+            return test and (columns.sold_at, test, False)
+        return test and (columns.lead_created_at, test, True)
+
+    return None
+
+
+def _amount_calculator(rule):
+    """Return a function of the sale amount in cents giving the bonus in cents."""
+    if rule.amount_type == 'percent_of_sale':
+        # amount_value has at most 4 decimal places: cents * value% in 1/1e6 cents
+        scaled = int((rule.amount_value or 0) * 10000)
+        cap = _to_cents(rule.cap_amount) if rule.cap_amount else None
+
+        def percent(cents):
+            bonus = _round_half_even(cents * scaled, 1000000)
+            return cap if cap is not None and bonus > cap else bonus
+        return percent
+
+    fixed = _to_cents(rule.amount_value or 0)
+    return lambda cents: fixed
+
+
+def evaluate_columns(columns, rules, indices=None):
+    """
+    Evaluate compiled rules over the sales at `indices` (default: all).
+
+    Returns (bonus, matched): per-sale bonus in cents and the index into
+    `rules` of the rule that paid it (-1 for the 10% default). Sales outside
+    `indices` are left at 0 / -1.
+    """
+    size = len(columns)
+    bonus = array('q', bytes(8 * size))
+    matched = array('l', [-1]) * size
+    paid = bytearray(size)
+    remaining = list(range(size)) if indices is None else list(indices)
+    amounts, sold_at = columns.amounts, columns.sold_at
+
+    for position, rule in enumerate(rules):
+        if not remaining:
+            break
+        spec = _rule_test(rule, columns)
+        if spec is None:
+            continue
+        column, test, needs_lead = spec
+
+        candidates = remaining
+        if rule.effective_from or rule.effective_to:
+            low = to_epoch_us(rule.effective_from) if rule.effective_from else None
+            high = to_epoch_us(rule.effective_to) if rule.effective_to else None
+            candidates = [
+                i for i in candidates
+                if (low is None or sold_at[i] >= low) and (high is None or sold_at[i] <= high)
+            ]
+        if needs_lead:
+            candidates = [i for i in candidates if column[i] is not None]
+        hits = [i for i in candidates if test(column[i])]
+        if not hits:
+            continue
+
+        calculate = _amount_calculator(rule)
+        for i in hits:
+            bonus[i] = calculate(amounts[i])
+            matched[i] = position
+            paid[i] = 1
+        remaining = [i for i in remaining if not paid[i]]
+
+    for i in remaining:
+        bonus[i] = _round_half_even(amounts[i] * 10, 100)
+    return bonus, matched
+
+
+def _decimal(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def simulate_bonuses(tenant_id, date_from, date_to, changes=()):
+    """
+    Compare what the tenant's rules with `changes` applied (see
+    candidate_rules) would have paid for the completed sales sold in
+    [date_from, date_to] against the recorded bonuses. Sales without a
+    BonusLedger entry are baselined with the current rules at sale time,
+    as the audit report shows them.
+
+    Returns a dict of totals (Decimal), per-agent rows sorted by delta
+    (largest increase first) and per-rule matches of the candidate rules
+    (rule None is the 10% default).
+    """
+    proposed_rules = candidate_rules(tenant_id, changes)
+    columns = load_sale_columns(tenant_id, date_from, date_to)
+    proposed, matched = evaluate_columns(columns, proposed_rules)
+
+    unrecorded = [i for i, cents in enumerate(columns.recorded) if cents is None]
+    current = array('q', (cents or 0 for cents in columns.recorded))
+    if unrecorded:
+        baseline, _ = evaluate_columns(columns, candidate_rules(tenant_id), indices=unrecorded)
+        for i in unrecorded:
+            current[i] = baseline[i]
+
+    agents = {}
+    rule_sales = [0] * (len(proposed_rules) + 1)
+    rule_totals = [0] * (len(proposed_rules) + 1)
+    # matched is -1 for the default, which lands in the last slot
+    for agent_id, now_cents, new_cents, position in zip(columns.agent_ids, current, proposed, matched):
+        totals = agents.get(agent_id)
+        if totals is None:
+            totals = agents[agent_id] = [0, 0, 0]
+        totals[0] += 1
+        totals[1] += now_cents
+        totals[2] += new_cents
+        rule_sales[position] += 1
+        rule_totals[position] += new_cents
+
+    current_total, proposed_total = sum(current), sum(proposed)
+    return {
+        'sales': len(columns),
+        'unrecorded_sales': len(unrecorded),
+        'current_total': _decimal(current_total),
+        'proposed_total': _decimal(proposed_total),
+        'delta': _decimal(proposed_total - current_total),
+        'agents': [
+            {
+                'agent_id': agent_id, 'sales': count,
+                'current': _decimal(now_cents), 'proposed': _decimal(new_cents),
+                'delta': _decimal(new_cents - now_cents),
+            }
+            for agent_id, (count, now_cents, new_cents) in sorted(
+                agents.items(), key=lambda item: (item[1][1] - item[1][2], item[0]),
+            )
+        ],
+        'rules': [
+            {'rule': rule.rule if rule else None, 'sales': count, 'proposed': _decimal(total)}
+            for rule, count, total in zip([*proposed_rules, None], rule_sales, rule_totals)
+        ],
+    }
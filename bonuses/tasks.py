@@ -0,0 +1,53 @@
+import logging
+import time
+
+from celery import shared_task
+from django.db import transaction
+
+from .services import drain_bonus_outbox
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 4
+RETRY_BACKOFF = 15  # seconds before the first retry, doubled on each attempt
+# Seconds to stop kicking drains after the broker could not be reached; the
+# periodic drain (or drain_bonus_outbox --loop) picks the rows up meanwhile
+BROKER_DOWN_BACKOFF = 60
+
+_broker_down_until = 0
+
+
+def schedule_outbox_drain():
+    """Kick a drain once the current transaction commits, at most once per transaction."""
+    connection = transaction.get_connection()
+    if any(func is enqueue_outbox_drain for _, func, _ in connection.run_on_commit):
+        return
+    transaction.on_commit(enqueue_outbox_drain)
+
+
+def enqueue_outbox_drain():
+    """
+    Queue a drain of the bonus outbox (used as a transaction.on_commit
+    callback). A failed publish is not retried, and after a failure no drain is
+    queued for BROKER_DOWN_BACKOFF seconds, so sale writes do not wait on an
+    unreachable broker.
+    """
+    global _broker_down_until
+    if time.monotonic() < _broker_down_until:
+        return
+    try:
+        drain_bonus_outbox_task.apply_async(retry_policy={'max_retries': 0})
+    except Exception as e:
+        _broker_down_until = time.monotonic() + BROKER_DOWN_BACKOFF
+        logger.error(f"Failed to enqueue bonus outbox drain: {e}")
+
+
+@shared_task(bind=True, max_retries=MAX_RETRIES, acks_late=True)
+def drain_bonus_outbox_task(self):
+    """Apply every pending bonus outbox row."""
+    try:
+        drain_bonus_outbox()
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=RETRY_BACKOFF * (2 ** self.request.retries))
+        logger.error(f"Bonus outbox drain failed: {e}")
@@ -1,3 +1,744 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from posightful.testing import TenantFixtureMixin
+from tenancy.models import Customer, Product
+from conversions.models import Sale
+from leads.models import Lead
+from analytics.models import KPIAgentDaily
+from bonuses import services, tasks
+from bonuses.models import BonusRule, BonusLedger, BonusOutbox
+from bonuses.engine import evaluate_bonus, evaluate_bonuses, get_rule_set, invalidate_rule_cache
+from bonuses.services import OUTBOX_LOCK_ID, award_bonuses, drain_bonus_outbox
+from bonuses.simulation import candidate_rules, evaluate_columns, load_sale_columns, simulate_bonuses
+from bonuses.tasks import drain_bonus_outbox_task, enqueue_outbox_drain
+
+
+class BonusTestMixin(TenantFixtureMixin):
+
+    def _setup_tenant(self):
+        invalidate_rule_cache()
+        super()._setup_tenant()
+        self.user = self._create_user("agent")
+        self.agent = self._create_agent(user=self.user)
+        self.customer = Customer.objects.create(tenant=self.tenant, full_name="Customer")
+        self.terminal = Product.objects.create(tenant=self.tenant, code="POS-TERM", name="POS Terminal")
+        self.service = Product.objects.create(tenant=self.tenant, code="SVC-INST", name="Installation")
+
+    def _create_rule(self, **kwargs):
+        defaults = {
+            'tenant': self.tenant, 'name': 'Rule', 'is_active': True,
+            'amount_type': 'fixed', 'amount_value': Decimal('100'),
+        }
+        defaults.update(kwargs)
+        return BonusRule.objects.create(**defaults)
+
+    def _build_sale(self, amount='1000', product=None, **kwargs):
+        return Sale(
+            tenant=self.tenant, agent=self.agent, customer=self.customer,
+            product=product or self.service, amount=Decimal(amount),
+            status='pending', sold_at=timezone.now(), **kwargs
+        )
+
+
+class EvaluateBonusTest(BonusTestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+
+    def test_default_fallback_is_ten_percent(self):
+        rule, amount, detail = evaluate_bonus(self._build_sale('1234.50'))
+        self.assertIsNone(rule)
+        self.assertEqual(amount, Decimal('123.45'))
+
+    def test_sell_amount_percent_rule_with_cap(self):
+        high = self._create_rule(
+            name='High', rule_dimension='SELL_AMOUNT', operator='GTE',
+            num_from=Decimal('5000'), amount_type='percent_of_sale',
+            amount_value=Decimal('15'), cap_amount=Decimal('1000'),
+        )
+        rule, amount, detail = evaluate_bonus(self._build_sale('9000'))
+        self.assertEqual(rule, high)
+        self.assertEqual(amount, Decimal('1000'))
+        self.assertIn('capped', detail)
+
+    def test_in_list_is_parsed_with_whitespace(self):
+        premium = self._create_rule(
+            name='Premium', rule_dimension='POTENTIAL_PRODUCT', operator='IN',
+            text_values='POS-TERM, PAY-PRO',
+        )
+        rule, _, _ = evaluate_bonus(self._build_sale(product=self.terminal))
+        self.assertEqual(rule, premium)
+        rule, _, _ = evaluate_bonus(self._build_sale(product=self.service))
+        self.assertIsNone(rule)
+
+    def test_rule_outside_effective_window_is_skipped(self):
+        now = timezone.now()
+        self._create_rule(
+            name='Future', rule_dimension='SELL_AMOUNT', operator='GTE',
+            num_from=Decimal('0'), effective_from=now + datetime.timedelta(days=1),
+        )
+        self._create_rule(
+            name='Expired', rule_dimension='SELL_AMOUNT', operator='GTE',
+            num_from=Decimal('0'), effective_to=now - datetime.timedelta(days=1),
+        )
+        rule, _, _ = evaluate_bonus(self._build_sale())
+        self.assertIsNone(rule)
+
+    def test_first_matching_rule_by_id_wins(self):
+        first = self._create_rule(name='First', rule_dimension='SELL_AMOUNT', operator='GT', num_from=Decimal('10'))
+        self._create_rule(name='Second', rule_dimension='SELL_AMOUNT', operator='GT', num_from=Decimal('1'))
+        rule, _, _ = evaluate_bonus(self._build_sale())
+        self.assertEqual(rule, first)
+
+
+class CompiledRuleCacheTest(BonusTestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        self.rule = self._create_rule(
+            name='Amount', rule_dimension='SELL_AMOUNT', operator='GTE', num_from=Decimal('500'),
+        )
+
+    def test_rules_are_compiled_once_per_tenant(self):
+        evaluate_bonus(self._build_sale())
+        with self.assertNumQueries(0):
+            for _ in range(5):
+                evaluate_bonus(self._build_sale())
+
+    def test_saving_rule_invalidates_cache(self):
+        self.assertEqual(evaluate_bonus(self._build_sale())[0], self.rule)
+        self.rule.num_from = Decimal('5000')
+        self.rule.save()
+        self.assertIsNone(evaluate_bonus(self._build_sale())[0])
+
+    def test_deleting_rule_invalidates_cache(self):
+        get_rule_set(self.tenant.id)
+        self.rule.delete()
+        self.assertEqual(get_rule_set(self.tenant.id).rules, ())
+
+    def test_window_boundaries_are_respected(self):
+        now = timezone.now()
+        self.rule.effective_from = now - datetime.timedelta(days=10)
+        self.rule.effective_to = now - datetime.timedelta(days=5)
+        self.rule.save()
+        rule_set = get_rule_set(self.tenant.id)
+        self.assertEqual(rule_set.effective_at(now), ())
+        self.assertEqual(len(rule_set.effective_at(now - datetime.timedelta(days=7))), 1)
+        self.assertEqual(len(rule_set.effective_at(self.rule.effective_to)), 1)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class AwardBonusSignalTest(BonusTestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+
+    def test_completed_sale_creates_ledger_entry(self):
+        sale = self._build_sale('2000')
+        sale.status = 'completed'
+        with self.captureOnCommitCallbacks() as callbacks:
+            sale.save()
+        self.assertFalse(BonusLedger.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        ledger = BonusLedger.objects.get(sale=sale)
+        self.assertEqual(ledger.bonus_amount, Decimal('200.00'))
+        self.assertEqual(ledger.agent, self.agent)
+        self.assertFalse(BonusOutbox.objects.exists())
+
+    def test_saving_a_sale_only_writes_an_outbox_row(self):
+        sale = self._build_sale('2000')
+        sale.status = 'completed'
+        # Savepoint, sale insert, outbox insert, release
+        with self.assertNumQueries(4):
+            sale.save()
+        self.assertEqual(list(BonusOutbox.objects.values_list('sale_id', 'event')), [(sale.id, 'completed')])
+
+    def test_drain_is_kicked_once_per_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                for amount in ('1000', '2000', '3000'):
+                    sale = self._build_sale(amount)
+                    sale.status = 'completed'
+                    sale.save()
+        self.assertEqual(callbacks.count(enqueue_outbox_drain), 1)
+
+    def test_unreachable_broker_is_not_retried_on_every_sale(self):
+        self.addCleanup(setattr, tasks, '_broker_down_until', 0)
+        with patch.object(tasks.drain_bonus_outbox_task, 'apply_async',
+                          side_effect=ConnectionRefusedError) as publish:
+            tasks.enqueue_outbox_drain()
+            tasks.enqueue_outbox_drain()
+        publish.assert_called_once_with(retry_policy={'max_retries': 0})
+
+
+class BonusOutboxDrainTest(BonusTestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+
+    def _complete(self, amount='1000'):
+        sale = self._build_sale(amount)
+        sale.status = 'completed'
+        sale.save()
+        return sale
+
+    def _daily(self):
+        return KPIAgentDaily.objects.get(agent=self.agent)
+
+    def test_status_changes_are_applied_in_order(self):
+        sale = self._complete('1000')
+        sale.status = 'cancelled'
+        sale.save()
+        sale.status = 'completed'
+        sale.save()
+        self.assertEqual(
+            list(BonusOutbox.objects.order_by('id').values_list('event', flat=True)),
+            ['completed', 'reversed', 'completed'],
+        )
+
+        self.assertEqual(drain_bonus_outbox(), (3, 0))
+
+        self.assertEqual(BonusLedger.objects.get().bonus_amount, Decimal('100.00'))
+        daily = self._daily()
+        self.assertEqual(daily.leads_converted, 1)
+        self.assertEqual(daily.bonus_amount, Decimal('100.00'))
+        self.assertFalse(BonusOutbox.objects.exists())
+
+    def test_query_count_does_not_grow_with_events(self):
+        get_rule_set(self.tenant.id)
+        # Advisory try-lock, outbox page, ledger insert, shared KPI lock, KPI
+        # daily and rollup upserts, outbox delete, plus three savepoint pairs
+        for count in (2, 30):
+            for _ in range(count):
+                self._complete()
+            with self.assertNumQueries(15):
+                self.assertEqual(drain_bonus_outbox(), (count, 0))
+
+    def _drain_with_broken_sale(self, broken):
+        real_evaluate = services.evaluate_bonuses
+
+        def evaluate(sales, **kwargs):
+            if any(sale.pk == broken.pk for sale in sales):
+                raise ValueError('bad rule')
+            return real_evaluate(sales, **kwargs)
+
+        with patch('bonuses.services.evaluate_bonuses', side_effect=evaluate):
+            return services.drain_bonus_outbox()
+
+    def test_retry_after_failed_batch_records_healthy_sales(self):
+        healthy = self._complete('2000')
+        broken = self._complete('1000')
+
+        self.assertEqual(self._drain_with_broken_sale(broken), (1, 1))
+
+        self.assertEqual(BonusLedger.objects.get().sale_id, healthy.pk)
+        daily = self._daily()
+        self.assertEqual(daily.leads_converted, 1)
+        self.assertEqual(daily.bonus_amount, Decimal('200.00'))
+        self.assertEqual(list(BonusOutbox.objects.values_list('sale_id', flat=True)), [broken.pk])
+
+    def test_retry_reverses_the_bonus_awarded_earlier_in_the_batch(self):
+        healthy = self._complete('2000')
+        healthy.status = 'cancelled'
+        healthy.save()
+        broken = self._complete('1000')
+
+        self.assertEqual(self._drain_with_broken_sale(broken), (2, 1))
+
+        self.assertEqual(BonusLedger.objects.get().sale_id, healthy.pk)
+        daily = self._daily()
+        self.assertEqual(daily.leads_converted, 0)
+        self.assertEqual(daily.revenue_amount, Decimal('0'))
+        self.assertEqual(daily.bonus_amount, Decimal('0'))
+        self.assertEqual(daily.net_profit, Decimal('0'))
+
+    def test_failed_event_is_rescheduled_and_holds_back_its_sale(self):
+        broken, other = self._complete('1000'), self._complete('2000')
+        broken.status = 'cancelled'
+        broken.save()
+        real_evaluate = services.evaluate_bonuses
+
+        def evaluate(sales, **kwargs):
+            if sales[0].pk == broken.pk:
+                raise ValueError('bad rule')
+            return real_evaluate(sales, **kwargs)
+
+        with patch('bonuses.services.evaluate_bonuses', side_effect=evaluate):
+            self.assertEqual(services.drain_bonus_outbox(), (1, 1))
+
+        self.assertEqual(list(BonusLedger.objects.values_list('sale_id', flat=True)), [other.pk])
+        waiting = list(BonusOutbox.objects.order_by('id'))
+        self.assertEqual([row.event for row in waiting], ['completed', 'reversed'])
+        self.assertEqual([row.attempts for row in waiting], [1, 0])
+        self.assertIn('bad rule', waiting[0].last_error)
+        self.assertEqual(waiting[0].available_at, waiting[1].available_at)
+        self.assertGreater(waiting[0].available_at, timezone.now())
+        self.assertEqual(services.drain_bonus_outbox(), (0, 0))
+
+        # A later event of the sale waits for the rescheduled one as well
+        broken.status = 'completed'
+        broken.save()
+        self.assertEqual(services.drain_bonus_outbox(), (0, 0))
+        self.assertEqual(BonusOutbox.objects.count(), 3)
+
+        BonusOutbox.objects.update(available_at=timezone.now())
+        self.assertEqual(services.drain_bonus_outbox(), (3, 0))
+        daily = self._daily()
+        self.assertEqual(daily.leads_converted, 2)
+        self.assertEqual(daily.revenue_amount, Decimal('3000'))
+
+    def test_rules_are_taken_as_in_effect_at_sale_time(self):
+        sale = self._complete('1000')
+        # Created after the sale, while its outbox row was still pending
+        self._create_rule(
+            name='Late', rule_dimension='SELL_AMOUNT', operator='GTE', num_from=Decimal('0'),
+            amount_value=Decimal('999'), effective_from=sale.sold_at + datetime.timedelta(microseconds=1),
+        )
+
+        drain_bonus_outbox()
+
+        ledger = BonusLedger.objects.get()
+        self.assertIsNone(ledger.rule)
+        self.assertEqual(ledger.bonus_amount, Decimal('100.00'))
+
+    def test_drain_leaves_rows_to_the_worker_holding_the_lock(self):
+        self._complete()
+        other = connections.create_connection('default')
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_lock(%s)', [OUTBOX_LOCK_ID])
+                self.assertEqual(drain_bonus_outbox(), (0, 0))
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [OUTBOX_LOCK_ID])
+        finally:
+            other.close()
+
+        self.assertEqual(drain_bonus_outbox(), (1, 0))
+
+    def test_beat_drains_periodically(self):
+        entry = settings.CELERY_BEAT_SCHEDULE['drain-bonus-outbox']
+        self.assertEqual(entry['task'], drain_bonus_outbox_task.name)
+
+    def test_command_drains_outbox(self):
+        self._complete()
+        out = StringIO()
+        call_command('drain_bonus_outbox', stdout=out)
+        self.assertIn('Applied 1 bonus outbox events', out.getvalue())
+        self.assertTrue(BonusLedger.objects.exists())
+
+
+class AwardBonusesBatchTest(BonusTestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        self._create_rule(
+            name='High', rule_dimension='SELL_AMOUNT', operator='GTE',
+            num_from=Decimal('5000'), amount_type='fixed', amount_value=Decimal('500'),
+        )
+        self.day = timezone.now() - datetime.timedelta(days=3)
+
+    def _bulk_sales(self, amounts, status='completed'):
+        return Sale.objects.bulk_create([
+            Sale(
+                tenant=self.tenant, agent=self.agent, customer=self.customer,
+                product=self.service, amount=Decimal(a), status=status, sold_at=self.day,
+            )
+            for a in amounts
+        ])
+
+    def test_bulk_loaded_sales_get_ledger_and_kpi(self):
+
+        self._bulk_sales(['6000', '1000', '2000'])
+        self._bulk_sales(['9000'], status='cancelled')
+
+        count, total = award_bonuses(Sale.objects.filter(tenant=self.tenant))
+
+        self.assertEqual(count, 3)
+        self.assertEqual(total, Decimal('800.00'))
+        self.assertEqual(BonusLedger.objects.count(), 3)
+        kpi = KPIAgentDaily.objects.get(agent=self.agent, kpi_date=self.day.date())
+        self.assertEqual(kpi.leads_converted, 3)
+        self.assertEqual(kpi.revenue_amount, Decimal('9000'))
+        self.assertEqual(kpi.bonus_amount, Decimal('800'))
+
+    def test_rerun_skips_sales_with_ledger(self):
+
+        self._bulk_sales(['6000', '1000'])
+        award_bonuses(Sale.objects.all())
+        self.assertEqual(award_bonuses(Sale.objects.all()), (0, Decimal('0')))
+        self.assertEqual(BonusLedger.objects.count(), 2)
+
+    def test_sales_queued_in_the_outbox_are_left_to_the_drain(self):
+
+        sale = self._build_sale('6000')
+        sale.status = 'completed'
+        sale.save()
+
+        self.assertEqual(award_bonuses(Sale.objects.all()), (0, Decimal('0')))
+        drain_bonus_outbox()
+
+        self.assertEqual(BonusLedger.objects.get().sale, sale)
+        kpi = KPIAgentDaily.objects.get(agent=self.agent)
+        self.assertEqual(kpi.leads_converted, 1)
+        self.assertEqual(kpi.bonus_amount, Decimal('500'))
+
+    def test_sales_recorded_meanwhile_are_skipped_and_not_counted(self):
+
+        first, *_ = self._bulk_sales(['6000', '1000', '2000'])
+        evaluate = services.evaluate_bonuses
+
+        def evaluate_after_concurrent_write(sales, **kwargs):
+            # Another writer records the first sale after the batch was read
+            BonusLedger.objects.create(
+                tenant=self.tenant, sale=first, agent=self.agent, bonus_amount=Decimal('1'),
+            )
+            return evaluate(sales, **kwargs)
+
+        with patch.object(services, 'evaluate_bonuses', evaluate_after_concurrent_write):
+            count, total = services.award_bonuses(Sale.objects.all(), update_kpis=False)
+
+        self.assertEqual((count, total), (2, Decimal('300.00')))
+        self.assertEqual(BonusLedger.objects.get(sale=first).bonus_amount, Decimal('1'))
+
+    def test_query_count_does_not_grow_with_sales(self):
+
+        self._bulk_sales(['6000'] * 3)
+        get_rule_set(self.tenant.id)
+        # Sales page, outbox lock, ledger re-check, ledger insert, shared KPI
+        # lock, one upsert per daily row and rollup, empty next page, plus
+        # savepoints
+        with self.assertNumQueries(14):
+            award_bonuses(Sale.objects.all())
+
+        # A different day, week and month, so every KPI row is inserted again
+        self.day -= datetime.timedelta(days=40)
+        self._bulk_sales(['6000'] * 40)
+        with self.assertNumQueries(14):
+            award_bonuses(Sale.objects.all())
+
+
+class BackfillBonusLedgerTest(BonusTestMixin, TestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        self.day = timezone.now() - datetime.timedelta(days=60)
+        # Only in effect after the historical sales were made
+        self._create_rule(
+            name='New', rule_dimension='SELL_AMOUNT', operator='GTE', num_from=Decimal('0'),
+            amount_value=Decimal('999'), effective_from=timezone.now() - datetime.timedelta(days=1),
+        )
+        Sale.objects.bulk_create([
+            Sale(
+                tenant=self.tenant, agent=self.agent, customer=self.customer,
+                product=self.service, amount=Decimal(a), status='completed', sold_at=self.day,
+            )
+            for a in ['1000', '2000', '3000']
+        ])
+
+    def _backfill(self, *args):
+
+        out = StringIO()
+        call_command("backfill_bonus_ledger", "--batch-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_backfill_uses_rules_at_sale_time_and_leaves_kpis(self):
+
+        output = self._backfill()
+
+        self.assertIn("2/3 (66%)", output)
+        self.assertIn("Backfilled 3 ledger entries totalling 600.00", output)
+        self.assertEqual(
+            sorted(BonusLedger.objects.values_list("bonus_amount", flat=True)),
+            [Decimal('100.00'), Decimal('200.00'), Decimal('300.00')],
+        )
+        self.assertFalse(KPIAgentDaily.objects.exists())
+
+    def test_rerun_is_a_no_op(self):
+        self._backfill()
+        self.assertIn("0 completed sales without a ledger entry", self._backfill())
+        self.assertEqual(BonusLedger.objects.count(), 3)
+
+    def test_since_filter(self):
+        self.assertIn("0 completed sales", self._backfill("--since", timezone.now().date().isoformat()))
+
+
+class MonthlyAuditExportTest(BonusTestMixin, APITestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.month = timezone.now().strftime("%Y-%m")
+        # One sale with a ledger entry (via the signal), one bulk-loaded without
+        sale = self._build_sale('2000')
+        sale.status = 'completed'
+        sale.save()
+        bulk_loaded = self._build_sale('500')
+        bulk_loaded.status = 'completed'
+        Sale.objects.bulk_create([bulk_loaded])
+
+    def _url(self):
+        return f"/api/bonuses/monthly/{self.month}/audit/"
+
+    def test_json_rows(self):
+        response = self.client.get(self._url())
+        bonuses = sorted(row["bonusAmount"] for row in response.data)
+        self.assertEqual(bonuses, [50.0, 200.0])
+
+    def test_csv_export_streams_same_rows(self):
+
+        response = self.client.get(self._url(), {"export": "csv"})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn(f"bonus-audit-{self.month}.csv", response["Content-Disposition"])
+        body = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual(sorted(float(row["bonusAmount"]) for row in rows), [50.0, 200.0])
+        self.assertEqual({row["agentCode"] for row in rows}, {"AG001"})
+
+    def test_ndjson_export(self):
+
+        response = self.client.get(self._url(), {"export": "ndjson"})
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(rows, self.client.get(self._url()).data)
+
+    def test_unrecorded_sales_are_evaluated_by_the_engine(self):
+        # Not yet in effect when the sales were made, so it must be ignored
+        self._create_rule(
+            name='Future', rule_dimension='SELL_AMOUNT', operator='GTE', num_from=Decimal('0'),
+            amount_value=Decimal('999'), effective_from=timezone.now() + datetime.timedelta(days=1),
+        )
+        self._create_rule(
+            name='Mid band', rule_dimension='SELL_AMOUNT', operator='BETWEEN',
+            num_from=Decimal('100'), num_to=Decimal('1000'), amount_value=Decimal('77'),
+        )
+
+        rows = {row["saleAmount"]: row for row in self.client.get(self._url()).data}
+
+        self.assertEqual(rows[500.0]["ruleName"], "Mid band")
+        self.assertEqual(rows[500.0]["bonusAmount"], 77.0)
+        self.assertEqual(rows[500.0]["calculation"], "Fixed 77.0000 bonus")
+        # The recorded ledger entry wins over today's rules
+        self.assertEqual(rows[2000.0]["bonusAmount"], 200.0)
+
+    def test_unknown_export_format(self):
+        response = self.client.get(self._url(), {"export": "xlsx"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unrecorded_sales_are_evaluated_in_one_call_per_chunk(self):
+
+        more = [self._build_sale(amount) for amount in ('10', '20', '30')]
+        for sale in more:
+            sale.status = 'completed'
+        Sale.objects.bulk_create(more)
+        sales = Sale.objects.select_related('bonus_ledger__rule', 'product', 'lead').order_by('id')
+
+        with patch.object(services, 'evaluate_bonuses', wraps=services.evaluate_bonuses) as evaluate:
+            entries = list(services.sale_bonuses(sales, chunk_size=3))
+
+        self.assertEqual([entry[0].pk for entry in entries], [sale.pk for sale in sales])
+        self.assertEqual([entry[2] for entry in entries], [
+            Decimal('200.00'), Decimal('50.00'), Decimal('1.00'), Decimal('2.00'), Decimal('3.00'),
+        ])
+        self.assertEqual(evaluate.call_count, 2)
+
+
+class BonusLedgerCursorPaginationTest(BonusTestMixin, APITestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        for amount in ['100', '200', '300']:
+            sale = self._build_sale(amount)
+            sale.status = 'completed'
+            sale.save()
+        drain_bonus_outbox()
+
+    def test_cursor_pages(self):
+        first = self.client.get("/api/bonuses/ledger/", {"pagination": "cursor", "page_size": 2})
+        second = self.client.get(first.data["next"])
+
+        amounts = [row["bonus_amount"] for row in first.data["results"] + second.data["results"]]
+        self.assertEqual(amounts, ["30.00", "20.00", "10.00"])
+        self.assertIsNone(second.data["next"])
+
+    def test_sales_cursor_pages(self):
+        response = self.client.get("/api/conversions/sales/", {"pagination": "cursor", "page_size": 5})
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertNotIn("count", response.data)
+
+
+class BonusSimulationTest(BonusTestMixin, APITestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.other = self._create_agent()
+        now = timezone.now()
+        self.rules = [
+            self._create_rule(
+                name="Mid", rule_dimension="SELL_AMOUNT", operator="BETWEEN",
+                num_from=Decimal("1000"), num_to=Decimal("5000"),
+                amount_type="percent_of_sale", amount_value=Decimal("5.0000"), cap_amount=Decimal("150"),
+            ),
+            self._create_rule(
+                name="Terminal", rule_dimension="POTENTIAL_PRODUCT", operator="IN",
+                text_values="POS-TERM, POS-MINI", amount_type="fixed", amount_value=Decimal("75.5"),
+            ),
+            self._create_rule(
+                name="Fast", rule_dimension="LEAD_TO_SELL_DELTA", operator="LT",
+                interval_from=datetime.timedelta(days=2), amount_type="fixed", amount_value=Decimal("40"),
+            ),
+            self._create_rule(
+                name="Old leads", rule_dimension="LEAD_TIME", operator="LT",
+                ts_from=now - datetime.timedelta(days=20), amount_type="percent_of_sale",
+                amount_value=Decimal("2.5"), effective_from=now - datetime.timedelta(days=40),
+            ),
+            self._create_rule(
+                name="Expired", rule_dimension="SELL_TIME", operator="GTE",
+                ts_from=now - datetime.timedelta(days=60), amount_type="fixed", amount_value=Decimal("999"),
+                effective_to=now - datetime.timedelta(days=30),
+            ),
+        ]
+        # amount, product, agent, lead age and sale age in days (None: no lead)
+        cases = [
+            ("1234.25", self.service, self.agent, 5, 1), ("6000", self.service, self.agent, 1, 0),
+            ("900", self.terminal, self.agent, None, 3), ("900.05", self.service, self.other, None, 25),
+            ("800", self.service, self.other, 30, 10), ("800", self.service, self.other, 50, 45),
+            ("5000", self.terminal, self.other, 3, 2), ("250.35", self.service, self.agent, 12, 2),
+        ]
+        sales = []
+        for amount, product, agent, lead_age, sale_age in cases:
+            lead = None
+            if lead_age is not None:
+                lead = Lead.objects.create(tenant=self.tenant, agent=agent, customer=self.customer)
+                Lead.objects.filter(pk=lead.pk).update(created_at=now - datetime.timedelta(days=lead_age))
+            sale = self._build_sale(amount, product=product, lead=lead)
+            sale.agent = agent
+            sale.status = "completed"
+            sale.sold_at = now - datetime.timedelta(days=sale_age, hours=1)
+            sales.append(sale)
+        self.sales = Sale.objects.bulk_create(sales)
+        award_bonuses(Sale.objects.all(), at_sale_time=True)
+        self.period = ((now - datetime.timedelta(days=90)).date(), now.date())
+
+    def test_columns_match_engine_at_sale_time(self):
+
+        columns = load_sale_columns(self.tenant.id, *self.period)
+        rules = candidate_rules(self.tenant.id)
+        bonus, matched = evaluate_columns(columns, rules)
+
+        sales = Sale.objects.filter(pk__in=columns.sale_ids).select_related("product", "lead").order_by("id")
+        expected = [(rule.id if rule else None, amount) for _, rule, amount, _ in evaluate_bonuses(sales, at_sale_time=True)]
+        simulated = [
+            (rules[position].rule.id if position >= 0 else None, Decimal(cents).scaleb(-2))
+            for cents, position in zip(bonus, matched)
+        ]
+        self.assertEqual(len(simulated), len(self.sales))
+        self.assertEqual(simulated, expected)
+        # Every rule pays somewhere, and so does the default
+        self.assertEqual({rule_id for rule_id, _ in simulated}, {rule.id for rule in self.rules} | {None})
+
+    def test_fixed_amount_with_sub_cent_digits_matches_ledger(self):
+        terminal = self.rules[1]
+        terminal.amount_value = Decimal("10.0050")
+        terminal.save()
+        BonusLedger.objects.all().delete()
+        award_bonuses(Sale.objects.all(), at_sale_time=True)
+
+        columns = load_sale_columns(self.tenant.id, *self.period)
+        bonus, _ = evaluate_columns(columns, candidate_rules(self.tenant.id))
+
+        recorded = dict(BonusLedger.objects.values_list("sale_id", "bonus_amount"))
+        self.assertIn(Decimal("10.01"), recorded.values())
+        self.assertEqual([Decimal(cents).scaleb(-2) for cents in bonus], [recorded[pk] for pk in columns.sale_ids])
+        self.assertEqual(simulate_bonuses(self.tenant.id, *self.period)["delta"], Decimal("0"))
+
+    def test_unchanged_rules_have_no_delta(self):
+        BonusLedger.objects.filter(sale=self.sales[0]).delete()
+
+        result = simulate_bonuses(self.tenant.id, *self.period)
+
+        self.assertEqual(result["sales"], len(self.sales))
+        self.assertEqual(result["unrecorded_sales"], 1)
+        self.assertEqual(result["delta"], Decimal("0"))
+        self.assertEqual(result["current_total"], sum(BonusLedger.objects.values_list("bonus_amount", flat=True))
+                         + Decimal("61.71"))
+
+    def test_rule_changes_give_per_agent_deltas(self):
+        terminal, fast = self.rules[1], self.rules[2]
+
+        result = simulate_bonuses(self.tenant.id, *self.period, changes=[
+            {"id": terminal.id, "amount_value": "100"},
+            {"id": fast.id, "is_active": False},
+            {"name": "Big", "rule_dimension": "SELL_AMOUNT", "operator": "GTE", "num_from": "5500",
+             "amount_type": "fixed", "amount_value": "300"},
+        ])
+
+        # Terminal sales pay 24.50 more; the 6000 sale moves from Fast (40) to Big (300)
+        self.assertEqual(result["delta"], Decimal("24.50") + Decimal("260"))
+        deltas = {row["agent_id"]: row["delta"] for row in result["agents"]}
+        self.assertEqual(deltas, {self.agent.id: Decimal("284.50"), self.other.id: Decimal("0")})
+        self.assertEqual(result["agents"][0]["agent_id"], self.agent.id)
+        by_rule = {(row["rule"].name if row["rule"] else None): row["sales"] for row in result["rules"]}
+        self.assertEqual(by_rule["Big"], 1)
+        self.assertNotIn("Fast", by_rule)
+        # Nothing was saved
+        terminal.refresh_from_db()
+        self.assertEqual(terminal.amount_value, Decimal("75.5"))
+        self.assertFalse(BonusRule.objects.filter(name="Big").exists())
+
+    def test_endpoint(self):
+        response = self.client.post("/api/bonuses/simulate/", {
+            "date_from": str(self.period[0]), "date_to": str(self.period[1]),
+            "rules": [{"id": self.rules[1].id, "amount_value": "100"}],
+        }, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["delta"], 24.5)
+        self.assertEqual(response.data["agents"][0]["agentCode"], "AG001")
+        self.assertEqual(response.data["rules"][-1]["ruleName"], "Default (10%)")
+
+    def test_endpoint_rejects_invalid_changes(self):
+        url = "/api/bonuses/simulate/"
+        unknown = self.client.post(url, {
+            "date_from": str(self.period[0]), "date_to": str(self.period[1]), "rules": [{"id": 0}],
+        }, format="json")
+        self.assertEqual(unknown.status_code, 400)
+        self.assertIn("0", {str(key) for key in unknown.data["rules"]})
+
+        backwards = self.client.post(url, {"date_from": "2025-02-01", "date_to": "2025-01-01"}, format="json")
+        self.assertEqual(backwards.status_code, 400)
+
+    def test_command(self):
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump([{"id": self.rules[1].id, "amount_value": "100"}], f)
+            f.flush()
+            out = StringIO()
+            call_command(
+                "simulate_bonus_rules", "--tenant", str(self.tenant.id),
+                "--since", str(self.period[0]), "--until", str(self.period[1]), "--rules", f.name, stdout=out,
+            )
+
+        self.assertIn(f"{len(self.sales)} completed sales", out.getvalue())
+        self.assertIn("delta +24.50", out.getvalue())
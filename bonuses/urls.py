@@ -9,6 +9,7 @@ router.register(r'ledger', views.BonusLedgerViewSet, basename='bonus-ledger')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('simulate/', views.simulate_bonuses_view, name='simulate-bonuses'),
     path('monthly/', views.monthly_bonuses_view, name='monthly-bonuses'),
     path('monthly/<str:month>/', views.monthly_bonus_detail_view, name='monthly-bonus-detail'),
     path('monthly/<str:month>/audit/', views.monthly_audit_view, name='monthly-audit'),
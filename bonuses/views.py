@@ -4,9 +4,11 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Sum, Count, Avg
-from django.db.models.functions import TruncMonth
+from posightful.pagination import CreatedAtCursorPagination
 from .models import CommissionPolicy, BonusRule, BonusLedger
-from .serializers import CommissionPolicySerializer, BonusRuleSerializer, BonusLedgerSerializer
+from .serializers import (
+    CommissionPolicySerializer, BonusRuleSerializer, BonusLedgerSerializer, BonusSimulationSerializer,
+)
 
 
 class TenantScopedViewSet(viewsets.ModelViewSet):
@@ -50,6 +52,7 @@ class BonusRuleViewSet(TenantScopedViewSet):
 class BonusLedgerViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = BonusLedgerSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['agent', 'rule']
     ordering_fields = ['created_at', 'bonus_amount']
@@ -76,16 +79,14 @@ class BonusLedgerViewSet(viewsets.ReadOnlyModelViewSet):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def monthly_bonuses_view(request):
-    """Group KPIAgentDaily by month, sum bonus_amount, count agents."""
-    from analytics.models import KPIAgentDaily
+    """Group the agent-monthly KPI rollup by month, sum bonus_amount, count agents."""
+    from analytics.models import KPIAgentMonthly
 
-    qs = KPIAgentDaily.objects.all()
+    qs = KPIAgentMonthly.objects.all()
     if request.user.tenant_id:
         qs = qs.filter(tenant=request.user.tenant)
 
-    monthly = qs.annotate(
-        month=TruncMonth('kpi_date')
-    ).values('month').annotate(
+    monthly = qs.values('month').annotate(
         totalBonus=Sum('bonus_amount'),
         agentCount=Count('agent', distinct=True),
     ).order_by('-month')[:12]
@@ -149,14 +150,70 @@ def monthly_bonus_detail_view(request, month):
     return Response(result)
 
 
+AUDIT_EXPORT_FIELDS = [
+    'id', 'agentName', 'agentCode', 'leadId', 'customerName', 'productName',
+    'saleAmount', 'saleDate', 'ruleName', 'ruleType', 'bonusAmount', 'calculation',
+]
+AUDIT_EXPORT_CHUNK_SIZE = 2000
+
+
+def _audit_row(sale, rule, bonus, calculation):
+    """One audit row for a sale and its (recorded or evaluated) bonus."""
+    return {
+        'id': sale.id,
+        'agentName': sale.agent.user.full_name if sale.agent and sale.agent.user else 'Unknown',
+        'agentCode': sale.agent.agent_code if sale.agent else '',
+        'leadId': f'LEAD-{sale.lead_id}' if sale.lead_id else '-',
+        'customerName': sale.customer.full_name if sale.customer else '-',
+        'productName': sale.product.name if sale.product else '-',
+        'saleAmount': float(sale.amount),
+        'saleDate': sale.sold_at.strftime('%Y-%m-%d'),
+        'ruleName': rule.name if rule else 'Default (10%)',
+        'ruleType': (f'{rule.get_amount_type_display()} – {rule.get_rule_dimension_display()}'
+                     if rule else 'Percent of sale'),
+        'bonusAmount': float(bonus),
+        'calculation': calculation,
+    }
+
+
+def _stream_audit(rows, export):
+    """Yield the audit rows encoded as CSV or NDJSON lines."""
+    import csv
+    import json
+
+    if export == 'ndjson':
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+        return
+
+    class _Echo:
+        def write(self, value):
+            return value
+
+    writer = csv.DictWriter(_Echo(), fieldnames=AUDIT_EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def monthly_audit_view(request, month):
     """Per-sale audit trail for a given month (format: YYYY-MM).
-    Returns each completed sale with lead, customer, bonus rule applied."""
+    Returns each completed sale with lead, customer, bonus rule applied:
+    the recorded ledger entry, or the bonus engine's evaluation at sale time.
+
+    ?export=csv or ?export=ndjson streams the rows as a download over a
+    server-side cursor instead of building the whole month in memory."""
+    from django.http import StreamingHttpResponse
     from conversions.models import Sale
+    from .services import sale_bonuses
     import datetime
 
+    export = request.query_params.get('export')
+    if export not in (None, 'csv', 'ndjson'):
+        return Response({'error': 'Invalid export format. Use csv or ndjson'}, status=400)
+
     try:
         year, mon = month.split('-')
         start_date = datetime.date(int(year), int(mon), 1)
@@ -167,106 +224,85 @@ def monthly_audit_view(request, month):
     except (ValueError, IndexError):
         return Response({'error': 'Invalid month format. Use YYYY-MM'}, status=400)
 
+    # The reverse one-to-one join brings each sale's ledger entry (if any)
+    # along with the sale, so rows can be built one at a time.
     sales = Sale.objects.filter(
         sold_at__date__gte=start_date,
         sold_at__date__lt=end_date,
         status='completed',
     ).select_related(
-        'agent__user', 'customer', 'product', 'lead'
-    ).order_by('-sold_at')
+        'agent__user', 'customer', 'product', 'lead', 'bonus_ledger__rule',
+    ).order_by('-sold_at', '-id')
 
     if request.user.tenant_id:
         sales = sales.filter(tenant=request.user.tenant)
 
-    # Build a map of sale_id -> BonusLedger for pre-recorded bonuses
-    ledger_map = {}
-    ledger_entries = BonusLedger.objects.filter(
-        sale__in=sales
-    ).select_related('rule')
-    for entry in ledger_entries:
-        ledger_map[entry.sale_id] = entry
+    if export is None:
+        return Response([_audit_row(*entry) for entry in sale_bonuses(sales)])
 
-    # Fallback: load active bonus rules for sales without ledger entries
-    rules = None
+    sales = sales.iterator(chunk_size=AUDIT_EXPORT_CHUNK_SIZE)
+    rows = (_audit_row(*entry) for entry in sale_bonuses(sales))
+    content_type = 'application/x-ndjson' if export == 'ndjson' else 'text/csv'
+    response = StreamingHttpResponse(_stream_audit(rows, export), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="bonus-audit-{month}.{export}"'
+    return response
 
-    result = []
-    for sale in sales:
-        amount = float(sale.amount)
-        ledger = ledger_map.get(sale.id)
-
-        if ledger:
-            # Use pre-recorded bonus from BonusLedger
-            result.append({
-                'id': sale.id,
-                'agentName': sale.agent.user.full_name if sale.agent and sale.agent.user else 'Unknown',
-                'agentCode': sale.agent.agent_code if sale.agent else '',
-                'leadId': f'LEAD-{sale.lead_id}' if sale.lead_id else '-',
-                'customerName': sale.customer.full_name if sale.customer else '-',
-                'productName': sale.product.name if sale.product else '-',
-                'saleAmount': amount,
-                'saleDate': sale.sold_at.strftime('%Y-%m-%d'),
-                'ruleName': ledger.rule.name if ledger.rule else 'Default (10%)',
-                'ruleType': (f'{ledger.rule.get_amount_type_display()} – {ledger.rule.get_rule_dimension_display()}'
-                             if ledger.rule else 'Percent of sale'),
-                'bonusAmount': float(ledger.bonus_amount),
-                'calculation': ledger.calculation_detail,
-            })
-        else:
-            # Fallback: calculate on the fly for historical sales without ledger
-            if rules is None:
-                rules = list(BonusRule.objects.filter(
-                    is_active=True,
-                    effective_from__lte=end_date,
-                ))
-                if request.user.tenant_id:
-                    rules = [r for r in rules if r.tenant_id == request.user.tenant_id]
-
-            applied_rule = None
-            bonus = 0.0
-            for rule in rules:
-                matches = False
-                if rule.rule_dimension == 'SELL_AMOUNT':
-                    threshold = float(rule.num_from or 0)
-                    if rule.operator == 'GTE' and amount >= threshold:
-                        matches = True
-                    elif rule.operator == 'GT' and amount > threshold:
-                        matches = True
-                elif rule.rule_dimension == 'POTENTIAL_PRODUCT' and sale.product:
-                    product_codes = [c.strip() for c in (rule.text_values or '').split(',')]
-                    if sale.product.code in product_codes:
-                        matches = True
-
-                if matches:
-                    if rule.amount_type == 'percent_of_sale':
-                        bonus = amount * float(rule.amount_value) / 100
-                        cap = float(rule.cap_amount or 0)
-                        if cap > 0:
-                            bonus = min(bonus, cap)
-                    else:
-                        bonus = float(rule.amount_value)
-                    applied_rule = rule
-                    break
-
-            if not applied_rule:
-                bonus = round(amount * 0.10, 2)
-
-            result.append({
-                'id': sale.id,
-                'agentName': sale.agent.user.full_name if sale.agent and sale.agent.user else 'Unknown',
-                'agentCode': sale.agent.agent_code if sale.agent else '',
-                'leadId': f'LEAD-{sale.lead_id}' if sale.lead_id else '-',
-                'customerName': sale.customer.full_name if sale.customer else '-',
-                'productName': sale.product.name if sale.product else '-',
-                'saleAmount': amount,
-                'saleDate': sale.sold_at.strftime('%Y-%m-%d'),
-                'ruleName': applied_rule.name if applied_rule else 'Default (10%)',
-                'ruleType': (f'{applied_rule.get_amount_type_display()} – {applied_rule.get_rule_dimension_display()}'
-                             if applied_rule else 'Percent of sale'),
-                'bonusAmount': round(bonus, 2),
-                'calculation': (f'{float(applied_rule.amount_value)}% of ${amount:,.0f}'
-                               if applied_rule and applied_rule.amount_type == 'percent_of_sale'
-                               else f'${float(applied_rule.amount_value):,.0f} fixed'
-                               if applied_rule else f'10% of ${amount:,.0f}'),
-            })
 
-    return Response(result)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def simulate_bonuses_view(request):
+    """What-if bonus simulation for the user's tenant.
+
+    Body: {"date_from": "YYYY-MM-DD", "date_to": "YYYY-MM-DD", "rules": [...]}
+    where each rule change is a dict of BonusRule fields (with "id" to change
+    an existing rule, without to add one). Nothing is saved. Returns current
+    (recorded) and proposed bonus totals for the period's completed sales,
+    per agent and per candidate rule."""
+    from tenancy.models import Agent
+    from .simulation import simulate_bonuses
+
+    if not request.user.tenant_id:
+        return Response({'error': 'Simulation requires a tenant user'}, status=400)
+    serializer = BonusSimulationSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
+    result = simulate_bonuses(
+        request.user.tenant_id, data['date_from'], data['date_to'], changes=data['rules'],
+    )
+    agents = {
+        row['id']: row for row in Agent.objects.filter(
+            pk__in=[row['agent_id'] for row in result['agents']],
+        ).values('id', 'agent_code', 'user__full_name')
+    }
+
+    return Response({
+        'dateFrom': data['date_from'],
+        'dateTo': data['date_to'],
+        'sales': result['sales'],
+        'unrecordedSales': result['unrecorded_sales'],
+        'currentTotal': float(result['current_total']),
+        'proposedTotal': float(result['proposed_total']),
+        'delta': float(result['delta']),
+        'agents': [
+            {
+                'agentId': row['agent_id'],
+                'agentCode': agents.get(row['agent_id'], {}).get('agent_code') or '',
+                'agentName': agents.get(row['agent_id'], {}).get('user__full_name') or 'Unknown',
+                'sales': row['sales'],
+                'current': float(row['current']),
+                'proposed': float(row['proposed']),
+                'delta': float(row['delta']),
+            }
+            for row in result['agents']
+        ],
+        'rules': [
+            {
+                'ruleId': row['rule'].id if row['rule'] else None,
+                'ruleName': (row['rule'].name or 'New rule') if row['rule'] else 'Default (10%)',
+                'sales': row['sales'],
+                'proposed': float(row['proposed']),
+            }
+            for row in result['rules']
+        ],
+    })
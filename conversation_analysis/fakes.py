@@ -0,0 +1,36 @@
+"""
+Offline stand-in for the OpenAI client, for tests and dry runs:
+
+    python manage.py reanalyze_conversations --client conversation_analysis.fakes.FakeOpenAIClient
+"""
+import json
+from types import SimpleNamespace
+
+
+class FakeOpenAIClient:
+    """
+    Mimics client.chat.completions.create() and returns a deterministic
+    analysis derived from the transcript. Transcripts containing any of
+    `fail_on` raise, to exercise error handling.
+    """
+
+    def __init__(self, fail_on=()):
+        self.fail_on = tuple(fail_on)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages, **kwargs):
+        self.calls += 1
+        transcript = messages[-1]['content']
+        if any(marker in transcript for marker in self.fail_on):
+            raise RuntimeError("Fake API error")
+
+        result = {
+            'rating': len(transcript) % 5 + 1,
+            'conversation_topic': 'Offline analysis',
+            'short_description': 'Generated by FakeOpenAIClient.',
+            'conversation_outcome': 'No real analysis was performed.',
+            'customer_sentiment': 'neutral',
+        }
+        message = SimpleNamespace(content=json.dumps(result))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-run AI analysis for conversations with a failed or pending analysis.\n'
+        'Use after changing ANALYSIS_PROMPT or recovering from an API outage.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status', action='append', choices=['failed', 'pending'],
+            help='Analysis status to re-run; repeat for several (default: failed and pending)',
+        )
+        parser.add_argument(
+            '--tenant', type=int,
+            help='Only process conversations of this tenant id',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Parallel API requests (default: 4)',
+        )
+        parser.add_argument(
+            '--rate-limit', type=float, default=None,
+            help='Maximum API requests per second (default: unlimited)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Rows fetched and written back per batch (default: 100)',
+        )
+        parser.add_argument(
+            '--client', type=str,
+            help='Dotted path to a client factory, e.g. conversation_analysis.fakes.FakeOpenAIClient',
+        )
+
+    def handle(self, *args, **options):
+        from conversation_analysis.models import LeadConversation
+        from conversation_analysis.services import reanalyze_conversations
+
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        client = None
+        if options['client']:
+            try:
+                client = import_string(options['client'])()
+            except ImportError as e:
+                raise CommandError(f'Cannot load client "{options["client"]}": {e}')
+
+        conversations = LeadConversation.objects.filter(
+            analysis_status__in=options['status'] or ['failed', 'pending'],
+        )
+        if options['tenant']:
+            conversations = conversations.filter(tenant_id=options['tenant'])
+
+        completed, failed = reanalyze_conversations(
+            conversations,
+            client=client,
+            concurrency=options['concurrency'],
+            rate_limit=options['rate_limit'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Re-analyzed {completed} conversations, {failed} failed'))
@@ -9,9 +9,9 @@ class LeadConversationCreateSerializer(serializers.ModelSerializer):
         model = LeadConversation
         fields = [
             'id', 'lead', 'channel', 'audio_file', 'raw_transcript',
-            'created_at',
+            'transcription_status', 'analysis_status', 'created_at',
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'transcription_status', 'analysis_status', 'created_at']
 
     def validate(self, data):
         channel = data.get('channel')
@@ -1,7 +1,12 @@
+import hashlib
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 from django.conf import settings
+from django.core.cache import caches
 from django.utils import timezone
 from openai import OpenAI
 
@@ -28,6 +33,14 @@ Rating criteria:
 Transcript:
 """
 
+ANALYSIS_SYSTEM_PROMPT = "You are a sales conversation analyst. Always respond with valid JSON only."
+ANALYSIS_MODEL = "gpt-4o-mini"
+
+# Changes whenever either prompt is edited, invalidating cached analyses
+PROMPT_VERSION = hashlib.sha256(
+    (ANALYSIS_SYSTEM_PROMPT + ANALYSIS_PROMPT).encode('utf-8')
+).hexdigest()[:12]
+
 
 def _get_client():
     api_key = getattr(settings, 'OPENAI_API_KEY', None)
@@ -48,15 +61,94 @@ def transcribe_audio(file_path):
     return response
 
 
-def analyze_conversation(transcript):
-    """Send transcript to ChatGPT and return structured analysis."""
-    client = _get_client()
+class AnalysisCache:
+    """
+    Parsed analysis results in the 'conversation_analysis' Django cache
+    (Redis when CACHE_REDIS_URL is set), shared by every worker process.
+    Keys are (prompt version, model, sha256 of transcript), so editing the
+    prompt or switching model never serves stale results. Keys and the
+    hit/miss counters also embed a generation that clear() bumps, so
+    clearing never touches other data in a shared cache.
+    """
+    ALIAS = 'conversation_analysis'
+    TIMEOUT = 30 * 24 * 3600
+
+    @property
+    def cache(self):
+        return caches[self.ALIAS]
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'CONVERSATION_ANALYSIS_CACHE_SIZE', 1024) > 0
+
+    def _generation(self):
+        generation = self.cache.get('generation')
+        if generation is None:
+            self.cache.add('generation', time.time_ns(), None)
+            generation = self.cache.get('generation')
+        return generation
+
+    @staticmethod
+    def make_key(transcript):
+        digest = hashlib.sha256(transcript.encode('utf-8')).hexdigest()
+        return (PROMPT_VERSION, ANALYSIS_MODEL, digest)
+
+    def _cache_key(self, key):
+        return ':'.join(['result', str(self._generation()), *key])
+
+    def _count(self, name):
+        counter = f'{name}:{self._generation()}'
+        self.cache.add(counter, 0, None)
+        try:
+            self.cache.incr(counter)
+        except ValueError:
+            # Evicted between add and incr
+            self.cache.add(counter, 1, None)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        result = self.cache.get(self._cache_key(key))
+        self._count('misses' if result is None else 'hits')
+        return result
+
+    def set(self, key, result):
+        if self.enabled:
+            self.cache.set(self._cache_key(key), dict(result), self.TIMEOUT)
+
+    def clear(self):
+        self.cache.set('generation', time.time_ns(), None)
+
+    def stats(self):
+        generation = self._generation()
+        return {
+            'hits': self.cache.get(f'hits:{generation}', 0),
+            'misses': self.cache.get(f'misses:{generation}', 0),
+        }
+
+
+analysis_cache = AnalysisCache()
+
+
+def analyze_conversation(transcript, client=None):
+    """
+    Send transcript to ChatGPT and return structured analysis.
+    Results for a transcript already analyzed with the same prompt and model
+    come from analysis_cache without an API call.
+    """
+    key = analysis_cache.make_key(transcript)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        logger.debug("Analysis cache hit for transcript %s", key[2][:12])
+        return cached
+
+    client = client or _get_client()
     response = client.chat.completions.create(
-        model="gpt-4o-mini",
+        model=ANALYSIS_MODEL,
         messages=[
             {
                 "role": "system",
-                "content": "You are a sales conversation analyst. Always respond with valid JSON only.",
+                "content": ANALYSIS_SYSTEM_PROMPT,
             },
             {
                 "role": "user",
@@ -74,32 +166,28 @@ def analyze_conversation(transcript):
         lines = [l for l in lines if not l.startswith("```")]
         raw_text = "\n".join(lines)
 
-    return json.loads(raw_text)
+    result = json.loads(raw_text)
+    analysis_cache.set(key, result)
+    return result
 
 
-def process_conversation(conversation):
+def run_transcription(conversation):
     """
-    Full pipeline: transcribe (if audio) then analyze.
-    Updates the conversation instance in-place and saves.
+    Step 1: make sure the conversation has a transcript to analyze.
+    Transcribes audio when needed and returns True if analysis can proceed.
+    Whisper errors are raised so the caller can retry or mark the step failed.
     """
     needs_transcription = conversation.channel in ('in_person', 'phone')
 
-    # Step 1: Transcribe audio if needed
     if needs_transcription and conversation.audio_file:
         if not conversation.raw_transcript:
-            try:
-                conversation.transcription_status = 'processing'
-                conversation.save(update_fields=['transcription_status'])
+            conversation.transcription_status = 'processing'
+            conversation.save(update_fields=['transcription_status'])
 
-                transcript = transcribe_audio(conversation.audio_file.path)
-                conversation.raw_transcript = transcript
-                conversation.transcription_status = 'completed'
-                conversation.save(update_fields=['raw_transcript', 'transcription_status'])
-            except Exception as e:
-                logger.error(f"Transcription failed for conversation {conversation.id}: {e}")
-                conversation.transcription_status = 'failed'
-                conversation.save(update_fields=['transcription_status'])
-                return
+            transcript = transcribe_audio(conversation.audio_file.path)
+            conversation.raw_transcript = transcript
+            conversation.transcription_status = 'completed'
+            conversation.save(update_fields=['raw_transcript', 'transcription_status'])
         else:
             conversation.transcription_status = 'skipped'
             conversation.save(update_fields=['transcription_status'])
@@ -108,37 +196,152 @@ def process_conversation(conversation):
             conversation.transcription_status = 'failed'
             conversation.analysis_status = 'failed'
             conversation.save(update_fields=['transcription_status', 'analysis_status'])
-            return
+            return False
     else:
         # Text channel — transcription not needed
         conversation.transcription_status = 'skipped'
         conversation.save(update_fields=['transcription_status'])
 
-    # Step 2: Analyze transcript
     if not conversation.raw_transcript:
         conversation.analysis_status = 'failed'
         conversation.save(update_fields=['analysis_status'])
-        return
+        return False
+    return True
+
+
+def run_analysis(conversation):
+    """
+    Step 2: analyze the transcript and store the result on the conversation.
+    API and parsing errors are raised so the caller can retry or mark it failed.
+    """
+    conversation.analysis_status = 'processing'
+    conversation.save(update_fields=['analysis_status'])
+
+    result = analyze_conversation(conversation.raw_transcript)
+    apply_analysis(conversation, result)
+    conversation.save(update_fields=ANALYSIS_FIELDS)
+
 
+ANALYSIS_FIELDS = [
+    'ai_raw_response', 'rating', 'conversation_topic',
+    'short_description', 'conversation_outcome', 'customer_sentiment',
+    'analysis_status', 'analyzed_at',
+]
+
+
+def apply_analysis(conversation, result):
+    """Copy an analysis result onto the conversation (without saving)."""
+    conversation.ai_raw_response = result
+    conversation.rating = result.get('rating')
+    conversation.conversation_topic = result.get('conversation_topic', '')[:255]
+    conversation.short_description = result.get('short_description', '')
+    conversation.conversation_outcome = result.get('conversation_outcome', '')
+    conversation.customer_sentiment = result.get('customer_sentiment', 'neutral')
+    conversation.analysis_status = 'completed'
+    conversation.analyzed_at = timezone.now()
+
+
+def process_conversation(conversation):
+    """
+    Full pipeline: transcribe (if audio) then analyze, synchronously.
+    Updates the conversation instance in-place and saves.
+    """
     try:
-        conversation.analysis_status = 'processing'
-        conversation.save(update_fields=['analysis_status'])
+        ready = run_transcription(conversation)
+    except Exception as e:
+        logger.error(f"Transcription failed for conversation {conversation.id}: {e}")
+        conversation.transcription_status = 'failed'
+        conversation.save(update_fields=['transcription_status'])
+        return
+    if not ready:
+        return
 
-        result = analyze_conversation(conversation.raw_transcript)
-        conversation.ai_raw_response = result
-        conversation.rating = result.get('rating')
-        conversation.conversation_topic = result.get('conversation_topic', '')[:255]
-        conversation.short_description = result.get('short_description', '')
-        conversation.conversation_outcome = result.get('conversation_outcome', '')
-        conversation.customer_sentiment = result.get('customer_sentiment', 'neutral')
-        conversation.analysis_status = 'completed'
-        conversation.analyzed_at = timezone.now()
-        conversation.save(update_fields=[
-            'ai_raw_response', 'rating', 'conversation_topic',
-            'short_description', 'conversation_outcome', 'customer_sentiment',
-            'analysis_status', 'analyzed_at',
-        ])
+    try:
+        run_analysis(conversation)
     except Exception as e:
         logger.error(f"Analysis failed for conversation {conversation.id}: {e}")
         conversation.analysis_status = 'failed'
         conversation.save(update_fields=['analysis_status'])
+
+
+class _RateLimiter:
+    """Spaces out calls across threads to at most `rate` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def reanalyze_conversations(conversations, client=None, concurrency=4,
+                            rate_limit=None, batch_size=100):
+    """
+    Re-run the AI analysis for many conversations that already have a transcript.
+
+    Rows are streamed with iterator() and their transcripts are sent to the
+    API from a pool of `concurrency` threads, throttled to `rate_limit`
+    requests per second. Worker threads only talk to the API; results are
+    written back from the calling thread with bulk_update every `batch_size`
+    rows, so no database connection is shared between threads.
+
+    Returns (completed_count, failed_count).
+    """
+    from .models import LeadConversation
+
+    client = client or _get_client()
+    limiter = _RateLimiter(rate_limit)
+
+    def _analyze(transcript):
+        limiter.wait()
+        return analyze_conversation(transcript, client=client)
+
+    conversations = conversations.exclude(raw_transcript__isnull=True).exclude(raw_transcript='')
+    rows = conversations.only('id', 'raw_transcript', *ANALYSIS_FIELDS).order_by('pk').iterator(chunk_size=batch_size)
+
+    completed = failed = 0
+    done = []
+
+    def _collect(futures):
+        nonlocal completed, failed
+        for future in futures:
+            conversation = in_flight.pop(future)
+            try:
+                apply_analysis(conversation, future.result())
+                completed += 1
+            except Exception as e:
+                logger.error(f"Analysis failed for conversation {conversation.id}: {e}")
+                conversation.analysis_status = 'failed'
+                failed += 1
+            done.append(conversation)
+        if len(done) >= batch_size:
+            _flush()
+
+    def _flush():
+        LeadConversation.objects.bulk_update(done, ANALYSIS_FIELDS, batch_size=batch_size)
+        logger.info("Re-analyzed %s conversations (%s failed)", completed + failed, failed)
+        done.clear()
+
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for conversation in rows:
+            in_flight[executor.submit(_analyze, conversation.raw_transcript)] = conversation
+            if len(in_flight) >= concurrency * 2:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                _collect(finished)
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            _collect(finished)
+    if done:
+        _flush()
+
+    return completed, failed
@@ -0,0 +1,72 @@
+import logging
+
+from celery import shared_task
+from django.db import transaction
+
+from .models import LeadConversation
+from .services import run_transcription, run_analysis
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 4
+RETRY_BACKOFF = 15  # seconds before the first retry, doubled on each attempt
+
+
+def _retry_countdown(retries):
+    return RETRY_BACKOFF * (2 ** retries)
+
+
+def enqueue_conversation(conversation):
+    """
+    Queue transcription + analysis for a conversation once the current
+    transaction commits. The conversation keeps its 'pending' statuses until
+    a worker picks it up.
+    """
+    conversation_id = conversation.id
+
+    def _enqueue():
+        try:
+            transcribe_conversation_task.delay(conversation_id)
+        except Exception as e:
+            logger.error(f"Failed to enqueue conversation {conversation_id}: {e}")
+
+    transaction.on_commit(_enqueue)
+
+
+@shared_task(bind=True, max_retries=MAX_RETRIES, acks_late=True)
+def transcribe_conversation_task(self, conversation_id):
+    """Transcribe the conversation's audio if needed, then queue its analysis."""
+    conversation = LeadConversation.objects.filter(pk=conversation_id).first()
+    if conversation is None:
+        return
+
+    try:
+        ready = run_transcription(conversation)
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=_retry_countdown(self.request.retries))
+        logger.error(f"Transcription failed for conversation {conversation_id}: {e}")
+        conversation.transcription_status = 'failed'
+        conversation.analysis_status = 'failed'
+        conversation.save(update_fields=['transcription_status', 'analysis_status'])
+        return
+
+    if ready:
+        analyze_conversation_task.delay(conversation_id)
+
+
+@shared_task(bind=True, max_retries=MAX_RETRIES, acks_late=True)
+def analyze_conversation_task(self, conversation_id):
+    """Run the AI analysis for a conversation that already has a transcript."""
+    conversation = LeadConversation.objects.filter(pk=conversation_id).first()
+    if conversation is None:
+        return
+
+    try:
+        run_analysis(conversation)
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=_retry_countdown(self.request.retries))
+        logger.error(f"Analysis failed for conversation {conversation_id}: {e}")
+        conversation.analysis_status = 'failed'
+        conversation.save(update_fields=['analysis_status'])
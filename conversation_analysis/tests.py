@@ -2,7 +2,7 @@ from datetime import date
 from decimal import Decimal
 from unittest.mock import patch, MagicMock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
@@ -306,6 +306,224 @@ class ProcessConversationServiceTest(BaseTestMixin, TestCase):
         self.assertEqual(conv.ai_raw_response, MOCK_AI_RESPONSE)
 
 
+# ===========================================================================
+# CELERY TASK TESTS (eager mode, mocked OpenAI)
+# ===========================================================================
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class ConversationTaskTest(BaseTestMixin, APITestCase):
+
+    def setUp(self):
+        self._setup_full()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @patch("conversation_analysis.services.analyze_conversation")
+    def test_create_returns_pending_then_worker_completes(self, mock_analyze):
+        mock_analyze.return_value = MOCK_AI_RESPONSE
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post("/api/conversations/", {
+                "lead": self.lead.id,
+                "channel": "email",
+                "raw_transcript": "Customer asked about pricing.",
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["transcription_status"], "pending")
+        self.assertEqual(response.data["analysis_status"], "pending")
+        mock_analyze.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        conv = LeadConversation.objects.get(id=response.data["id"])
+        self.assertEqual(conv.transcription_status, "skipped")
+        self.assertEqual(conv.analysis_status, "completed")
+        self.assertEqual(conv.rating, 4)
+
+    @patch("conversation_analysis.services.analyze_conversation")
+    def test_analysis_is_retried_after_transient_error(self, mock_analyze):
+        from conversation_analysis.tasks import analyze_conversation_task
+        mock_analyze.side_effect = [Exception("Rate limited"), MOCK_AI_RESPONSE]
+
+        conv = LeadConversation.objects.create(
+            tenant=self.tenant, lead=self.lead, agent=self.agent,
+            channel="email", raw_transcript="Retry me.",
+        )
+        analyze_conversation_task.apply(args=[conv.id])
+        conv.refresh_from_db()
+
+        self.assertEqual(mock_analyze.call_count, 2)
+        self.assertEqual(conv.analysis_status, "completed")
+
+    @patch("conversation_analysis.services.analyze_conversation")
+    def test_analysis_marked_failed_when_retries_exhausted(self, mock_analyze):
+        from conversation_analysis.tasks import analyze_conversation_task, MAX_RETRIES
+        mock_analyze.side_effect = Exception("OpenAI API error")
+
+        conv = LeadConversation.objects.create(
+            tenant=self.tenant, lead=self.lead, agent=self.agent,
+            channel="email", raw_transcript="Always fails.",
+        )
+        analyze_conversation_task.apply(args=[conv.id])
+        conv.refresh_from_db()
+
+        self.assertEqual(mock_analyze.call_count, MAX_RETRIES + 1)
+        self.assertEqual(conv.analysis_status, "failed")
+
+    def test_phone_without_audio_or_transcript_skips_analysis(self):
+        from conversation_analysis.tasks import transcribe_conversation_task
+        conv = LeadConversation.objects.create(
+            tenant=self.tenant, lead=self.lead, agent=self.agent, channel="phone",
+        )
+        with patch("conversation_analysis.tasks.analyze_conversation_task.delay") as mock_delay:
+            transcribe_conversation_task.apply(args=[conv.id])
+        conv.refresh_from_db()
+
+        mock_delay.assert_not_called()
+        self.assertEqual(conv.transcription_status, "failed")
+        self.assertEqual(conv.analysis_status, "failed")
+
+
+# ===========================================================================
+# BULK RE-ANALYSIS TESTS (offline fake client)
+# ===========================================================================
+
+class ReanalyzeConversationsTest(BaseTestMixin, TestCase):
+
+    def setUp(self):
+        from conversation_analysis.services import analysis_cache
+        analysis_cache.clear()
+        self._setup_full()
+        self.conversations = []
+        for i, analysis_status in enumerate(["failed", "pending", "failed", "completed", "failed"]):
+            lead = self.lead if i == 0 else self._create_lead(
+                self.tenant, self.agent, name=f"Lead {i}", phone=f"+99890000000{i}",
+            )
+            self.conversations.append(LeadConversation.objects.create(
+                tenant=self.tenant, lead=lead, agent=self.agent, channel="email",
+                raw_transcript=f"Transcript number {i}", analysis_status=analysis_status,
+            ))
+
+    def test_reanalyzes_failed_and_pending_with_fake_client(self):
+        from conversation_analysis.fakes import FakeOpenAIClient
+        from conversation_analysis.services import reanalyze_conversations
+
+        client = FakeOpenAIClient(fail_on=["number 2"])
+        completed, failed = reanalyze_conversations(
+            LeadConversation.objects.filter(analysis_status__in=["failed", "pending"]),
+            client=client, concurrency=3, batch_size=2,
+        )
+
+        self.assertEqual((completed, failed), (3, 1))
+        self.assertEqual(client.calls, 4)
+        statuses = [
+            c.analysis_status
+            for c in LeadConversation.objects.order_by("pk")
+        ]
+        self.assertEqual(statuses, ["completed", "completed", "failed", "completed", "completed"])
+        conv = LeadConversation.objects.get(pk=self.conversations[0].pk)
+        self.assertEqual(conv.conversation_topic, "Offline analysis")
+        self.assertIsNotNone(conv.analyzed_at)
+
+    def test_command_filters_by_status(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command(
+            "reanalyze_conversations", "--status", "pending",
+            "--client", "conversation_analysis.fakes.FakeOpenAIClient", stdout=out,
+        )
+
+        self.assertIn("Re-analyzed 1 conversations, 0 failed", out.getvalue())
+        self.assertEqual(LeadConversation.objects.filter(analysis_status="failed").count(), 3)
+
+    def test_conversations_without_transcript_are_skipped(self):
+        from conversation_analysis.fakes import FakeOpenAIClient
+        from conversation_analysis.services import reanalyze_conversations
+
+        LeadConversation.objects.filter(pk=self.conversations[1].pk).update(raw_transcript=None)
+        client = FakeOpenAIClient()
+        reanalyze_conversations(LeadConversation.objects.filter(analysis_status="pending"), client=client)
+
+        self.assertEqual(client.calls, 0)
+
+
+# ===========================================================================
+# ANALYSIS CACHE TESTS
+# ===========================================================================
+
+class AnalysisCacheTest(TestCase):
+
+    def setUp(self):
+        from conversation_analysis.services import analysis_cache
+        analysis_cache.clear()
+        self.cache = analysis_cache
+
+    def test_same_transcript_is_analyzed_once(self):
+        from conversation_analysis.fakes import FakeOpenAIClient
+        from conversation_analysis.services import analyze_conversation
+
+        client = FakeOpenAIClient()
+        first = analyze_conversation("Customer asked about pricing.", client=client)
+        second = analyze_conversation("Customer asked about pricing.", client=client)
+
+        self.assertEqual(first, second)
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1})
+
+    def test_different_transcript_misses(self):
+        from conversation_analysis.fakes import FakeOpenAIClient
+        from conversation_analysis.services import analyze_conversation
+
+        client = FakeOpenAIClient()
+        analyze_conversation("First transcript", client=client)
+        analyze_conversation("Second transcript", client=client)
+        self.assertEqual(client.calls, 2)
+
+    def test_failed_calls_are_not_cached(self):
+        from conversation_analysis.fakes import FakeOpenAIClient
+        from conversation_analysis.services import analyze_conversation
+
+        client = FakeOpenAIClient(fail_on=["boom"])
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                analyze_conversation("boom", client=client)
+        self.assertEqual(client.calls, 2)
+        self.assertIsNone(self.cache.get(self.cache.make_key("boom")))
+
+    def test_results_live_in_the_shared_django_cache(self):
+        from django.core.cache import caches
+        from conversation_analysis.fakes import FakeOpenAIClient
+        from conversation_analysis.services import AnalysisCache, analyze_conversation
+
+        result = analyze_conversation("Shared", client=FakeOpenAIClient())
+
+        # A fresh instance (another worker) reads the same backend
+        other = AnalysisCache()
+        self.assertIs(other.cache, caches["conversation_analysis"])
+        self.assertEqual(other.get(other.make_key("Shared")), result)
+
+    def test_clear_drops_entries_and_counters(self):
+        key = self.cache.make_key("a")
+        self.cache.set(key, {"rating": 1})
+        self.assertEqual(self.cache.get(key), {"rating": 1})
+
+        self.cache.clear()
+        self.assertEqual(self.cache.stats(), {"hits": 0, "misses": 0})
+        self.assertIsNone(self.cache.get(key))
+
+    @override_settings(CONVERSATION_ANALYSIS_CACHE_SIZE=0)
+    def test_zero_size_disables_cache(self):
+        from conversation_analysis.fakes import FakeOpenAIClient
+        from conversation_analysis.services import analyze_conversation
+
+        client = FakeOpenAIClient()
+        analyze_conversation("Same", client=client)
+        analyze_conversation("Same", client=client)
+        self.assertEqual(client.calls, 2)
+
+
 # ===========================================================================
 # API ENDPOINT TESTS
 # ===========================================================================
@@ -319,8 +537,8 @@ class ConversationAPITest(BaseTestMixin, APITestCase):
 
     # -- CREATE --
 
-    @patch("conversation_analysis.views.process_conversation")
-    def test_create_email_conversation(self, mock_process):
+    @patch("conversation_analysis.views.enqueue_conversation")
+    def test_create_email_conversation(self, mock_enqueue):
         response = self.client.post("/api/conversations/", {
             "lead": self.lead.id,
             "channel": "email",
@@ -329,10 +547,11 @@ class ConversationAPITest(BaseTestMixin, APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data["lead"], self.lead.id)
         self.assertEqual(response.data["channel"], "email")
-        mock_process.assert_called_once()
+        self.assertEqual(response.data["analysis_status"], "pending")
+        mock_enqueue.assert_called_once()
 
-    @patch("conversation_analysis.views.process_conversation")
-    def test_create_online_chat_conversation(self, mock_process):
+    @patch("conversation_analysis.views.enqueue_conversation")
+    def test_create_online_chat_conversation(self, mock_enqueue):
         response = self.client.post("/api/conversations/", {
             "lead": self.lead.id,
             "channel": "online_chat",
@@ -354,8 +573,8 @@ class ConversationAPITest(BaseTestMixin, APITestCase):
         })
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-    @patch("conversation_analysis.views.process_conversation")
-    def test_create_auto_assigns_tenant_and_agent(self, mock_process):
+    @patch("conversation_analysis.views.enqueue_conversation")
+    def test_create_auto_assigns_tenant_and_agent(self, mock_enqueue):
         response = self.client.post("/api/conversations/", {
             "lead": self.lead.id,
             "channel": "email",
@@ -366,8 +585,8 @@ class ConversationAPITest(BaseTestMixin, APITestCase):
         self.assertEqual(conv.tenant_id, self.tenant.id)
         self.assertEqual(conv.agent_id, self.agent.id)
 
-    @patch("conversation_analysis.views.process_conversation")
-    def test_create_duplicate_lead_fails(self, mock_process):
+    @patch("conversation_analysis.views.enqueue_conversation")
+    def test_create_duplicate_lead_fails(self, mock_enqueue):
         """OneToOne: second conversation for same lead should fail."""
         self.client.post("/api/conversations/", {
             "lead": self.lead.id,
@@ -383,8 +602,8 @@ class ConversationAPITest(BaseTestMixin, APITestCase):
 
     # -- LIST --
 
-    @patch("conversation_analysis.views.process_conversation")
-    def test_list_conversations(self, mock_process):
+    @patch("conversation_analysis.views.enqueue_conversation")
+    def test_list_conversations(self, mock_enqueue):
         LeadConversation.objects.create(
             tenant=self.tenant, lead=self.lead, agent=self.agent,
             channel="email", raw_transcript="Test",
@@ -9,6 +9,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from .models import LeadConversation
 from .serializers import LeadConversationSerializer, LeadConversationCreateSerializer
 from .services import process_conversation
+from .tasks import enqueue_conversation
 
 logger = logging.getLogger(__name__)
 
@@ -36,35 +37,10 @@ class LeadConversationViewSet(viewsets.ModelViewSet):
 
         qs = qs.filter(tenant=user.tenant)
 
-        # Role-based filtering
-        from users.models import UserRole
-        user_roles = set(
-            UserRole.objects.filter(user=user, tenant=user.tenant)
-            .values_list('role__code', flat=True)
-        )
-
-        # Managers and admins see everything in their tenant
-        if user_roles & {'MANAGER', 'ADMIN', 'FINANCE'}:
-            return qs
-
-        # Supervisors see their team's conversations
-        if 'SUPERVISOR' in user_roles:
-            from tenancy.models import Agent
-            supervised_agents = Agent.objects.filter(
-                parent__user=user, tenant=user.tenant,
-            ).values_list('id', flat=True)
-            # Include own agent record too
-            own_agent = Agent.objects.filter(user=user, tenant=user.tenant).values_list('id', flat=True)
-            agent_ids = list(supervised_agents) + list(own_agent)
-            return qs.filter(agent_id__in=agent_ids)
-
-        # Agents see only their own
-        from tenancy.models import Agent
-        agent = Agent.objects.filter(user=user, tenant=user.tenant).first()
-        if agent:
-            return qs.filter(agent=agent)
-
-        return qs.none()
+        # Managers and admins see everything in their tenant, supervisors
+        # their team's conversations + own, agents only their own
+        from tenancy.scope import get_user_scope
+        return get_user_scope(user).filter_queryset(qs)
 
     def perform_create(self, serializer):
         from tenancy.models import Agent
@@ -82,11 +58,9 @@ class LeadConversationViewSet(viewsets.ModelViewSet):
 
         conversation = serializer.save(**kwargs)
 
-        # Trigger AI processing
-        try:
-            process_conversation(conversation)
-        except Exception as e:
-            logger.error(f"Failed to process conversation {conversation.id}: {e}")
+        # Transcription and analysis run on Celery workers; the response
+        # returns right away with 'pending' statuses.
+        enqueue_conversation(conversation)
 
     @action(detail=True, methods=['post'])
     def analyze(self, request, pk=None):
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 00:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversions', '0002_initial'),
+        ('leads', '0002_initial'),
+        ('tenancy', '0005_agent_hierarchy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['tenant', 'sold_at', 'id'], name='sales_tenant__ab68a2_idx'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 
 class Sale(models.Model):
@@ -20,6 +20,24 @@ class Sale(models.Model):
 
     class Meta:
         db_table = 'sales'
+        indexes = [
+            # Keyset pagination: tenant filter + ORDER BY sold_at DESC, id DESC
+            models.Index(fields=['tenant', 'sold_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Sale {self.id} – {self.amount} ({self.status})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets post_save handlers tell a status change from a plain re-save
+        if 'status' in field_names:
+            instance._loaded_status = values[field_names.index('status')]
+        return instance
+
+    def save(self, *args, **kwargs):
+        # post_save handlers (the bonus outbox row) commit or roll back with the sale
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+        self._loaded_status = self.status
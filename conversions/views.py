@@ -1,6 +1,7 @@
 from rest_framework import viewsets, filters
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
+from posightful.pagination import SoldAtCursorPagination
 from .models import Sale
 from .serializers import SaleSerializer
 
@@ -26,6 +27,7 @@ class TenantScopedViewSet(viewsets.ModelViewSet):
 
 class SaleViewSet(TenantScopedViewSet):
     serializer_class = SaleSerializer
+    pagination_class = SoldAtCursorPagination
     filterset_fields = ['agent', 'product', 'customer', 'status']
     search_fields = ['customer__full_name', 'agent__agent_code']
     ordering_fields = ['sold_at', 'amount', 'created_at']
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-18 00:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0002_initial'),
+        ('tenancy', '0005_agent_hierarchy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['tenant', 'created_at', 'id'], name='leads_tenant__7bb94d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadstagehistory',
+            index=models.Index(fields=['tenant', 'changed_at', 'id'], name='lead_stage__tenant__aeba91_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0003_keyset_pagination_indexes'),
+        ('tenancy', '0005_agent_hierarchy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='client_uuid',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='lead',
+            constraint=models.UniqueConstraint(fields=('tenant', 'client_uuid'), name='leads_tenant_client_uuid_uniq'),
+        ),
+    ]
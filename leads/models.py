@@ -62,12 +62,22 @@ class Lead(models.Model):
         null=True, blank=True, related_name='+',
     )
 
+    # Generated on the device; makes offline sync retries idempotent
+    client_uuid = models.UUIDField(blank=True, null=True)
+
     server_received_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
 
     class Meta:
         db_table = 'leads'
+        indexes = [
+            # Keyset pagination: tenant filter + ORDER BY created_at DESC, id DESC
+            models.Index(fields=['tenant', 'created_at', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'client_uuid'], name='leads_tenant_client_uuid_uniq'),
+        ]
 
     def __str__(self):
         return f"Lead {self.id} – {self.customer_name or 'Unnamed'}"
@@ -120,6 +130,7 @@ class LeadStageHistory(models.Model):
         db_table = 'lead_stage_history'
         indexes = [
             models.Index(fields=['tenant', 'lead_application', 'changed_at']),
+            models.Index(fields=['tenant', 'changed_at', 'id']),
         ]
 
     def __str__(self):
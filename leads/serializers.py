@@ -63,16 +63,20 @@ class LeadSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'tenant', 'agent', 'agent_code', 'agent_name', 'customer',
             'interaction_type', 'customer_name', 'customer_phone',
-            'latitude', 'longitude', 'primary_application',
+            'latitude', 'longitude', 'primary_application', 'client_uuid',
             'server_received_at', 'created_at', 'updated_at',
             'applications', 'status', 'sale_amount',
         ]
-        read_only_fields = ['id', 'tenant', 'created_at', 'updated_at']
+        # client_uuid is only set by the idempotent bulk endpoint
+        read_only_fields = ['id', 'tenant', 'client_uuid', 'created_at', 'updated_at']
 
     def get_status(self, obj):
-        app = obj.applications.filter(is_primary=True).first()
-        if not app:
-            app = obj.applications.first()
+        # Works on the prefetched applications (LeadViewSet) instead of
+        # issuing a filtered query per lead
+        apps = sorted(obj.applications.all(), key=lambda a: a.pk)
+        app = next((a for a in apps if a.is_primary), None)
+        if not app and apps:
+            app = apps[0]
         if not app or not app.current_stage:
             return 'new'
         stage_name = app.current_stage.name.lower()
@@ -86,8 +90,51 @@ class LeadSerializer(serializers.ModelSerializer):
             return 'pending'
 
     def get_sale_amount(self, obj):
-        from conversions.models import Sale
-        sale = Sale.objects.filter(lead=obj, status='completed').first()
-        if sale:
-            return float(sale.amount)
+        # LeadViewSet annotates completed_sale_amount; fall back to a query
+        # for instances that did not come from that queryset
+        if hasattr(obj, 'completed_sale_amount'):
+            amount = obj.completed_sale_amount
+        else:
+            from conversions.models import Sale
+            amount = Sale.objects.filter(
+                lead=obj, status='completed',
+            ).order_by('pk').values_list('amount', flat=True).first()
+        if amount is not None:
+            return float(amount)
         return None
+
+
+class BulkLeadApplicationSerializer(serializers.Serializer):
+    """
+    Nested application of a bulk-captured lead. References are plain ids:
+    they are resolved for the whole batch at once in leads.services.
+    """
+    product = serializers.IntegerField()
+    pipeline = serializers.IntegerField()
+    current_stage = serializers.IntegerField()
+    app_id = serializers.CharField(max_length=120, required=False, allow_blank=True, allow_null=True)
+    is_primary = serializers.BooleanField(default=False)
+
+
+class BulkLeadSerializer(serializers.Serializer):
+    """One lead of a bulk sync; client_uuid is the idempotency key."""
+    client_uuid = serializers.UUIDField()
+    customer = serializers.IntegerField(required=False, allow_null=True)
+    interaction_type = serializers.CharField(max_length=80, required=False, allow_blank=True, allow_null=True)
+    customer_name = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
+    customer_phone = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    latitude = serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+    longitude = serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+    applications = BulkLeadApplicationSerializer(many=True, required=False)
+
+    def validate_applications(self, value):
+        if sum(1 for app in value if app['is_primary']) > 1:
+            raise serializers.ValidationError('At most one application can be primary.')
+        return value
+
+
+class StageTransitionSerializer(serializers.Serializer):
+    """Move of one application; `application` comes from the URL for single moves."""
+    application = serializers.IntegerField(required=False)
+    to_stage = serializers.IntegerField()
+    note = serializers.CharField(required=False, allow_blank=True, allow_null=True)
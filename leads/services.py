@@ -0,0 +1,240 @@
+import logging
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Lead, LeadApplication, LeadPipeline, LeadStage, LeadStageHistory
+
+logger = logging.getLogger(__name__)
+
+# Largest batch accepted by the bulk lead endpoint
+BULK_LEADS_MAX = 500
+
+# Largest batch accepted by the stage transition endpoint
+TRANSITIONS_MAX = 1000
+
+LEAD_FIELDS = (
+    'interaction_type', 'customer_name', 'customer_phone', 'latitude', 'longitude',
+)
+
+
+def bulk_create_leads(tenant, agent_id, items):
+    """
+    Insert a batch of validated BulkLeadSerializer items for one agent.
+
+    Product, pipeline, stage and customer ids of the whole batch are
+    resolved with one query per model; leads and their applications are
+    written with bulk_create in one transaction, together with the agent's
+    leads_captured KPI increment. Items whose client_uuid
+    already exists in the tenant (or earlier in the batch) are reported as
+    duplicates instead of being inserted again, so a retried sync is safe.
+
+    Returns one result dict per item, in order:
+    {'client_uuid', 'status': 'created' | 'duplicate' | 'invalid', 'id', 'errors'}.
+    """
+    if not items:
+        return []
+    try:
+        with transaction.atomic():
+            return _insert_batch(tenant, agent_id, items)
+    except IntegrityError:
+        # A concurrent sync inserted some of the same client_uuids after we
+        # looked them up; the retry reports those as duplicates.
+        logger.info("Retrying bulk lead batch after a client_uuid conflict")
+        with transaction.atomic():
+            return _insert_batch(tenant, agent_id, items)
+
+
+def _insert_batch(tenant, agent_id, items):
+    from tenancy.models import Customer, Product
+
+    apps_of = [item.get('applications') or [] for item in items]
+    product_ids = {app['product'] for apps in apps_of for app in apps}
+    pipeline_ids = {app['pipeline'] for apps in apps_of for app in apps}
+    stage_ids = {app['current_stage'] for apps in apps_of for app in apps}
+    customer_ids = {item['customer'] for item in items if item.get('customer')}
+
+    products = set(Product.objects.filter(tenant=tenant, id__in=product_ids).values_list('id', flat=True))
+    pipelines = dict(
+        LeadPipeline.objects.filter(tenant=tenant, id__in=pipeline_ids).values_list('id', 'product_id')
+    )
+    stages = dict(LeadStage.objects.filter(tenant=tenant, id__in=stage_ids).values_list('id', 'pipeline_id'))
+    customers = set(Customer.objects.filter(tenant=tenant, id__in=customer_ids).values_list('id', flat=True))
+    existing = dict(
+        Lead.objects.filter(tenant=tenant, client_uuid__in=[item['client_uuid'] for item in items])
+        .values_list('client_uuid', 'id')
+    )
+
+    now = timezone.now()
+    results = []
+    new_leads = []
+    seen = {}
+    for item, apps in zip(items, apps_of):
+        uuid = item['client_uuid']
+        result = {'client_uuid': str(uuid), 'status': 'created', 'id': None, 'errors': None}
+        results.append(result)
+
+        if uuid in existing or uuid in seen:
+            result['status'] = 'duplicate'
+            result['id'] = existing.get(uuid)
+            if uuid in seen:
+                seen[uuid].append(result)
+            continue
+
+        errors = _reference_errors(item, apps, products, pipelines, stages, customers)
+        if errors:
+            result['status'] = 'invalid'
+            result['errors'] = errors
+            continue
+
+        lead = Lead(
+            tenant=tenant, agent_id=agent_id, client_uuid=uuid,
+            customer_id=item.get('customer'), server_received_at=now,
+            **{field: item.get(field) for field in LEAD_FIELDS},
+        )
+        new_leads.append((lead, apps))
+        seen[uuid] = [result]
+
+    Lead.objects.bulk_create([lead for lead, _ in new_leads])
+    # bulk_create skips the post_save signal that counts captured leads
+    _count_captured([lead for lead, _ in new_leads])
+
+    new_apps = []
+    for lead, apps in new_leads:
+        for result in seen[lead.client_uuid]:
+            result['id'] = lead.id
+        for app in apps:
+            new_apps.append(LeadApplication(
+                tenant=tenant, lead=lead, product_id=app['product'], pipeline_id=app['pipeline'],
+                current_stage_id=app['current_stage'], app_id=app.get('app_id'),
+                is_primary=app['is_primary'], status_last_updated_at=now,
+            ))
+    LeadApplication.objects.bulk_create(new_apps)
+
+    primaries = []
+    for app in new_apps:
+        if app.is_primary:
+            app.lead.primary_application = app
+            primaries.append(app.lead)
+    if primaries:
+        Lead.objects.bulk_update(primaries, ['primary_application'])
+
+    return results
+
+
+def _count_captured(leads):
+    from analytics.services import add_lead_deltas, apply_kpi_deltas, new_kpi_deltas
+
+    deltas = new_kpi_deltas()
+    for lead in leads:
+        add_lead_deltas(deltas, lead)
+    if deltas:
+        apply_kpi_deltas(deltas)
+
+
+def _reference_errors(item, apps, products, pipelines, stages, customers):
+    errors = {}
+    if item.get('customer') and item['customer'] not in customers:
+        errors['customer'] = ['Unknown customer.']
+    app_errors = []
+    for app in apps:
+        error = {}
+        if app['product'] not in products:
+            error['product'] = ['Unknown product.']
+        if app['pipeline'] not in pipelines:
+            error['pipeline'] = ['Unknown pipeline.']
+        elif pipelines[app['pipeline']] != app['product']:
+            error['pipeline'] = ['Pipeline does not belong to the product.']
+        if stages.get(app['current_stage']) != app['pipeline']:
+            error['current_stage'] = ['Stage does not belong to the pipeline.']
+        app_errors.append(error)
+    if any(app_errors):
+        errors['applications'] = app_errors
+    return errors
+
+
+def transition_applications(tenant, moves):
+    """
+    Move lead applications to new stages.
+
+    moves: list of {'application': id, 'to_stage': id, 'note': str | None}.
+    The applications are locked (select_for_update, in id order) and each
+    valid move writes a LeadStageHistory row and updates current_stage,
+    status_last_updated_at and last_stage_history, all in one transaction
+    with a fixed number of queries however many moves there are.
+
+    Returns one result dict per move, in order:
+    {'application', 'status': 'moved' | 'invalid', 'history_id', 'errors'}.
+    """
+    if not moves:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        apps = {
+            app.id: app
+            for app in LeadApplication.objects.select_for_update(of=('self',))
+            .select_related('current_stage')
+            .filter(tenant=tenant, id__in={move['application'] for move in moves})
+            .order_by('id')
+        }
+        stages = {
+            stage.id: stage
+            for stage in LeadStage.objects.filter(tenant=tenant, id__in={move['to_stage'] for move in moves})
+        }
+
+        results = []
+        moved = []
+        moved_ids = set()
+        for move in moves:
+            result = {'application': move['application'], 'status': 'moved', 'history_id': None, 'errors': None}
+            results.append(result)
+            app = apps.get(move['application'])
+            error = _transition_error(app, stages.get(move['to_stage']))
+            if error is None and app.id in moved_ids:
+                error = 'Application is moved more than once in this batch.'
+            if error:
+                result['status'] = 'invalid'
+                result['errors'] = [error]
+                continue
+
+            history = LeadStageHistory(
+                tenant=tenant, lead_id=app.lead_id, lead_application=app,
+                from_stage=app.current_stage, to_stage=stages[move['to_stage']],
+                changed_at=now, note=move.get('note'),
+            )
+            moved.append((app, history, result))
+            moved_ids.add(app.id)
+
+        LeadStageHistory.objects.bulk_create([history for _, history, _ in moved])
+        for app, history, result in moved:
+            app.current_stage = history.to_stage
+            app.last_stage_history = history
+            app.status_last_updated_at = now
+            app.updated_at = now
+            result['history_id'] = history.id
+        LeadApplication.objects.bulk_update(
+            [app for app, _, _ in moved],
+            ['current_stage', 'last_stage_history', 'status_last_updated_at', 'updated_at'],
+        )
+
+    return results
+
+
+def _transition_error(app, to_stage):
+    """Why an application cannot move to to_stage, or None if it can."""
+    if app is None:
+        return 'Unknown application.'
+    if to_stage is None or to_stage.pipeline_id != app.pipeline_id:
+        return "Stage does not belong to the application's pipeline."
+    if not to_stage.is_active:
+        return 'Stage is inactive.'
+    current = app.current_stage
+    if to_stage.id == current.id:
+        return 'Application is already in this stage.'
+    if current.is_terminal:
+        return 'Application is already in a terminal stage.'
+    # Terminal stages (won/lost) can be reached from anywhere; otherwise the
+    # pipeline only moves forward
+    if not to_stage.is_terminal and to_stage.stage_order < current.stage_order:
+        return 'Cannot move back to an earlier stage.'
+    return None
@@ -1,3 +1,288 @@
-from django.test import TestCase
+import uuid
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from posightful.testing import TenantFixtureMixin
+from tenancy.models import Customer, Product
+from conversions.models import Sale
+from leads.models import LeadPipeline, LeadStage, Lead, LeadApplication, LeadStageHistory
+from leads.services import BULK_LEADS_MAX
+
+
+class LeadTestMixin(TenantFixtureMixin):
+
+    def _setup_tenant(self):
+        super()._setup_tenant()
+        self.user = self._create_user("manager")
+        self._grant(self.user, "MANAGER")
+        self.agent = self._create_agent(user=self.user)
+        self.customer = Customer.objects.create(tenant=self.tenant, full_name="Customer")
+        self.product = Product.objects.create(tenant=self.tenant, code="POS-TERM", name="POS Terminal")
+        self.pipeline = LeadPipeline.objects.create(tenant=self.tenant, product=self.product, name="Sales")
+        self.stages = {
+            name: LeadStage.objects.create(tenant=self.tenant, pipeline=self.pipeline, name=name, stage_order=i)
+            for i, name in enumerate(["New", "Negotiation", "Won", "Lost"], start=1)
+        }
+
+    def _create_lead(self, stage=None, primary_stage=None, sale_amount=None):
+        lead = Lead.objects.create(
+            tenant=self.tenant, agent=self.agent, customer=self.customer, customer_name="Customer",
+        )
+        if stage:
+            LeadApplication.objects.create(
+                tenant=self.tenant, lead=lead, product=self.product, pipeline=self.pipeline,
+                current_stage=self.stages[stage],
+            )
+        if primary_stage:
+            LeadApplication.objects.create(
+                tenant=self.tenant, lead=lead, product=self.product, pipeline=self.pipeline,
+                current_stage=self.stages[primary_stage], is_primary=True,
+            )
+        if sale_amount:
+            Sale.objects.create(
+                tenant=self.tenant, lead=lead, customer=self.customer, agent=self.agent,
+                product=self.product, amount=Decimal(sale_amount), status="completed",
+                sold_at=timezone.now(),
+            )
+        return lead
+
+
+class LeadListTest(LeadTestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _results_by_id(self):
+        response = self.client.get("/api/leads/leads/")
+        return {row["id"]: row for row in response.data["results"]}
+
+    def test_status_and_sale_amount(self):
+        new = self._create_lead()
+        pending = self._create_lead(stage="Negotiation")
+        primary_wins = self._create_lead(stage="Lost", primary_stage="Won", sale_amount="1500")
+
+        rows = self._results_by_id()
+
+        self.assertEqual(rows[new.id]["status"], "new")
+        self.assertEqual(rows[pending.id]["status"], "pending")
+        self.assertEqual(rows[primary_wins.id]["status"], "converted")
+        self.assertEqual(rows[primary_wins.id]["sale_amount"], 1500.0)
+        self.assertIsNone(rows[pending.id]["sale_amount"])
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for _ in range(2):
+            self._create_lead(stage="Negotiation", sale_amount="100")
+        self.client.get("/api/leads/leads/")  # resolves and caches the user's scope
+        # Count, leads page (with sale subquery), applications prefetch
+        with self.assertNumQueries(3):
+            self.client.get("/api/leads/leads/")
+
+        for _ in range(20):
+            self._create_lead(stage="New", primary_stage="Won", sale_amount="100")
+        with self.assertNumQueries(3):
+            self.client.get("/api/leads/leads/")
+
+
+class LeadCursorPaginationTest(LeadTestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.leads = [self._create_lead() for _ in range(5)]
+        # Identical timestamps on two leads: the id tie-break must keep them apart
+        Lead.objects.filter(pk__in=[self.leads[1].pk, self.leads[2].pk]).update(
+            created_at=self.leads[1].created_at,
+        )
+
+    def test_default_is_page_number(self):
+        response = self.client.get("/api/leads/leads/")
+        self.assertEqual(response.data["count"], 5)
+
+    def test_cursor_pages_walk_every_lead_once(self):
+        seen = []
+        url, params = "/api/leads/leads/", {"pagination": "cursor", "page_size": 2}
+        while url:
+            response = self.client.get(url, params)
+            self.assertNotIn("count", response.data)
+            seen += [row["id"] for row in response.data["results"]]
+            url, params = response.data["next"], None
+
+        expected = Lead.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_cursor_page_skips_count_query(self):
+        self.client.get("/api/leads/leads/")  # resolves and caches the user's scope
+        # Leads page (with sale subquery), applications prefetch
+        with self.assertNumQueries(2):
+            self.client.get("/api/leads/leads/", {"pagination": "cursor"})
+
+
+class LeadBulkCreateTest(LeadTestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self._setup_tenant()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _lead(self, **kwargs):
+        data = {
+            "client_uuid": str(uuid.uuid4()),
+            "customer_name": "Offline customer",
+            "customer_phone": "+998900000001",
+            "applications": [{
+                "product": self.product.id, "pipeline": self.pipeline.id,
+                "current_stage": self.stages["New"].id, "is_primary": True,
+            }],
+        }
+        data.update(kwargs)
+        return data
+
+    def _post(self, leads):
+        return self.client.post("/api/leads/leads/bulk/", {"leads": leads}, format="json")
+
+    def test_creates_leads_with_applications(self):
+        response = self._post([self._lead(), self._lead(applications=[])])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        lead = Lead.objects.get(pk=response.data["results"][0]["id"])
+        self.assertEqual(lead.agent, self.agent)
+        self.assertIsNotNone(lead.server_received_at)
+        self.assertEqual(lead.primary_application.current_stage, self.stages["New"])
+        self.assertEqual(Lead.objects.get(pk=response.data["results"][1]["id"]).applications.count(), 0)
+
+    def test_resending_is_idempotent(self):
+        leads = [self._lead(), self._lead()]
+        first = self._post(leads)
+        second = self._post(leads + [leads[0]])
+
+        self.assertEqual(second.data["created"], 0)
+        self.assertEqual(second.data["duplicates"], 3)
+        self.assertEqual(
+            [r["id"] for r in second.data["results"]],
+            [r["id"] for r in first.data["results"]] + [first.data["results"][0]["id"]],
+        )
+        self.assertEqual(Lead.objects.count(), 2)
+
+    def test_invalid_items_are_reported_without_blocking_the_batch(self):
+        other = LeadStage.objects.create(
+            tenant=self.tenant, pipeline=LeadPipeline.objects.create(
+                tenant=self.tenant, product=self.product, name="Other",
+            ), name="Elsewhere", stage_order=1,
+        )
+        bad_stage = self._lead()
+        bad_stage["applications"][0]["current_stage"] = other.id
+
+        response = self._post([self._lead(), {"customer_name": "No uuid"}, bad_stage])
+
+        statuses = [r["status"] for r in response.data["results"]]
+        self.assertEqual(statuses, ["created", "invalid", "invalid"])
+        self.assertIn("client_uuid", response.data["results"][1]["errors"])
+        self.assertIn("current_stage", response.data["results"][2]["errors"]["applications"][0])
+        self.assertEqual(Lead.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        self._post([self._lead()])  # resolves and caches the user's scope
+        # Savepoint, products, pipelines, stages, existing client_uuids, leads
+        # insert, applications insert, primary_application update, release,
+        # plus the leads_captured KPI increment (savepoint, shared KPI lock,
+        # daily upsert, three rollup upserts, release)
+        with self.assertNumQueries(16):
+            self._post([self._lead() for _ in range(2)])
+        with self.assertNumQueries(16):
+            self._post([self._lead() for _ in range(30)])
+
+    def test_single_create_ignores_client_uuid(self):
+        data = {"customer_name": "Walk-in", "client_uuid": self._lead()["client_uuid"]}
+        first = self.client.post("/api/leads/leads/", data, format="json")
+        second = self.client.post("/api/leads/leads/", data, format="json")
+
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertIsNone(first.data["client_uuid"])
+
+    def test_rejects_oversized_batches(self):
+        response = self._post([self._lead() for _ in range(BULK_LEADS_MAX + 1)])
+        self.assertEqual(response.status_code, 400)
+
+
+class StageTransitionTest(LeadTestMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self._setup_tenant()
+        LeadStage.objects.filter(pk=self.stages["Lost"].pk).update(is_terminal=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _application(self, stage="New"):
+        return self._create_lead(stage=stage).applications.get()
+
+    def test_single_transition_writes_history(self):
+        app = self._application()
+
+        response = self.client.post(
+            f"/api/leads/applications/{app.id}/transition/",
+            {"to_stage": self.stages["Negotiation"].id, "note": "Called back"}, format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["current_stage_name"], "Negotiation")
+        app.refresh_from_db()
+        history = app.last_stage_history
+        self.assertEqual(history.from_stage, self.stages["New"])
+        self.assertEqual(history.to_stage, self.stages["Negotiation"])
+        self.assertEqual(history.note, "Called back")
+        self.assertEqual(app.status_last_updated_at, history.changed_at)
+
+    def test_stage_order_rules(self):
+        app = self._application(stage="Negotiation")
+        url = f"/api/leads/applications/{app.id}/transition/"
+
+        backwards = self.client.post(url, {"to_stage": self.stages["New"].id}, format="json")
+        self.assertEqual(backwards.status_code, 400)
+
+        # Terminal stages are reachable from anywhere, but nothing leaves them
+        self.assertEqual(self.client.post(url, {"to_stage": self.stages["Lost"].id}, format="json").status_code, 200)
+        self.assertEqual(self.client.post(url, {"to_stage": self.stages["Won"].id}, format="json").status_code, 400)
+        self.assertEqual(LeadStageHistory.objects.filter(lead_application=app).count(), 1)
+
+    def test_batch_transition_reports_each_move(self):
+        apps = [self._application() for _ in range(3)]
+        other_pipeline = LeadPipeline.objects.create(tenant=self.tenant, product=self.product, name="Other")
+        foreign = LeadStage.objects.create(tenant=self.tenant, pipeline=other_pipeline, name="Foreign", stage_order=1)
+
+        response = self.client.post("/api/leads/applications/transition/", {"transitions": [
+            {"application": apps[0].id, "to_stage": self.stages["Won"].id},
+            {"application": apps[1].id, "to_stage": foreign.id},
+            {"application": apps[2].id, "to_stage": self.stages["Negotiation"].id},
+            {"application": apps[2].id, "to_stage": self.stages["Won"].id},
+        ]}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["status"] for r in response.data["results"]], ["moved", "invalid", "moved", "invalid"])
+        stages = dict(LeadApplication.objects.values_list("id", "current_stage__name"))
+        self.assertEqual([stages[a.id] for a in apps], ["Won", "New", "Negotiation"])
+
+    def test_batch_query_count_does_not_grow(self):
+        def move(apps, stage):
+            return self.client.post("/api/leads/applications/transition/", {"transitions": [
+                {"application": app.id, "to_stage": self.stages[stage].id} for app in apps
+            ]}, format="json")
+
+        # Savepoint, locked applications, stages, history insert,
+        # applications update, release
+        few = [self._application() for _ in range(2)]
+        with self.assertNumQueries(6):
+            move(few, "Negotiation")
+        many = [self._application() for _ in range(40)]
+        with self.assertNumQueries(6):
+            move(many, "Negotiation")
@@ -1,10 +1,15 @@
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, status
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db.models import OuterRef, Prefetch, Subquery
+from posightful.pagination import CreatedAtCursorPagination, ChangedAtCursorPagination
 from .models import LeadPipeline, LeadStage, Lead, LeadApplication, LeadStageHistory
 from .serializers import (
     LeadPipelineSerializer, LeadStageSerializer,
-    LeadSerializer, LeadApplicationSerializer, LeadStageHistorySerializer,
+    LeadSerializer, LeadApplicationSerializer, LeadStageHistorySerializer, BulkLeadSerializer,
+    StageTransitionSerializer,
 )
 
 
@@ -49,14 +54,27 @@ class LeadStageViewSet(TenantScopedViewSet):
 
 class LeadViewSet(TenantScopedViewSet):
     serializer_class = LeadSerializer
+    pagination_class = CreatedAtCursorPagination
     filterset_fields = ['agent', 'customer', 'interaction_type']
     search_fields = ['customer_name', 'customer_phone']
     ordering_fields = ['created_at', 'server_received_at']
 
     def get_queryset(self):
+        from conversions.models import Sale
+        completed_sale = Sale.objects.filter(
+            lead=OuterRef('pk'), status='completed',
+        ).order_by('pk').values('amount')[:1]
+
         qs = Lead.objects.select_related(
             'tenant', 'agent', 'agent__user', 'customer', 'primary_application'
-        ).prefetch_related('applications__product', 'applications__current_stage').all()
+        ).prefetch_related(
+            Prefetch(
+                'applications',
+                queryset=LeadApplication.objects.select_related('product', 'current_stage').order_by('id'),
+            ),
+        ).annotate(
+            completed_sale_amount=Subquery(completed_sale),
+        )
 
         user = self.request.user
         if not user.tenant_id:
@@ -64,49 +82,71 @@ class LeadViewSet(TenantScopedViewSet):
 
         qs = qs.filter(tenant=user.tenant)
 
-        from users.models import UserRole
-        user_roles = set(
-            UserRole.objects.filter(user=user, tenant=user.tenant)
-            .values_list('role__code', flat=True)
-        )
-
-        # Managers, admins, finance see all leads in tenant
-        if user_roles & {'MANAGER', 'ADMIN', 'FINANCE'}:
-            return qs
-
-        # Supervisors see their team's leads + own
-        if 'SUPERVISOR' in user_roles:
-            from tenancy.models import Agent
-            supervised_agents = Agent.objects.filter(
-                parent__user=user, tenant=user.tenant,
-            ).values_list('id', flat=True)
-            own_agent = Agent.objects.filter(
-                user=user, tenant=user.tenant,
-            ).values_list('id', flat=True)
-            agent_ids = list(supervised_agents) + list(own_agent)
-            return qs.filter(agent_id__in=agent_ids)
-
-        # Agents see only their own leads
-        from tenancy.models import Agent
-        agent = Agent.objects.filter(user=user, tenant=user.tenant).first()
-        if agent:
-            return qs.filter(agent=agent)
-
-        return qs.none()
+        # Managers, admins, finance see all leads in tenant; supervisors their
+        # team's leads + own; agents only their own
+        from tenancy.scope import get_user_scope
+        return get_user_scope(user).filter_queryset(qs)
 
     def perform_create(self, serializer):
-        from tenancy.models import Agent
+        from tenancy.scope import get_user_scope
         kwargs = {}
         user = self.request.user
         if user.tenant_id:
             kwargs['tenant'] = user.tenant
-        # Auto-assign agent from the logged-in user's agent profile
-        if not serializer.validated_data.get('agent'):
-            agent = Agent.objects.filter(user=user, tenant=user.tenant).first()
-            if agent:
-                kwargs['agent'] = agent
+            # Auto-assign agent from the logged-in user's agent profile
+            agent_id = get_user_scope(user).agent_id
+            if not serializer.validated_data.get('agent') and agent_id:
+                kwargs['agent_id'] = agent_id
         serializer.save(**kwargs)
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Create a batch of leads (with nested applications) captured offline.
+
+        Body: a list of leads, or {"leads": [...]}. Each lead needs a
+        client-generated client_uuid; re-sending a lead that already exists
+        reports it as a duplicate. Responds with one result per lead.
+        """
+        from tenancy.scope import get_user_scope
+        from .services import BULK_LEADS_MAX, bulk_create_leads
+
+        user = request.user
+        if not user.tenant_id:
+            return Response({'error': 'No tenant'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = request.data.get('leads') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of leads'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > BULK_LEADS_MAX:
+            return Response(
+                {'error': f'At most {BULK_LEADS_MAX} leads per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        valid = []
+        results = []
+        for item in items:
+            serializer = BulkLeadSerializer(data=item)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                results.append(None)
+            else:
+                uuid = item.get('client_uuid') if isinstance(item, dict) else None
+                results.append({
+                    'client_uuid': uuid, 'status': 'invalid', 'id': None, 'errors': serializer.errors,
+                })
+
+        created = iter(bulk_create_leads(user.tenant, get_user_scope(user).agent_id, valid))
+        results = [result or next(created) for result in results]
+
+        return Response({
+            'created': sum(1 for r in results if r['status'] == 'created'),
+            'duplicates': sum(1 for r in results if r['status'] == 'duplicate'),
+            'invalid': sum(1 for r in results if r['status'] == 'invalid'),
+            'results': results,
+        })
+
 
 class LeadApplicationViewSet(TenantScopedViewSet):
     serializer_class = LeadApplicationSerializer
@@ -119,9 +159,62 @@ class LeadApplicationViewSet(TenantScopedViewSet):
             'tenant', 'lead', 'product', 'pipeline', 'current_stage'
         ).all()
 
+    @action(detail=True, methods=['post'])
+    def transition(self, request, pk=None):
+        """Move one application to another stage of its pipeline."""
+        from .services import transition_applications
+
+        application = self.get_object()
+        serializer = StageTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        move = dict(serializer.validated_data, application=application.id)
+
+        result = transition_applications(application.tenant, [move])[0]
+        if result['status'] != 'moved':
+            return Response({'to_stage': result['errors']}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(self.get_queryset().get(pk=application.pk)).data)
+
+    @action(detail=False, methods=['post'], url_path='transition')
+    def transition_batch(self, request):
+        """
+        Move many applications at once.
+
+        Body: {"transitions": [{"application", "to_stage", "note"}, ...]}.
+        Valid moves are applied in one transaction; responds with one
+        result per move.
+        """
+        from .services import TRANSITIONS_MAX, transition_applications
+
+        user = request.user
+        if not user.tenant_id:
+            return Response({'error': 'No tenant'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = request.data.get('transitions') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of transitions'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > TRANSITIONS_MAX:
+            return Response(
+                {'error': f'At most {TRANSITIONS_MAX} transitions per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = StageTransitionSerializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        moves = serializer.validated_data
+        if any('application' not in move for move in moves):
+            return Response({'error': 'Every transition needs an application'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = transition_applications(user.tenant, moves)
+        return Response({
+            'moved': sum(1 for r in results if r['status'] == 'moved'),
+            'invalid': sum(1 for r in results if r['status'] == 'invalid'),
+            'results': results,
+        })
+
 
 class LeadStageHistoryViewSet(TenantScopedViewSet):
     serializer_class = LeadStageHistorySerializer
+    pagination_class = ChangedAtCursorPagination
     filterset_fields = ['lead', 'lead_application', 'from_stage', 'to_stage']
     ordering_fields = ['changed_at']
     http_method_names = ['get', 'head', 'options']
@@ -206,6 +206,7 @@ class Command(BaseCommand):
 
         # Collect all credentials for the output file
         credentials_report = []
+        seeded_tenant_ids = []
         now = timezone.now()
 
         # ── Roles ──────────────────────────────────────────────
@@ -1217,74 +1218,31 @@ class Command(BaseCommand):
             _force_dates(CommissionPolicy, cp.pk,
                          created_at=bonus_created, updated_at=bonus_created)
 
-            # ── KPI Agent Daily (derived from actual Leads & Sales) ─
-            self.stdout.write('  Creating KPI daily records from real data...')
-            kpi_count = 0
-
-            # Build daily lead counts per agent from DB (not Python objects,
-            # because _force_dates updates DB but not in-memory objects)
-            from collections import defaultdict
-            daily_leads = defaultdict(lambda: defaultdict(int))   # {agent_id: {date: count}}
-            for lead in Lead.objects.filter(tenant=tenant).values('agent_id', 'created_at'):
-                lead_date = lead['created_at'].date()
-                daily_leads[lead['agent_id']][lead_date] += 1
-
-            # Build daily sale counts & revenue per agent from actual Sale records
-            daily_sales = defaultdict(lambda: defaultdict(lambda: {'count': 0, 'revenue': Decimal('0')}))
-            all_sales = Sale.objects.filter(tenant=tenant, status='completed')
-            for sale in all_sales:
-                sale_date = sale.sold_at.date() if sale.sold_at else sale.created_at.date()
-                daily_sales[sale.agent_id][sale_date]['count'] += 1
-                daily_sales[sale.agent_id][sale_date]['revenue'] += sale.amount
-
-            # Collect all dates that have activity
-            all_dates = set()
-            for agent_dates in daily_leads.values():
-                all_dates.update(agent_dates.keys())
-            for agent_dates in daily_sales.values():
-                all_dates.update(agent_dates.keys())
-
-            for agent in all_field_agents:
-                for kpi_date in sorted(all_dates):
-                    leads_captured = daily_leads[agent.id].get(kpi_date, 0)
-                    sale_info = daily_sales[agent.id].get(kpi_date, {'count': 0, 'revenue': Decimal('0')})
-                    leads_converted = sale_info['count']
-                    revenue = sale_info['revenue']
-
-                    # Skip days with zero activity for this agent
-                    if leads_captured == 0 and leads_converted == 0:
-                        continue
-
-                    conv_rate = Decimal(str(round(
-                        leads_converted / max(leads_captured, 1) * 100, 2)))
-                    bonus = Decimal(str(round(float(revenue) * random.uniform(0.08, 0.15), 2)))
-                    net_profit = revenue - bonus
-
-                    kpi_created_at = timezone.make_aware(
-                        datetime.datetime.combine(
-                            kpi_date, datetime.time(23, random.randint(0, 59), random.randint(0, 59))
-                        )
-                    )
-
-                    kpi, _ = KPIAgentDaily.objects.update_or_create(
-                        tenant=tenant, agent=agent, kpi_date=kpi_date,
-                        defaults={
-                            'leads_captured': leads_captured,
-                            'leads_converted': leads_converted,
-                            'conversion_rate': conv_rate,
-                            'revenue_amount': revenue,
-                            'bonus_amount': bonus,
-                            'net_profit': net_profit,
-                            'avg_time_to_convert': datetime.timedelta(
-                                hours=random.randint(1, 96)),
-                        }
-                    )
-                    KPIAgentDaily.objects.filter(pk=kpi.pk).update(
-                        created_at=kpi_created_at)
-                    kpi_count += 1
-            self.stdout.write(self.style.SUCCESS(f'    {kpi_count} KPI daily records (from real leads & sales)'))
-
             credentials_report.append(tenant_report)
+            seeded_tenant_ids.append(tenant.id)
+
+        # ── Bonuses & KPIs (derived from the seeded Leads & Sales) ──
+        # The signals counted leads on the day they were inserted, before
+        # _force_dates back-dated them, and queued every completed sale in
+        # the bonus outbox while the tenant had no bonus rules yet. Drop the
+        # queued events, record the bonuses with the rules in effect at sale
+        # time and recompute the KPIs of the seeded range from the data.
+        from bonuses.models import BonusOutbox
+        from bonuses.services import award_bonuses
+        from analytics.services import rebuild_kpis
+
+        self.stdout.write('Awarding bonuses and rebuilding KPIs...')
+        seeded_sales = Sale.objects.filter(tenant_id__in=seeded_tenant_ids)
+        BonusOutbox.objects.filter(sale__in=seeded_sales).delete()
+        bonus_count, _ = award_bonuses(seeded_sales, at_sale_time=True, update_kpis=False)
+        self.stdout.write(self.style.SUCCESS(f'  {bonus_count} bonus ledger entries'))
+
+        # Leads and sales go back kpi_days plus up to a day of random hours
+        kpi_from = (now - datetime.timedelta(days=kpi_days + 1)).date()
+        kpi_count = 0
+        for tenant_id in seeded_tenant_ids:
+            kpi_count += rebuild_kpis(kpi_from, timezone.now().date(), tenant_id=tenant_id)
+        self.stdout.write(self.style.SUCCESS(f'  {kpi_count} KPI daily records (from real leads & sales)'))
 
         # ── Generate credentials.txt ──────────────────────────
         output_path = os.path.join(
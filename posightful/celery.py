@@ -0,0 +1,18 @@
+"""
+Celery application for posightful.
+
+Start a worker with:
+    celery -A posightful worker -l info
+
+and the scheduler for periodic tasks (CELERY_BEAT_SCHEDULE) with:
+    celery -A posightful beat -l info
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'posightful.settings')
+
+app = Celery('posightful')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -0,0 +1,12 @@
+"""Helpers shared by the apps' management commands."""
+import datetime
+
+from django.core.management.base import CommandError
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD option value, raising CommandError when it is invalid."""
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}". Use YYYY-MM-DD')
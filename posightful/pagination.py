@@ -0,0 +1,80 @@
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on a fixed (timestamp, id) ordering.
+
+    ?ordering is ignored in cursor mode: the ordering must match a composite
+    index for each page to be a single index range scan.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+
+class PageOrCursorPagination(BasePagination):
+    """
+    Page-number pagination by default; keyset cursor pagination when the
+    client opts in with ?pagination=cursor (or follows a `next` link, which
+    carries ?cursor=). Cursor pages skip the COUNT(*) and OFFSET scan, so
+    deep pages cost the same as the first one.
+
+    Subclasses set cursor_ordering to the (timestamp, id) pair their
+    composite index covers.
+    """
+    cursor_ordering = ('-created_at', '-id')
+
+    def _use_cursor(self, request):
+        return (
+            request.query_params.get('pagination') == 'cursor'
+            or KeysetCursorPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self._use_cursor(request):
+            self.paginator = KeysetCursorPagination()
+            self.paginator.ordering = self.cursor_ordering
+        else:
+            self.paginator = PageNumberPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return PageNumberPagination().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return PageNumberPagination().get_schema_operation_parameters(view) + [
+            {
+                'name': 'pagination',
+                'required': False,
+                'in': 'query',
+                'description': 'Set to "cursor" for keyset pagination.',
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+        ] + KeysetCursorPagination().get_schema_operation_parameters(view)
+
+    @property
+    def display_page_controls(self):
+        paginator = getattr(self, 'paginator', None)
+        return bool(paginator and paginator.display_page_controls)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+
+class CreatedAtCursorPagination(PageOrCursorPagination):
+    cursor_ordering = ('-created_at', '-id')
+
+
+class SoldAtCursorPagination(PageOrCursorPagination):
+    cursor_ordering = ('-sold_at', '-id')
+
+
+class ChangedAtCursorPagination(PageOrCursorPagination):
+    cursor_ordering = ('-changed_at', '-id')
@@ -205,5 +205,61 @@ SWAGGER_SETTINGS = {
     'SUPPORTED_SUBMIT_METHODS': ['get', 'post', 'put', 'delete', 'patch'],
 }
 
+# Cache (analytics responses, conversation analyses); Redis when
+# CACHE_REDIS_URL is set, else per-process memory
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', '')
+
+# Analyses kept by the in-memory fallback cache (Redis evicts by its own
+# maxmemory policy); 0 disables analysis caching
+CONVERSATION_ANALYSIS_CACHE_SIZE = int(os.getenv('CONVERSATION_ANALYSIS_CACHE_SIZE', '1024'))
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        },
+        'conversation_analysis': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'conversation_analysis',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'conversation_analysis': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'conversation_analysis',
+            'OPTIONS': {'MAX_ENTRIES': max(CONVERSATION_ANALYSIS_CACHE_SIZE, 1)},
+        },
+    }
+
+# Seconds an analytics response stays cached; writes for the tenant invalidate it sooner
+ANALYTICS_CACHE_TIMEOUT = int(os.getenv('ANALYTICS_CACHE_TIMEOUT', '300'))
+
 # OpenAI API Key (for conversation analysis)
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+
+# Celery (background tasks)
+# Set CELERY_BROKER_URL=memory:// for an in-process broker, or
+# CELERY_TASK_ALWAYS_EAGER=True to run tasks inline without any broker.
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TIMEZONE = TIME_ZONE
+
+# Seconds between periodic bonus outbox drains (celery beat), which pick up
+# rescheduled rows and drains skipped while another worker held the lock
+BONUS_OUTBOX_DRAIN_INTERVAL = int(os.getenv('BONUS_OUTBOX_DRAIN_INTERVAL', '60'))
+CELERY_BEAT_SCHEDULE = {
+    'drain-bonus-outbox': {
+        'task': 'bonuses.tasks.drain_bonus_outbox_task',
+        'schedule': BONUS_OUTBOX_DRAIN_INTERVAL,
+        # A backlog of missed runs is one drain's work, not many
+        'options': {'expires': BONUS_OUTBOX_DRAIN_INTERVAL},
+    },
+}
@@ -0,0 +1,35 @@
+"""Fixtures shared by the apps' tests."""
+from users.models import User, Role, UserRole
+from tenancy.models import Tenant, Region, City, Agent
+
+
+class TenantFixtureMixin:
+    """A tenant with one region and city, and factories for its users and agents."""
+
+    def _setup_tenant(self):
+        self.tenant = Tenant.objects.create(name="Test Company", code="TEST01")
+        self.region = Region.objects.create(tenant=self.tenant, name="Tashkent")
+        self.city = City.objects.create(tenant=self.tenant, region=self.region, name="Tashkent City")
+        self._user_seq = 0
+        self._agent_seq = 0
+
+    def _create_user(self, username):
+        self._user_seq += 1
+        return User.objects.create_user(
+            username=username, email=f"{username}@test.com",
+            phone_number=f"+99890{self._user_seq:07d}", password="testpass123",
+            tenant=self.tenant, full_name=username.replace("_", " ").title(),
+        )
+
+    def _create_agent(self, user=None, parent=None):
+        """An active agent AG001, AG002, ... with its own user unless one is given."""
+        self._agent_seq += 1
+        return Agent.objects.create(
+            tenant=self.tenant, user=user or self._create_user(f"agent_{self._agent_seq}"),
+            agent_code=f"AG{self._agent_seq:03d}", parent=parent,
+            region=self.region, city=self.city, status="active",
+        )
+
+    def _grant(self, user, code):
+        role, _ = Role.objects.get_or_create(code=code, defaults={"name": code.title()})
+        return UserRole.objects.create(tenant=self.tenant, user=user, role=role)
@@ -0,0 +1,113 @@
+"""
+Maintenance of the AgentHierarchy closure table.
+
+Every agent has a depth-0 row to itself plus one row per ancestor. Moving an
+agent re-links its whole subtree under the new parent's ancestors; deleting
+an agent detaches its subordinates' subtrees (Agent.parent is SET_NULL, and
+that update does not fire signals).
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import Agent, AgentHierarchy
+
+
+def subtree_ids(agent_id, include_self=True):
+    """IDs of the agent and everyone below it (one indexed query)."""
+    links = AgentHierarchy.objects.filter(ancestor_id=agent_id)
+    if not include_self:
+        links = links.filter(depth__gte=1)
+    return list(links.values_list('descendant_id', flat=True))
+
+
+def would_create_cycle(agent, parent):
+    """True if making `parent` the parent of `agent` would create a loop."""
+    if parent is None or agent.pk is None:
+        return False
+    if parent.pk == agent.pk:
+        return True
+    return AgentHierarchy.objects.filter(ancestor_id=agent.pk, descendant_id=parent.pk).exists()
+
+
+def insert_agent(agent):
+    """Create the closure rows of a newly created agent."""
+    rows = [AgentHierarchy(tenant_id=agent.tenant_id, ancestor_id=agent.pk, descendant_id=agent.pk, depth=0)]
+    if agent.parent_id:
+        rows += [
+            AgentHierarchy(
+                tenant_id=agent.tenant_id, ancestor_id=link.ancestor_id,
+                descendant_id=agent.pk, depth=link.depth + 1,
+            )
+            for link in AgentHierarchy.objects.filter(descendant_id=agent.parent_id)
+        ]
+    AgentHierarchy.objects.bulk_create(rows)
+
+
+@transaction.atomic
+def move_agent(agent, old_parent_id):
+    """Re-link the agent's subtree after its parent changed from old_parent_id."""
+    subtree = list(AgentHierarchy.objects.filter(ancestor_id=agent.pk))
+    member_ids = [link.descendant_id for link in subtree]
+
+    if old_parent_id:
+        AgentHierarchy.objects.filter(
+            descendant_id__in=member_ids,
+        ).exclude(ancestor_id__in=member_ids).delete()
+
+    if agent.parent_id:
+        new_ancestors = list(AgentHierarchy.objects.filter(descendant_id=agent.parent_id))
+        AgentHierarchy.objects.bulk_create([
+            AgentHierarchy(
+                tenant_id=agent.tenant_id, ancestor_id=up.ancestor_id,
+                descendant_id=down.descendant_id, depth=up.depth + down.depth + 1,
+            )
+            for up in new_ancestors
+            for down in subtree
+        ])
+
+
+def detach_subordinates(agent):
+    """Before an agent is deleted: cut its subordinates' subtrees loose."""
+    below = subtree_ids(agent.pk, include_self=False)
+    if not below:
+        return
+    above = list(
+        AgentHierarchy.objects.filter(descendant_id=agent.pk).values_list('ancestor_id', flat=True)
+    )
+    AgentHierarchy.objects.filter(descendant_id__in=below, ancestor_id__in=above).delete()
+
+
+@transaction.atomic
+def rebuild_hierarchy(tenant_id=None):
+    """Recompute the closure table from Agent.parent. Returns rows written."""
+    agents = Agent.objects.all()
+    links = AgentHierarchy.objects.all()
+    if tenant_id:
+        agents = agents.filter(tenant_id=tenant_id)
+        links = links.filter(tenant_id=tenant_id)
+    links.delete()
+
+    parents = dict(agents.values_list('id', 'parent_id'))
+    tenants = dict(agents.values_list('id', 'tenant_id'))
+    rows = []
+    for agent_id in parents:
+        current, depth, seen = agent_id, 0, set()
+        while current is not None and current not in seen:
+            seen.add(current)
+            rows.append(AgentHierarchy(
+                tenant_id=tenants[agent_id], ancestor_id=current,
+                descendant_id=agent_id, depth=depth,
+            ))
+            current, depth = parents.get(current), depth + 1
+    AgentHierarchy.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def validate_parent(agent, parent):
+    """Raise ValidationError if `parent` is not a valid parent for `agent`."""
+    if parent is None:
+        return
+    if agent.tenant_id and parent.tenant_id != agent.tenant_id:
+        raise ValidationError('Parent agent must belong to the same tenant.')
+    if would_create_cycle(agent, parent):
+        raise ValidationError('An agent cannot report to itself or to one of its subordinates.')
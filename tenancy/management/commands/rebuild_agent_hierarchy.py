@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the AgentHierarchy closure table from Agent.parent.\n'
+        'Run after agents or parents are changed with bulk_create/update (seed/populate, manual fixes).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant', type=int,
+            help='Only rebuild the hierarchy of this tenant id',
+        )
+
+    def handle(self, *args, **options):
+        from tenancy.hierarchy import rebuild_hierarchy
+
+        written = rebuild_hierarchy(tenant_id=options['tenant'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} agent hierarchy rows'))
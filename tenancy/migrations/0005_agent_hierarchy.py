@@ -0,0 +1,51 @@
+# Generated by Django 5.0.14 on 2026-10-18 00:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_hierarchy(apps, schema_editor):
+    Agent = apps.get_model('tenancy', 'Agent')
+    AgentHierarchy = apps.get_model('tenancy', 'AgentHierarchy')
+    parents = {}
+    tenants = {}
+    for agent_id, parent_id, tenant_id in Agent.objects.values_list('id', 'parent_id', 'tenant_id'):
+        parents[agent_id] = parent_id
+        tenants[agent_id] = tenant_id
+    rows = []
+    for agent_id in parents:
+        current, depth, seen = agent_id, 0, set()
+        while current is not None and current not in seen:
+            seen.add(current)
+            rows.append(AgentHierarchy(
+                tenant_id=tenants[agent_id], ancestor_id=current,
+                descendant_id=agent_id, depth=depth,
+            ))
+            current, depth = parents.get(current), depth + 1
+    AgentHierarchy.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenancy', '0004_seed_subscription_plans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentHierarchy',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('depth', models.IntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='tenancy.agent')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='tenancy.agent')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agent_hierarchy', to='tenancy.tenant')),
+            ],
+            options={
+                'db_table': 'agent_hierarchy',
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='agent_hiera_ancesto_09e17f_idx'), models.Index(fields=['descendant', 'depth'], name='agent_hiera_descend_6d06fa_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(backfill_hierarchy, migrations.RunPython.noop),
+    ]
@@ -107,6 +107,31 @@ class Agent(models.Model):
         return f"{self.agent_code or f'Agent #{self.id}'} - {self.tenant.code}"
 
 
+class AgentHierarchy(models.Model):
+    """
+    Closure table over Agent.parent: one row per (ancestor, descendant) pair,
+    including each agent's own depth-0 row, so a whole subtree is a single
+    indexed lookup. Maintained by tenancy.hierarchy; rebuild with
+    `manage.py rebuild_agent_hierarchy` after bulk parent updates.
+    """
+    id = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='agent_hierarchy')
+    ancestor = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.IntegerField()
+
+    class Meta:
+        db_table = 'agent_hierarchy'
+        unique_together = [['ancestor', 'descendant']]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth']),
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} → {self.descendant_id} (depth {self.depth})"
+
+
 class SubscriptionPlan(models.Model):
     id = models.BigAutoField(primary_key=True)
     name = models.CharField(max_length=100)
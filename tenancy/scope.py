@@ -0,0 +1,118 @@
+"""
+Per-user visibility scope (roles, own agent, visible agents) shared by the
+tenant-scoped viewsets.
+
+Resolving it takes three queries, so the result is memoised on the user
+object for the request and kept in the Django cache for SCOPE_CACHE_TTL
+seconds. Cache keys embed a per-tenant version that tenancy.signals bumps
+whenever a UserRole or Agent of the tenant changes.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+SCOPE_CACHE_TTL = 60
+
+# Roles that see every agent's records in their tenant
+TENANT_WIDE_ROLES = frozenset({'MANAGER', 'ADMIN', 'FINANCE'})
+
+
+class UserScope:
+    """
+    role_codes: frozenset of the user's role codes in their tenant.
+    agent_id: the user's own Agent id (lowest id if several), or None.
+    team_agent_ids: every agent below the user's agent records, at any depth.
+    visible_agent_ids: agents whose records the user may see; None means all.
+    """
+    __slots__ = ('role_codes', 'agent_id', 'team_agent_ids', 'visible_agent_ids')
+
+    def __init__(self, role_codes, agent_id, team_agent_ids, visible_agent_ids):
+        self.role_codes = frozenset(role_codes)
+        self.agent_id = agent_id
+        self.team_agent_ids = tuple(team_agent_ids)
+        self.visible_agent_ids = None if visible_agent_ids is None else tuple(visible_agent_ids)
+
+    @property
+    def sees_all(self):
+        return self.visible_agent_ids is None
+
+    def filter_queryset(self, qs, field='agent_id'):
+        """Restrict qs to the visible agents (no-op for tenant-wide roles)."""
+        if self.visible_agent_ids is None:
+            return qs
+        if not self.visible_agent_ids:
+            return qs.none()
+        return qs.filter(**{f'{field}__in': self.visible_agent_ids})
+
+    def __getstate__(self):
+        return (self.role_codes, self.agent_id, self.team_agent_ids, self.visible_agent_ids)
+
+    def __setstate__(self, state):
+        self.role_codes, self.agent_id, self.team_agent_ids, self.visible_agent_ids = state
+
+
+def _version_key(tenant_id):
+    return f'tenancy:scope-version:{tenant_id}'
+
+
+def _get_version(tenant_id):
+    key = _version_key(tenant_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user_scopes(tenant_id):
+    """
+    Force every user of the tenant to re-resolve their scope once the
+    current transaction commits, so no request re-caches the old roles
+    under the new version.
+    """
+    if tenant_id:
+        transaction.on_commit(lambda: cache.set(_version_key(tenant_id), time.time_ns(), None))
+
+
+def get_user_scope(user):
+    """Return the UserScope of an authenticated user with a tenant."""
+    version = _get_version(user.tenant_id)
+    memo = getattr(user, '_scope_memo', None)
+    if memo and memo[0] == version:
+        return memo[1]
+
+    key = f'tenancy:scope:{user.tenant_id}:{version}:{user.pk}'
+    scope = cache.get(key)
+    if scope is None:
+        scope = _resolve_scope(user)
+        cache.set(key, scope, SCOPE_CACHE_TTL)
+    user._scope_memo = (version, scope)
+    return scope
+
+
+def _resolve_scope(user):
+    from users.models import UserRole
+    from .models import Agent, AgentHierarchy
+
+    role_codes = set(
+        UserRole.objects.filter(user=user, tenant_id=user.tenant_id)
+        .values_list('role__code', flat=True)
+    )
+    own_ids = list(
+        Agent.objects.filter(user=user, tenant_id=user.tenant_id)
+        .order_by('id').values_list('id', flat=True)
+    )
+    team_ids = list(
+        AgentHierarchy.objects.filter(ancestor__user=user, tenant_id=user.tenant_id, depth__gte=1)
+        .order_by('descendant_id').values_list('descendant_id', flat=True).distinct()
+    )
+
+    if role_codes & TENANT_WIDE_ROLES:
+        visible = None
+    elif 'SUPERVISOR' in role_codes:
+        visible = team_ids + own_ids
+    else:
+        visible = own_ids[:1]
+
+    return UserScope(role_codes, own_ids[0] if own_ids else None, team_ids, visible)
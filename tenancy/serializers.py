@@ -63,13 +63,32 @@ class AgentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'tenant', 'created_at', 'updated_at']
 
     def get_role(self, obj):
-        if obj.subordinates.exists():
+        if self.get_subordinates_count(obj):
             return 'Supervisor'
         return 'Agent'
 
     def get_subordinates_count(self, obj):
+        # AgentViewSet annotates subordinates_count; count directly otherwise
+        if hasattr(obj, 'subordinates_count'):
+            return obj.subordinates_count
         return obj.subordinates.count()
 
+    def validate_parent(self, value):
+        from django.core.exceptions import ValidationError as DjangoValidationError
+        from .hierarchy import validate_parent
+
+        if value is None:
+            return value
+        agent = self.instance
+        if agent is None:
+            request = self.context.get('request')
+            agent = Agent(tenant_id=request.user.tenant_id if request else value.tenant_id)
+        try:
+            validate_parent(agent, value)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.messages)
+        return value
+
 
 class SubscriptionPlanSerializer(serializers.ModelSerializer):
     class Meta:
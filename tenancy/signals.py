@@ -0,0 +1,53 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from users.models import UserRole
+from .models import Agent
+from .scope import invalidate_user_scopes
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def invalidate_scopes_on_change(sender, instance, **kwargs):
+    """
+    Roles and agent hierarchy feed every user's scope in the tenant, and
+    with it the team-scoped analytics cached for them.
+    """
+    from analytics.cache import invalidate_tenant_cache
+
+    invalidate_user_scopes(instance.tenant_id)
+    invalidate_tenant_cache(instance.tenant_id)
+
+
+@receiver(pre_save, sender=Agent)
+def remember_previous_parent(sender, instance, raw=False, **kwargs):
+    """Record the stored parent so post_save can tell whether the agent moved."""
+    if raw or instance.pk is None:
+        instance._previous_parent_id = None
+        return
+    instance._previous_parent_id = (
+        Agent.objects.filter(pk=instance.pk).values_list('parent_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Agent)
+def maintain_agent_hierarchy(sender, instance, created, raw=False, **kwargs):
+    from .hierarchy import insert_agent, move_agent
+
+    if raw:
+        return
+    if created:
+        insert_agent(instance)
+        return
+    previous = getattr(instance, '_previous_parent_id', None)
+    if previous != instance.parent_id:
+        move_agent(instance, previous)
+
+
+@receiver(pre_delete, sender=Agent)
+def detach_agent_subtree(sender, instance, **kwargs):
+    from .hierarchy import detach_subordinates
+
+    detach_subordinates(instance)
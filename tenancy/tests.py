@@ -1,3 +1,182 @@
-from django.test import TestCase
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from rest_framework.test import APITestCase, APIClient
+
+from posightful.testing import TenantFixtureMixin
+from users.models import User
+from tenancy.models import Agent, AgentHierarchy
+from tenancy.hierarchy import subtree_ids
+from tenancy.scope import get_user_scope
+
+
+class AgentListTest(TenantFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        self.user = self._create_user("admin")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_role_and_subordinates_count(self):
+        supervisor = self._create_agent()
+        agent = self._create_agent(parent=supervisor)
+        self._create_agent(parent=supervisor)
+
+        response = self.client.get("/api/tenancy/agents/")
+        rows = {row["id"]: row for row in response.data["results"]}
+
+        self.assertEqual(rows[supervisor.id]["role"], "Supervisor")
+        self.assertEqual(rows[supervisor.id]["subordinates_count"], 2)
+        self.assertEqual(rows[agent.id]["role"], "Agent")
+        self.assertEqual(rows[agent.id]["subordinates_count"], 0)
+
+    def test_query_count_does_not_grow_with_agents(self):
+        supervisor = self._create_agent()
+        self._create_agent(parent=supervisor)
+        # Count and the annotated page
+        with self.assertNumQueries(2):
+            self.client.get("/api/tenancy/agents/")
+
+        for _ in range(20):
+            self._create_agent(parent=self._create_agent())
+        with self.assertNumQueries(2):
+            self.client.get("/api/tenancy/agents/")
+
+
+class UserScopeTest(TenantFixtureMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self._setup_tenant()
+        self.user = self._create_user("admin")
+        self.supervisor = self._create_agent()
+        self.member = self._create_agent(parent=self.supervisor)
+        self.outsider = self._create_agent()
+
+    def _fresh_user(self, agent):
+        return User.objects.get(pk=agent.user_id)
+
+    def test_supervisor_sees_team_and_self(self):
+        self._grant(self.supervisor.user, "SUPERVISOR")
+
+        scope = get_user_scope(self._fresh_user(self.supervisor))
+
+        self.assertEqual(scope.agent_id, self.supervisor.id)
+        self.assertEqual(scope.team_agent_ids, (self.member.id,))
+        self.assertEqual(set(scope.visible_agent_ids), {self.member.id, self.supervisor.id})
+
+    def test_agent_sees_only_self_and_manager_sees_all(self):
+        self._grant(self.member.user, "AGENT")
+        self._grant(self.user, "MANAGER")
+
+        self.assertEqual(get_user_scope(self._fresh_user(self.member)).visible_agent_ids, (self.member.id,))
+        self.assertTrue(get_user_scope(self.user).sees_all)
+
+    def test_scope_is_cached_across_requests(self):
+        self._grant(self.supervisor.user, "SUPERVISOR")
+        get_user_scope(self._fresh_user(self.supervisor))
+
+        with self.assertNumQueries(1):
+            # Only the user row itself; the scope comes from the cache
+            get_user_scope(self._fresh_user(self.supervisor))
+
+    def test_agent_change_invalidates_scope(self):
+        self._grant(self.supervisor.user, "SUPERVISOR")
+        user = self._fresh_user(self.supervisor)
+        get_user_scope(user)
+
+        self.outsider.parent = self.supervisor
+        with self.captureOnCommitCallbacks(execute=True):
+            self.outsider.save()
+
+        self.assertIn(self.outsider.id, get_user_scope(user).team_agent_ids)
+
+    def test_role_change_invalidates_scope(self):
+        user = self._fresh_user(self.member)
+        self.assertEqual(get_user_scope(user).visible_agent_ids, (self.member.id,))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._grant(user, "FINANCE")
+        self.assertTrue(get_user_scope(user).sees_all)
+
+    def test_invalidation_waits_for_commit(self):
+        user = self._fresh_user(self.member)
+        get_user_scope(user)
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self._grant(user, "FINANCE")
+
+        self.assertTrue(callbacks)
+        self.assertFalse(get_user_scope(self._fresh_user(self.member)).sees_all)
+
+
+class AgentHierarchyTest(TenantFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self._setup_tenant()
+        self.user = self._create_user("admin")
+        # root -> mid -> leaf, plus an unrelated agent
+        self.root = self._create_agent()
+        self.mid = self._create_agent(parent=self.root)
+        self.leaf = self._create_agent(parent=self.mid)
+        self.other = self._create_agent()
+
+    def _links(self):
+        return set(AgentHierarchy.objects.values_list("ancestor_id", "descendant_id", "depth"))
+
+    def _expected_from_parents(self):
+        links = set()
+        for agent in Agent.objects.all():
+            current, depth = agent, 0
+            while current is not None:
+                links.add((current.id, agent.id, depth))
+                current, depth = current.parent, depth + 1
+        return links
+
+    def test_create_links_every_ancestor(self):
+        self.assertEqual(sorted(subtree_ids(self.root.id)), sorted([self.root.id, self.mid.id, self.leaf.id]))
+        self.assertIn((self.root.id, self.leaf.id, 2), self._links())
+        self.assertEqual(self._links(), self._expected_from_parents())
+
+    def test_moving_an_agent_moves_its_subtree(self):
+        self.mid.parent = self.other
+        self.mid.save()
+        self.assertEqual(self._links(), self._expected_from_parents())
+        self.assertIn((self.other.id, self.leaf.id, 2), self._links())
+
+        self.mid.parent = None
+        self.mid.save()
+        self.assertEqual(self._links(), self._expected_from_parents())
+
+    def test_deleting_an_agent_detaches_subordinates(self):
+        self.mid.delete()
+        self.leaf.refresh_from_db()
+        self.assertIsNone(self.leaf.parent_id)
+        self.assertEqual(self._links(), self._expected_from_parents())
+
+    def test_rebuild_matches_incremental_maintenance(self):
+        expected = self._links()
+        AgentHierarchy.objects.all().delete()
+
+        out = StringIO()
+        call_command("rebuild_agent_hierarchy", "--tenant", str(self.tenant.id), stdout=out)
+
+        self.assertIn(f"Rebuilt {len(expected)} agent hierarchy rows", out.getvalue())
+        self.assertEqual(self._links(), expected)
+
+    def test_api_rejects_cycles(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.patch(f"/api/tenancy/agents/{self.root.id}/", {"parent": self.leaf.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("parent", response.data)
+
+    def test_supervisor_scope_covers_whole_subtree(self):
+        cache.clear()
+        self._grant(self.root.user, "SUPERVISOR")
+
+        scope = get_user_scope(User.objects.get(pk=self.root.user_id))
+
+        self.assertEqual(set(scope.team_agent_ids), {self.mid.id, self.leaf.id})
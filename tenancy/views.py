@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db import transaction
+from django.db.models import Count
 from django.utils import timezone
 from django.utils.text import slugify
 from datetime import timedelta
@@ -97,7 +98,7 @@ class AgentViewSet(TenantScopedViewSet):
     def get_queryset(self):
         return Agent.objects.select_related(
             'tenant', 'user', 'parent', 'parent__user', 'region', 'city'
-        ).prefetch_related('subordinates').all()
+        ).annotate(subordinates_count=Count('subordinates'))
 
 
 @api_view(['GET'])
@@ -447,6 +447,10 @@ class Command(BaseCommand):
 
         self.stdout.write(f'  Created {kpi_count} KPI daily records')
 
+        from analytics.services import rebuild_kpi_rollups
+        rollup_count = rebuild_kpi_rollups(tenant_id=tenant.id)
+        self.stdout.write(f'  Rebuilt {rollup_count} KPI rollup records')
+
         self.stdout.write(self.style.SUCCESS(
             '\nSeed data created successfully!\n'
             'Login credentials (all passwords: Pass1234!):\n'
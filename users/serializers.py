@@ -103,36 +103,39 @@ class UserManagementSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at']
 
+    # The getters below only read obj.user_roles / obj.agent_profile through
+    # .all(), so UserViewSet's Prefetch objects serve them without queries.
+
+    def _user_roles(self, obj):
+        return sorted(obj.user_roles.all(), key=lambda ur: ur.pk)
+
+    def _agent(self, obj):
+        agents = sorted(obj.agent_profile.all(), key=lambda a: a.pk)
+        return agents[0] if agents else None
+
     def get_roles(self, obj):
-        user_roles = obj.user_roles.select_related('role').all()
-        return RoleSerializer([ur.role for ur in user_roles], many=True).data
+        return RoleSerializer([ur.role for ur in self._user_roles(obj)], many=True).data
 
     def get_role(self, obj):
-        ur = obj.user_roles.select_related('role').first()
-        return ur.role.code.lower() if ur else 'agent'
+        user_roles = self._user_roles(obj)
+        return user_roles[0].role.code.lower() if user_roles else 'agent'
 
     def get_region(self, obj):
-        agent = getattr(obj, 'agent_profile', None)
-        if agent:
-            a = agent.select_related('region').first()
-            if a and a.region:
-                return a.region.name
+        a = self._agent(obj)
+        if a and a.region:
+            return a.region.name
         return ''
 
     def get_supervisor(self, obj):
-        agent = getattr(obj, 'agent_profile', None)
-        if agent:
-            a = agent.select_related('parent__user').first()
-            if a and a.parent and a.parent.user:
-                return a.parent.user.full_name or ''
+        a = self._agent(obj)
+        if a and a.parent and a.parent.user:
+            return a.parent.user.full_name or ''
         return ''
 
     def get_agentCode(self, obj):
-        agent = getattr(obj, 'agent_profile', None)
-        if agent:
-            a = agent.first()
-            if a:
-                return a.agent_code or ''
+        a = self._agent(obj)
+        if a:
+            return a.agent_code or ''
         return ''
 
 
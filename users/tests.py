@@ -1,3 +1,109 @@
-from django.test import TestCase
+from rest_framework.test import APITestCase, APIClient
 
-# Create your tests here.
+from users.models import User, Role, UserRole
+from tenancy.models import Tenant, Region, City, Agent
+
+
+class UserManagementListTest(APITestCase):
+
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="User Co", code="USER01")
+        self.region = Region.objects.create(tenant=self.tenant, name="Samarkand")
+        self.city = City.objects.create(tenant=self.tenant, region=self.region, name="Samarkand City")
+        self.roles = {
+            code: Role.objects.get_or_create(code=code, defaults={"name": code.title()})[0]
+            for code in ("ADMIN", "SUPERVISOR", "AGENT")
+        }
+        self.seq = 0
+        self.admin = self._create_user("ADMIN")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def _create_user(self, role_code, parent=None):
+        self.seq += 1
+        user = User.objects.create_user(
+            username=f"user{self.seq}", email=f"user{self.seq}@test.com",
+            phone_number=f"+99891{self.seq:07d}", password="testpass123",
+            tenant=self.tenant, full_name=f"User {self.seq}",
+        )
+        UserRole.objects.create(tenant=self.tenant, user=user, role=self.roles[role_code])
+        if role_code != "ADMIN":
+            Agent.objects.create(
+                tenant=self.tenant, user=user, agent_code=f"UA{self.seq:03d}", parent=parent,
+                region=self.region, city=self.city, status="active",
+            )
+        return user
+
+    def test_agent_profile_fields(self):
+        supervisor = self._create_user("SUPERVISOR")
+        agent = self._create_user("AGENT", parent=supervisor.agent_profile.get())
+
+        response = self.client.get("/auth/users/")
+        rows = {row["id"]: row for row in response.data["results"]}
+
+        self.assertEqual(rows[agent.id]["role"], "agent")
+        self.assertEqual(rows[agent.id]["roles"][0]["code"], "AGENT")
+        self.assertEqual(rows[agent.id]["region"], "Samarkand")
+        self.assertEqual(rows[agent.id]["supervisor"], supervisor.full_name)
+        self.assertEqual(rows[agent.id]["agentCode"], "UA003")
+        self.assertEqual(rows[self.admin.id]["role"], "admin")
+        self.assertEqual(rows[self.admin.id]["agentCode"], "")
+
+    def test_query_count_does_not_grow_with_users(self):
+        supervisor = self._create_user("SUPERVISOR")
+        # Count, users page, user_roles prefetch, agent_profile prefetch
+        with self.assertNumQueries(4):
+            self.client.get("/auth/users/")
+
+        for _ in range(15):
+            self._create_user("AGENT", parent=supervisor.agent_profile.get())
+        with self.assertNumQueries(4):
+            self.client.get("/auth/users/")
+
+
+class AccountantDataTest(APITestCase):
+
+    def setUp(self):
+        from decimal import Decimal
+        from django.utils import timezone
+        from tenancy.models import Customer, Product
+        from conversions.models import Sale
+        from bonuses.engine import invalidate_rule_cache
+        from bonuses.models import BonusRule
+
+        invalidate_rule_cache()
+        self.tenant = Tenant.objects.create(name="Ledger Co", code="LEDGER01")
+        region = Region.objects.create(tenant=self.tenant, name="Bukhara")
+        city = City.objects.create(tenant=self.tenant, region=region, name="Bukhara City")
+        self.user = User.objects.create_user(
+            username="accountant", email="accountant@test.com", phone_number="+998930000001",
+            password="testpass123", tenant=self.tenant, full_name="Accountant",
+        )
+        agent = Agent.objects.create(
+            tenant=self.tenant, user=self.user, agent_code="AC001",
+            region=region, city=city, status="active",
+        )
+        customer = Customer.objects.create(tenant=self.tenant, full_name="Customer")
+        product = Product.objects.create(tenant=self.tenant, code="POS-TERM", name="POS Terminal")
+        BonusRule.objects.create(
+            tenant=self.tenant, name="Big ticket", rule_dimension="SELL_AMOUNT", operator="GT",
+            num_from=Decimal("5000"), amount_type="percent_of_sale", amount_value=Decimal("5"),
+            cap_amount=Decimal("400"),
+        )
+        sale_kwargs = {
+            "tenant": self.tenant, "agent": agent, "customer": customer,
+            "product": product, "status": "completed", "sold_at": timezone.now(),
+        }
+        Sale.objects.create(amount=Decimal("10000"), **sale_kwargs)  # ledger via signal
+        Sale.objects.bulk_create([Sale(amount=Decimal("1000"), **sale_kwargs)])  # no ledger
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_audit_trail_matches_bonus_engine(self):
+        response = self.client.get("/auth/accountant-data/")
+        rows = {row["saleAmount"]: row for row in response.data["auditTrail"]}
+
+        self.assertEqual(rows[10000.0]["ruleName"], "Big ticket")
+        self.assertEqual(rows[10000.0]["bonusAmount"], 400.0)
+        self.assertEqual(rows[1000.0]["ruleName"], "Default (10%)")
+        self.assertEqual(rows[1000.0]["bonusAmount"], 100.0)
@@ -4,7 +4,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import update_session_auth_hash
-from django.db.models import Count
+from django.db.models import Count, Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -135,7 +135,11 @@ class UserViewSet(viewsets.ModelViewSet):
     ordering_fields = ['full_name', 'created_at']
 
     def get_queryset(self):
-        qs = User.objects.prefetch_related('user_roles__role').all()
+        from tenancy.models import Agent
+        qs = User.objects.prefetch_related(
+            Prefetch('user_roles', queryset=UserRole.objects.select_related('role').order_by('id')),
+            Prefetch('agent_profile', queryset=Agent.objects.select_related('region', 'parent__user').order_by('id')),
+        )
         user = self.request.user
         if user.tenant_id:
             qs = qs.filter(tenant=user.tenant)
@@ -253,7 +257,7 @@ def accountant_data_view(request):
     from analytics.models import KPIAgentDaily
     from conversions.models import Sale
     from tenancy.models import Agent
-    from bonuses.models import BonusRule
+    from bonuses.services import sale_bonuses
     from django.db.models import Sum
     from django.utils import timezone
     import datetime
@@ -284,35 +288,15 @@ def accountant_data_view(request):
             'bonusAmount': float(row['bonusAmount'] or 0),
         })
 
-    # Audit trail: recent sales with bonus info
+    # Audit trail: recent sales with their recorded (or evaluated) bonus
     recent_sales = Sale.objects.filter(
         tenant=tenant
     ).select_related(
-        'agent', 'agent__user', 'customer', 'product', 'lead'
+        'agent', 'agent__user', 'customer', 'product', 'lead', 'bonus_ledger__rule'
     ).order_by('-sold_at')[:20]
 
-    rules = list(BonusRule.objects.filter(tenant=tenant, is_active=True).order_by('id'))
-
     audit_trail = []
-    for sale in recent_sales:
-        matched_rule = rules[0] if rules else None
-        for r in rules:
-            if r.rule_dimension == 'SELL_AMOUNT' and sale.amount >= (r.num_from or 0):
-                matched_rule = r
-                break
-
-        rule_name = matched_rule.name if matched_rule else 'N/A'
-        rule_type = matched_rule.amount_type if matched_rule else 'N/A'
-        if matched_rule and matched_rule.amount_type == 'percent_of_sale':
-            bonus = float(sale.amount) * float(matched_rule.amount_value or 0) / 100
-            formula = f'{sale.amount} x {matched_rule.amount_value}%'
-        elif matched_rule and matched_rule.amount_type == 'fixed':
-            bonus = float(matched_rule.amount_value or 0)
-            formula = f'Fixed ${matched_rule.amount_value}'
-        else:
-            bonus = 0
-            formula = 'N/A'
-
+    for sale, rule, bonus, formula in sale_bonuses(recent_sales):
         audit_trail.append({
             'agentName': sale.agent.user.full_name if sale.agent and sale.agent.user else 'Unknown',
             'agentCode': sale.agent.agent_code if sale.agent else '',
@@ -320,9 +304,9 @@ def accountant_data_view(request):
             'customerName': sale.customer.full_name if sale.customer else 'Unknown',
             'saleDate': sale.sold_at.strftime('%Y-%m-%d'),
             'saleAmount': float(sale.amount),
-            'ruleName': rule_name,
-            'ruleType': rule_type,
-            'bonusAmount': bonus,
+            'ruleName': rule.name if rule else 'Default (10%)',
+            'ruleType': rule.amount_type if rule else 'percent_of_sale',
+            'bonusAmount': float(bonus),
             'formula': formula,
         })
 